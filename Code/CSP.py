@@ -1,7 +1,13 @@
+import argparse
 import json
 import os
-import sc2reader
-from openai import OpenAI
+import llm_clients
+import pipeline
+import replay_cache
+import replay_pool
+import response_cache
+import results_store
+import tracing
 
 # Configuration
 MODELS_CONFIG = [
@@ -13,39 +19,48 @@ MODELS_CONFIG = [
         "temperature": 0
     }
 ]
+PARSE_PROFILE = "units"
+
+
+def battle_events_from_replay(replay):
+    players = [p for p in replay.players if p.is_human]
+    if len(players) < 2:
+        print("Warning: Insufficient player data found")
+        return None
+
+    p1, p2 = players[0], players[1]
+    print(f"Player 1: {p1.name}, Player 2: {p2.name}")
+
+    death_events = []
+    death_count = 0
+    for event in replay.tracker_events:
+        if event.name == "UnitDiedEvent":
+            death_count += 1
+            death_events.append({
+                "event_type": "death",
+                "second": int(event.second),
+                "dead_unit": event.unit.name if event.unit else "Unknown Unit",
+                "killer_unit": event.killing_unit.name if event.killing_unit else None,
+                "killer_player": event.killer.name if event.killer else None,
+                "x": event.x,
+                "y": event.y,
+                "data_basis": f"Unit death event: {event.unit.name if event.unit else 'Unknown Unit'}"
+            })
+
+    death_events.sort(key=lambda x: x["second"])
+    return death_events
 
 
 def extract_battle_events_from_replay(replay_path):
     try:
-        replay = sc2reader.load_replay(replay_path)
+        replay = replay_cache.load_replay(replay_path, profile=PARSE_PROFILE)
         print(f"Successfully loaded replay file: {os.path.basename(replay_path)}")
 
-        players = [p for p in replay.players if p.is_human]
-        if len(players) < 2:
-            print("Warning: Insufficient player data found")
+        with tracing.span("extract", replay=os.path.basename(replay_path)):
+            death_events = battle_events_from_replay(replay)
+        if death_events is None:
             return []
 
-        p1, p2 = players[0], players[1]
-        print(f"Player 1: {p1.name}, Player 2: {p2.name}")
-
-        death_events = []
-        death_count = 0
-        for event in replay.tracker_events:
-            if event.name == "UnitDiedEvent":
-                death_count += 1
-                death_events.append({
-                    "event_type": "death",
-                    "second": int(event.second),
-                    "dead_unit": event.unit.name if event.unit else "Unknown Unit",
-                    "killer_unit": event.killing_unit.name if event.killing_unit else None,
-                    "killer_player": event.killer.name if event.killer else None,
-                    "x": event.x,
-                    "y": event.y,
-                    "data_basis": f"Unit death event: {event.unit.name if event.unit else 'Unknown Unit'}"
-                })
-
-        death_events.sort(key=lambda x: x["second"])
-
         # Save raw extraction for debugging
         debug_filename = f"extracted_events_{os.path.basename(replay_path).replace('.SC2Replay', '')}.json"
         with open(debug_filename, "w", encoding="utf-8") as f:
@@ -67,60 +82,73 @@ def call_llm_for_csp(events_data, model_config):
         "Tactical Lifecycle: The full duration including pre-conflict maneuvering and post-conflict disengagement."
     )
 
+    with tracing.span("prompt"):
+        events_json = json.dumps(events_data[:500])
+
     # PAPER PROMPT ALIGNMENT: CSP User Prompt Structure
     user_prompt = f"""
 Input Data: A sequence of unit death events from a StarCraft II match.
-Data: {json.dumps(events_data[:500])} ... (truncated for context limit if necessary)
+Data: {events_json} ... (truncated for context limit if necessary)
 
 Task: Group these atomic events into distinct Conflict Episodes.
 Format: start: [s], end: [s], region: [Coords], intensity: [Level]
 Output Requirement: Return a JSON object with a key 'conflicts' containing a list of objects.
 """
 
-    client = OpenAI(
-        api_key=model_config['api_key'],
-        base_url=model_config['base_url']
-    )
+    client = llm_clients.get_client(model_config)
 
     try:
-        response = client.chat.completions.create(
-            model=model_config['model_id'],
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=model_config['temperature']
+        return response_cache.chat_completion(
+            client, model_config['model_id'], system_prompt, user_prompt, model_config['temperature']
         )
-        return response.choices[0].message.content
     except Exception as e:
         print(f"API Error: {e}")
         return None
 
 
-def main():
-    REPLAY_FOLDER = "replays"
-    if not os.path.exists(REPLAY_FOLDER):
-        print(f"Folder {REPLAY_FOLDER} not found.")
-        return
-
-    replay_files = [f for f in os.listdir(REPLAY_FOLDER) if f.endswith(".SC2Replay")]
-
-    for replay_file in replay_files:
-        path = os.path.join(REPLAY_FOLDER, replay_file)
-        events = extract_battle_events_from_replay(path)
+def process_replay(path, events):
+    replay_file = os.path.basename(path)
 
-        if not events: continue
+    if not events: return
 
-        for config in MODELS_CONFIG:
-            print(f"Running CSP analysis with {config['name']}...")
+    for config in MODELS_CONFIG:
+        print(f"Running CSP analysis with {config['name']}...")
+        with tracing.tags(replay=replay_file, model=config['name']):
             result_text = call_llm_for_csp(events, config)
 
             if result_text:
                 output_name = f"csp_{config['name']}_{replay_file}.json"
-                with open(output_name, "w") as f:
+                with tracing.span("write"), open(output_name, "w") as f:
                     f.write(result_text)
+                results_store.record("CSP", config['name'], replay_file, result_text, output_name)
                 print(f"Saved to {output_name}")
 
 
+def main():
+    parser = argparse.ArgumentParser(description="CSP: conflict segmentation benchmark")
+    replay_pool.add_pool_arguments(parser)
+    pipeline.add_pipeline_arguments(parser)
+    args = parser.parse_args()
+
+    REPLAY_FOLDER = "replays"
+    if not os.path.exists(REPLAY_FOLDER):
+        print(f"Folder {REPLAY_FOLDER} not found.")
+        return
+
+    replay_files = [f for f in os.listdir(REPLAY_FOLDER) if f.endswith(".SC2Replay")]
+
+    replay_paths = [os.path.join(REPLAY_FOLDER, f) for f in replay_files]
+    if args.pipeline:
+        pipeline.run(replay_paths, extract_battle_events_from_replay, process_replay, args.workers,
+                     args.queue_depth, args.max_tasks_per_child)
+    else:
+        parsed = replay_pool.iter_parsed(replay_paths, extract_battle_events_from_replay, args.workers, args.max_tasks_per_child)
+        for path, events in parsed:
+            process_replay(path, events)
+
+    llm_clients.print_connection_stats()
+    llm_clients.close_all()
+
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,10 +1,22 @@
+import argparse
+import asyncio
+import math
 import os
 import sys
 import json
 import re
 import time
-from openai import OpenAI
-import sc2reader
+import weakref
+import numpy as np
+import llm_clients
+import pipeline
+import replay_cache
+import replay_pool
+import response_cache
+import result_log
+import results_store
+import tracing
+from player_stats import PlayerStatsStore
 
 MODELS_CONFIG = [
     {
@@ -45,35 +57,110 @@ UNIT_COSTS = {
 }
 
 
-def call_llm_api(config, prompt, count):
+# PAPER PROMPT ALIGNMENT: DWE System Prompt
+SYSTEM_PROMPT = (
+    "Role: StarCraft II Real-time Momentum Analyst.\n"
+    "Task: Generate a continuous win-probability curve based on material causality.\n"
+    "Definitions: Material Reality: Evaluating 17 features including resource loss ratios and combat efficiency. "
+    "Predictive Asymptote: Mathematical convergence towards 1.0 or 0.0 as duration increases.\n"
+    "Format Requirement: You must output ONLY a raw JSON Array of floats."
+)
+
+# Batches are packed by estimated tokens rather than game time. Any model entry in MODELS_CONFIG
+# may override the budgets with "max_prompt_tokens", "max_completion_tokens" and
+# "tokens_per_minute" (requests are then paced to stay under that rate).
+PROMPT_TOKEN_BUDGET = 4000
+COMPLETION_TOKEN_BUDGET = 1024
+# Local estimate, no tokenizer needed: state lines are digit-heavy, which BPE tokenizers split
+# finer than prose, so this errs towards more tokens than the provider will count.
+CHARS_PER_TOKEN = 3.0
+COMPLETION_TOKENS_PER_ITEM = 6
+COMPLETION_TOKEN_OVERHEAD = 16
+# Send every batch of a replay (and of every replay parsed meanwhile) concurrently instead of
+# one request at a time. Each model entry may set its own cap with "max_in_flight".
+ASYNC_BATCHES = False
+MAX_IN_FLIGHT_REQUESTS = 8
+# Timestamps a response leaves out (or answers with something other than a number) are asked
+# again on their own, up to this many times; whatever is still missing is padded with 0.5 and
+# flagged "padded" in the output.
+MAX_BATCH_RETRIES = 2
+PAD_WIN_RATE = 0.5
+
+# Event loop -> {model name: semaphore}. Held weakly, so a finished loop takes its semaphores with it.
+_semaphores = weakref.WeakKeyDictionary()
+
+
+def estimate_tokens(text):
+    return int(math.ceil(len(text) / CHARS_PER_TOKEN))
+
+
+def completion_tokens(count):
+    return COMPLETION_TOKEN_OVERHEAD + COMPLETION_TOKENS_PER_ITEM * count
+
+
+def request_tokens(prompt, count):
+    return estimate_tokens(SYSTEM_PROMPT) + estimate_tokens(prompt) + completion_tokens(count)
+
+
+def model_semaphore(config):
+    # One cap per model, shared by every replay in flight on the running event loop.
+    semaphores = _semaphores.setdefault(asyncio.get_running_loop(), {})
+    if config['name'] not in semaphores:
+        semaphores[config['name']] = asyncio.Semaphore(config.get('max_in_flight', MAX_IN_FLIGHT_REQUESTS))
+    return semaphores[config['name']]
+
+
+def call_llm_api(config, prompt, count, log=None, key=None, attempt=0):
+    # With a result log, a batch answered in an earlier (interrupted) run is re-parsed from the log.
+    # Returns count values, None where the answer is missing (all of them when the request fails).
+    # Each retry attempt has its own response-cache slot, so a cached bad answer is not replayed.
     model_friendly_name = config['name']
     try:
-        client = OpenAI(
-            base_url=config['base_url'],
-            api_key=config['api_key']
-        )
+        client = llm_clients.get_client(config)
         print(f"     ... [{model_friendly_name}] Requesting ({count} data points) ...")
 
-        # PAPER PROMPT ALIGNMENT: DWE System Prompt
-        system_prompt = (
-            "Role: StarCraft II Real-time Momentum Analyst.\n"
-            "Task: Generate a continuous win-probability curve based on material causality.\n"
-            "Definitions: Material Reality: Evaluating 17 features including resource loss ratios and combat efficiency. "
-            "Predictive Asymptote: Mathematical convergence towards 1.0 or 0.0 as duration increases.\n"
-            "Format Requirement: You must output ONLY a raw JSON Array of floats."
-        )
-
-        response = client.chat.completions.create(
-            model=config['model_id'],
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": prompt}
-            ],
-            stream=False,
-            temperature=0.1,
-        )
-
-        content = response.choices[0].message.content.strip()
+        content = log.get(key) if log is not None else None
+        if content is None:
+            limiter = llm_clients.rate_limiter(config)
+            if limiter is not None:
+                limiter.acquire(request_tokens(prompt, count))
+            content = response_cache.chat_completion(
+                client, config['model_id'], SYSTEM_PROMPT, prompt, 0.1, sample=attempt, stream=False
+            ).strip()
+            if log is not None:
+                log.append(key, content)
+        return parse_win_rates(content, count, model_friendly_name)
+
+    except Exception as e:
+        print(f"     [API Error] {model_friendly_name} failed: {e}")
+        return [None] * count
+
+
+async def call_llm_api_async(config, prompt, count, semaphore, log=None, key=None, attempt=0):
+    model_friendly_name = config['name']
+    try:
+        content = log.get(key) if log is not None else None
+        if content is None:
+            client = llm_clients.get_async_client(config)
+            async with semaphore:
+                print(f"     ... [{model_friendly_name}] Requesting ({count} data points) ...")
+                limiter = llm_clients.rate_limiter(config)
+                if limiter is not None:
+                    await limiter.acquire_async(request_tokens(prompt, count))
+                content = (await response_cache.chat_completion_async(
+                    client, config['model_id'], SYSTEM_PROMPT, prompt, 0.1, sample=attempt, stream=False
+                )).strip()
+            if log is not None:
+                log.append(key, content)
+        return parse_win_rates(content, count, model_friendly_name)
+
+    except Exception as e:
+        print(f"     [API Error] {model_friendly_name} failed: {e}")
+        return [None] * count
+
+
+def parse_win_rates(content, count, model_friendly_name):
+    with tracing.span("parse"):
         content_clean = content.replace("```json", "").replace("```", "").strip()
 
         if "</think>" in content_clean:
@@ -89,27 +176,31 @@ def call_llm_api(config, prompt, count):
         except json.JSONDecodeError:
             nums = re.findall(r"\b0\.\d+\b|\b1\.0\b|\b0\b", content_clean)
             predictions = [float(n) for n in nums]
+        if not isinstance(predictions, list):
+            predictions = []
 
-        if len(predictions) < count:
-            print(f"     [Warning] {model_friendly_name} returned insufficient data, padding with 0.5")
-            predictions.extend([0.5] * (count - len(predictions)))
+    predictions = [p if is_win_rate(p) else None for p in predictions[:count]]
+    predictions.extend([None] * (count - len(predictions)))
+    missing = predictions.count(None)
+    if missing:
+        print(f"     [Warning] {model_friendly_name} left {missing} of {count} data points unanswered")
+    return predictions
 
-        return predictions[:count]
 
-    except Exception as e:
-        print(f"     [API Error] {model_friendly_name} failed: {e}")
-        return [0.5] * count
+def is_win_rate(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
 
 
-def get_batch_win_rates(batch_states, p1_name, p2_name, config):
-    data_lines = []
-    for state in batch_states:
-        line = (
-            f"[T={state['time']}s] "
-            f"P1({p1_name}):Eco({state['p1']['min_rate']}/{state['p1']['gas_rate']}),Army({state['p1']['army_value']}),KD({state['p1']['army_killed_val']}/{state['p1']['army_lost_val']}) | "
-            f"P2({p2_name}):Eco({state['p2']['min_rate']}/{state['p2']['gas_rate']}),Army({state['p2']['army_value']}),KD({state['p2']['army_killed_val']}/{state['p2']['army_lost_val']})"
-        )
-        data_lines.append(line)
+def format_state_line(state, p1_name, p2_name):
+    return (
+        f"[T={state['time']}s] "
+        f"P1({p1_name}):Eco({state['p1']['min_rate']}/{state['p1']['gas_rate']}),Army({state['p1']['army_value']}),KD({state['p1']['army_killed_val']}/{state['p1']['army_lost_val']}) | "
+        f"P2({p2_name}):Eco({state['p2']['min_rate']}/{state['p2']['gas_rate']}),Army({state['p2']['army_value']}),KD({state['p2']['army_killed_val']}/{state['p2']['army_lost_val']})"
+    )
+
+
+def build_batch_prompt(batch_states, p1_name, p2_name):
+    data_lines = [format_state_line(state, p1_name, p2_name) for state in batch_states]
 
     data_block = "\n".join(data_lines)
     count = len(batch_states)
@@ -122,91 +213,345 @@ Task: Output a raw JSON Array of floats representing Player 1's win probability
 Format: time: [s], win.prob: [0-1], primary driver: [Feature]
 Constraint: For this batch interface, return ONLY the probability floats in a JSON array.
 """
-    return call_llm_api(config, prompt, count)
-
-
-def extract_replay_data(replay_path):
+    return prompt
+
+
+def plan_batches(full_timeline, p1_name, p2_name, config):
+    # Greedy packing in time order: a batch is closed when one more state would push the estimated
+    # prompt or completion past the model's budget, or the whole request past its per-minute limit.
+    prompt_budget = config.get('max_prompt_tokens', PROMPT_TOKEN_BUDGET)
+    completion_budget = config.get('max_completion_tokens', COMPLETION_TOKEN_BUDGET)
+    tokens_per_minute = config.get('tokens_per_minute')
+    base_tokens = estimate_tokens(SYSTEM_PROMPT) + estimate_tokens(build_batch_prompt([], p1_name, p2_name))
+
+    def fits(prompt_tokens, count):
+        if prompt_tokens > prompt_budget or completion_tokens(count) > completion_budget:
+            return False
+        return not tokens_per_minute or prompt_tokens + completion_tokens(count) <= tokens_per_minute
+
+    batches, batch, prompt_tokens = [], [], base_tokens
+    for state in full_timeline:
+        line_tokens = estimate_tokens(format_state_line(state, p1_name, p2_name)) + 1
+        if batch and not fits(prompt_tokens + line_tokens, len(batch) + 1):
+            batches.append(batch)
+            batch, prompt_tokens = [], base_tokens
+        batch.append(state)
+        prompt_tokens += line_tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def batch_request(batch_states, p1_name, p2_name, attempt=0):
+    with tracing.span("prompt"):
+        prompt = build_batch_prompt(batch_states, p1_name, p2_name)
+    key = [batch_states[0]['time'], len(batch_states), result_log.prompt_digest(prompt)]
+    if attempt:
+        key.append(attempt)
+    return prompt, key
+
+
+def merge_answers(win_rates, missing, answers, model_name, attempt):
+    # Fills the answered positions and returns the ones a retry still has to ask for.
+    for i, value in zip(missing, answers):
+        win_rates[i] = value
+    missing = [i for i in missing if win_rates[i] is None]
+    if missing and attempt < MAX_BATCH_RETRIES:
+        print(f"     [Retry] {model_name}: re-requesting {len(missing)} missing data points")
+    return missing
+
+
+def pad_missing(win_rates, model_name):
+    padded = [value is None for value in win_rates]
+    if any(padded):
+        print(f"     [Warning] {model_name}: {sum(padded)} data points still missing, padded with {PAD_WIN_RATE}")
+    return [PAD_WIN_RATE if flag else value for value, flag in zip(win_rates, padded)], padded
+
+
+def get_batch_win_rates(batch_states, p1_name, p2_name, config, log=None):
+    # Returns the win rates and, per state, whether it had to be padded.
+    win_rates, missing = [None] * len(batch_states), list(range(len(batch_states)))
+    for attempt in range(MAX_BATCH_RETRIES + 1):
+        prompt, key = batch_request([batch_states[i] for i in missing], p1_name, p2_name, attempt)
+        answers = call_llm_api(config, prompt, len(missing), log, key, attempt)
+        missing = merge_answers(win_rates, missing, answers, config['name'], attempt)
+        if not missing:
+            break
+    return pad_missing(win_rates, config['name'])
+
+
+async def get_batch_win_rates_async(batch_states, p1_name, p2_name, config, semaphore, log=None):
+    win_rates, missing = [None] * len(batch_states), list(range(len(batch_states)))
+    for attempt in range(MAX_BATCH_RETRIES + 1):
+        prompt, key = batch_request([batch_states[i] for i in missing], p1_name, p2_name, attempt)
+        answers = await call_llm_api_async(config, prompt, len(missing), semaphore, log, key, attempt)
+        missing = merge_answers(win_rates, missing, answers, config['name'], attempt)
+        if not missing:
+            break
+    return pad_missing(win_rates, config['name'])
+
+
+VALUE_TRACKS = ('army_value', 'army_killed_val', 'army_lost_val', 'eco_killed_val', 'eco_lost_val')
+TIMELINE_STEP_SECONDS = 7
+# Value tracks only need raw tracker fields, so no unit objects or plugins are built.
+PARSE_PROFILE = "tracker-only"
+
+
+def unit_value(u_name):
+    return UNIT_COSTS[u_name]['m'] + UNIT_COSTS[u_name]['g'] * 1.5
+
+
+def build_value_tracks(tracker_events, pids):
+    born_id, born_frame, born_pid, born_val, born_worker = [], [], [], [], []
+    died_id, died_frame, died_sec, died_killer = [], [], [], []
+    for event in tracker_events:
+        if event.name in ('UnitBornEvent', 'UnitInitEvent'):
+            u_name = getattr(event, 'unit_type_name', '')
+            if event.control_pid in pids and u_name in UNIT_COSTS:
+                born_id.append(event.unit_id)
+                born_frame.append(event.frame)
+                born_pid.append(event.control_pid)
+                born_val.append(unit_value(u_name))
+                born_worker.append(u_name in WORKER_NAMES)
+        elif event.name == 'UnitDiedEvent':
+            died_id.append(event.unit_id)
+            died_frame.append(event.frame)
+            died_sec.append(event.second)
+            died_killer.append(getattr(event, 'killing_player_id', None) or -1)
+
+    born_id, born_frame, born_pid = np.array(born_id, dtype=np.int64), np.array(born_frame, dtype=np.int64), np.array(born_pid, dtype=np.int64)
+    born_val, born_worker = np.array(born_val, dtype=np.float64), np.array(born_worker, dtype=bool)
+    born_sec = born_frame >> 4
+    died_id, died_frame = np.array(died_id, dtype=np.int64), np.array(died_frame, dtype=np.int64)
+    died_sec, died_killer = np.array(died_sec, dtype=np.int64), np.array(died_killer, dtype=np.int64)
+
+    # Match every death to the latest birth of the same unit id; unmatched deaths are not priced.
+    order = np.argsort(born_id, kind='stable')
+    sorted_ids = born_id[order]
+    pos = np.maximum(np.searchsorted(sorted_ids, died_id, side='right') - 1, 0)
+    if len(order):
+        birth = order[pos]
+        matched = (sorted_ids[pos] == died_id) & (born_frame[birth] <= died_frame)
+    else:
+        birth, matched = pos, np.zeros(len(died_id), dtype=bool)
+    birth = birth[matched]
+    d_sec, d_killer = died_sec[matched], died_killer[matched]
+    d_pid, d_val, d_worker = born_pid[birth], born_val[birth], born_worker[birth]
+    by_enemy = (d_killer != d_pid)
+
+    tracks = {}
+    for pid in pids:
+        army_born = (born_pid == pid) & ~born_worker
+        army_died = (d_pid == pid) & ~d_worker
+        eco_died = (d_pid == pid) & d_worker
+        killed_army = (d_killer == pid) & by_enemy & ~d_worker
+        killed_eco = (d_killer == pid) & by_enemy & d_worker
+        deltas = {
+            'army_value': (np.concatenate([born_sec[army_born], d_sec[army_died]]),
+                           np.concatenate([born_val[army_born], -d_val[army_died]])),
+            'army_killed_val': (d_sec[killed_army], d_val[killed_army]),
+            'army_lost_val': (d_sec[army_died], d_val[army_died]),
+            'eco_killed_val': (d_sec[killed_eco], d_val[killed_eco]),
+            'eco_lost_val': (d_sec[eco_died], d_val[eco_died]),
+        }
+        tracks[pid] = {}
+        for name, (secs, vals) in deltas.items():
+            ordering = np.argsort(secs, kind='stable')
+            tracks[pid][name] = (secs[ordering], np.cumsum(vals[ordering]))
+    return tracks
+
+
+def sample_value_tracks(tracks, pid, seconds):
+    sampled = {}
+    for name in VALUE_TRACKS:
+        secs, totals = tracks[pid][name]
+        idx = np.searchsorted(secs, seconds, side='right') - 1
+        sampled[name] = np.where(idx >= 0, totals[np.maximum(idx, 0)] if len(totals) else 0.0, 0.0)
+    return sampled
+
+
+def extract_replay_data(replay_path, step_seconds=TIMELINE_STEP_SECONDS):
     if not os.path.exists(replay_path):
         return None, None, None, None, []
     try:
-        replay = sc2reader.load_replay(replay_path, load_level=4)
+        replay = replay_cache.load_replay(replay_path, profile=PARSE_PROFILE)
     except Exception as e:
         print(f"Read Error: {e}")
         return None, None, None, None, []
 
+    with tracing.span("extract", replay=os.path.basename(replay_path)):
+        return replay_data_from_replay(replay, step_seconds)
+
+
+def replay_data_from_replay(replay, step_seconds=TIMELINE_STEP_SECONDS):
     if len(replay.players) < 2:
         return None, None, None, None, []
 
     p1, p2 = replay.players[0], replay.players[1]
     p1_id, p2_id = p1.pid, p2.pid
+    pids = [p1_id, p2_id]
+
+    res_store = PlayerStatsStore(replay.tracker_events, pids=pids)
+    tracks = build_value_tracks(replay.tracker_events, pids)
 
-    stats = {
-        p.pid: {'res': [], 'army_val': 0, 'units': {}, 'killed_army': 0, 'lost_army': 0, 'killed_eco': 0, 'lost_eco': 0}
-        for p in [p1, p2]}
-    unit_owner_map, unit_type_map = {}, {}
-
-    for event in replay.tracker_events:
-        if isinstance(event, sc2reader.events.tracker.PlayerStatsEvent) and event.pid in stats:
-            stats[event.pid]['res'].append(
-                {'t': event.second, 'mr': event.minerals_collection_rate, 'gr': event.vespene_collection_rate,
-                 'ms': event.minerals_current, 'gs': event.vespene_current, 'fu': event.food_used,
-                 'fc': event.food_made, 'av': stats[event.pid]['army_val'], 'ka': stats[event.pid]['killed_army'],
-                 'la': stats[event.pid]['lost_army'], 'ke': stats[event.pid]['killed_eco'],
-                 'le': stats[event.pid]['lost_eco']})
-        if isinstance(event, (sc2reader.events.tracker.UnitBornEvent, sc2reader.events.tracker.UnitInitEvent)):
-            p = getattr(event, 'control_player', getattr(event, 'upkeep_player', None))
-            if p and p.pid in stats:
-                u_name = getattr(event, 'unit_type_name', '')
-                unit_owner_map[event.unit_id], unit_type_map[event.unit_id] = p.pid, u_name
-                if u_name in UNIT_COSTS:
-                    val = UNIT_COSTS[u_name]['m'] + UNIT_COSTS[u_name]['g'] * 1.5
-                    if u_name not in WORKER_NAMES: stats[p.pid]['army_val'] += val; stats[p.pid]['units'][
-                        event.unit_id] = val
-        if isinstance(event, sc2reader.events.tracker.UnitDiedEvent):
-            victim_pid, killer_pid, u_name = unit_owner_map.get(event.unit_id), getattr(event.killer, 'pid',
-                                                                                        None), unit_type_map.get(
-                event.unit_id, '')
-            if victim_pid in stats and u_name in UNIT_COSTS:
-                val, is_worker = UNIT_COSTS[u_name]['m'] + UNIT_COSTS[u_name]['g'] * 1.5, u_name in WORKER_NAMES
-                if is_worker:
-                    stats[victim_pid]['lost_eco'] += val
-                else:
-                    stats[victim_pid]['lost_army'] += val
-                    if event.unit_id in stats[victim_pid]['units']: stats[victim_pid]['army_val'] -= stats[victim_pid][
-                        'units'].pop(event.unit_id)
-                if killer_pid in stats and killer_pid != victim_pid:
-                    if is_worker:
-                        stats[killer_pid]['killed_eco'] += val
-                    else:
-                        stats[killer_pid]['killed_army'] += val
-
-    full_timeline = []
     game_end = int(replay.game_length.total_seconds())
-    for t in range(0, game_end, 7):
-        current_state, has_data = {'time': t}, True
-        for p in [p1, p2]:
-            res = next((item for item in reversed(stats[p.pid]['res']) if item['t'] <= t), None)
-            if res:
-                player_key = 'p1' if p.pid == p1.pid else 'p2'
-                current_state[player_key] = {'min_rate': res['mr'], 'gas_rate': res['gr'], 'min_saved': res['ms'],
-                                             'gas_saved': res['gs'], 'food_used': res['fu'], 'food_cap': res['fc'],
-                                             'army_value': res['av'], 'army_killed_val': res['ka'],
-                                             'army_lost_val': res['la'], 'eco_killed_val': res['ke'],
-                                             'eco_lost_val': res['le']}
-            else:
-                has_data = False;
-                break
-        if has_data: full_timeline.append(current_state)
+    ticks = np.arange(0, game_end, step_seconds, dtype=np.int64)
+    columns, has_data = {}, np.ones(len(ticks), dtype=bool)
+    for pid in pids:
+        valid, res = res_store.sample(pid, ticks, key='second')
+        has_data &= valid
+        army = sample_value_tracks(tracks, pid, ticks)
+        columns[pid] = {
+            'min_rate': res.get('minerals_rate'), 'gas_rate': res.get('gas_rate'),
+            'min_saved': res.get('minerals'), 'gas_saved': res.get('gas'),
+            'food_used': res.get('food_used'), 'food_cap': res.get('food_made'),
+            **army
+        }
+
+    keep = np.flatnonzero(has_data)
+    if len(keep) == 0:
+        return p1.name, p1_id, p2.name, p2_id, []
+
+    times = ticks[keep].tolist()
+    player_rows = {}
+    for pid in pids:
+        cols = {name: col[keep].tolist() for name, col in columns[pid].items()}
+        player_rows[pid] = [dict(zip(cols, values)) for values in zip(*cols.values())]
+
+    full_timeline = [{'time': t, 'p1': p1_row, 'p2': p2_row}
+                     for t, p1_row, p2_row in zip(times, player_rows[p1_id], player_rows[p2_id])]
 
     return p1.name, p1_id, p2.name, p2_id, full_timeline
 
 
-if __name__ == "__main__":
-    INPUT_FOLDER = "./replays"
-    OUTPUT_FOLDER = "./experiment_results"
+def pending_models(replay_path, parsed, output_folder):
+    full_timeline = parsed[4]
+    replay_file = os.path.basename(replay_path)
+    replay_name_no_ext = os.path.splitext(replay_file)[0]
+
+    print(f"\n>>> [Processing] {replay_file}")
+
+    if not full_timeline:
+        print(f"  -> Invalid data, skipping.")
+        return []
+
+    pending = []
+    for config in MODELS_CONFIG:
+        model_name = config['name']
+        output_filename = f"{model_name}_{replay_name_no_ext}.json"
+        output_path = os.path.join(output_folder, output_filename)
+
+        if os.path.exists(output_path):
+            print(f"  -> [{model_name}] Results exist, skipping.")
+            continue
+        pending.append((config, output_path))
+    return pending
+
+
+def open_result_log(config, output_path):
+    log = result_log.ResultLog(output_path)
+    if len(log):
+        print(f"  -> [{config['name']}] Resuming, {len(log)} batches already logged.")
+    return log
+
+
+def predictions_for(batches, win_rates, model_name, p1_id):
+    # Batches are planned in time order, so joining their answers keeps predictions_log sorted.
+    predictions_log = []
+    for current_batch, (p1_win_rates, padded) in zip(batches, win_rates):
+        for state, wr, is_padded in zip(current_batch, p1_win_rates, padded):
+            prediction_data = {
+                "game_time_seconds": state['time'],
+                "model_used": model_name,
+                "player1_id": p1_id,
+                "p1_win_rate": wr,
+                "padded": is_padded
+            }
+            predictions_log.append(prediction_data)
+    return predictions_log
+
+
+def save_predictions(predictions_log, output_path, replay_file, model_name, log):
+    try:
+        with tracing.span("write", replay=replay_file, model=model_name), open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(predictions_log, f, indent=4)
+        results_store.record("DWE", model_name, replay_file, predictions_log, output_path)
+        log.finish()
+        print(f"     Saved: {os.path.basename(output_path)}")
+    except Exception as e:
+        print(f"     Save Failed: {e}")
+
+
+def run_replay_models(replay_path, parsed, output_folder):
+    p1_name, p1_id, p2_name, p2_id, full_timeline = parsed
+    replay_file = os.path.basename(replay_path)
+
+    for config, output_path in pending_models(replay_path, parsed, output_folder):
+        model_name = config['name']
+        with open_result_log(config, output_path) as log:
+            batches = plan_batches(full_timeline, p1_name, p2_name, config)
+
+            print(f"  -> Model start: {model_name} ({len(batches)} batches) ...")
+
+            win_rates = []
+            for current_batch in batches:
+                with tracing.tags(replay=replay_file, model=model_name, timepoint=current_batch[0]['time']):
+                    win_rates.append(get_batch_win_rates(current_batch, p1_name, p2_name, config, log))
+
+            save_predictions(predictions_for(batches, win_rates, model_name, p1_id), output_path, replay_file, model_name, log)
+
+
+async def run_model_async(replay_file, parsed, config, output_path):
+    p1_name, p1_id, p2_name, p2_id, full_timeline = parsed
+    model_name = config['name']
+    semaphore = model_semaphore(config)
+
+    async def request(current_batch):
+        with tracing.tags(replay=replay_file, model=model_name, timepoint=current_batch[0]['time']):
+            return await get_batch_win_rates_async(current_batch, p1_name, p2_name, config, semaphore, log)
 
-    if len(sys.argv) >= 2:
-        INPUT_FOLDER = sys.argv[1]
+    with open_result_log(config, output_path) as log:
+        batches = plan_batches(full_timeline, p1_name, p2_name, config)
+
+        print(f"  -> Model start: {model_name} ({len(batches)} batches, concurrent) ...")
+
+        # gather returns the answers in batch order whatever order they arrive in.
+        win_rates = await asyncio.gather(*[request(current_batch) for current_batch in batches])
+        save_predictions(predictions_for(batches, win_rates, model_name, p1_id), output_path, replay_file, model_name, log)
+
+
+async def run_replay_models_async(replay_path, parsed, output_folder):
+    # Every batch of every pending model is in flight at once, bounded per model by its semaphore.
+    replay_file = os.path.basename(replay_path)
+    await asyncio.gather(*[run_model_async(replay_file, parsed, config, output_path)
+                           for config, output_path in pending_models(replay_path, parsed, output_folder)])
+
+
+async def run_all_async(parsed, output_folder):
+    # Replays are parsed in a worker thread while the batches of earlier replays are in flight.
+    replay_paths, tasks = [], []
+    while True:
+        item = await asyncio.to_thread(next, parsed, None)
+        if item is None:
+            break
+        replay_path, result = item
+        replay_paths.append(replay_path)
+        tasks.append(asyncio.create_task(run_replay_models_async(replay_path, result, output_folder)))
+    outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+    for replay_path, outcome in zip(replay_paths, outcomes):
+        if isinstance(outcome, Exception):
+            print(f"[Replay Error] {os.path.basename(replay_path)}: {outcome}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DWE: dynamic win-rate estimation benchmark")
+    parser.add_argument("input_folder", nargs="?", default="./replays")
+    replay_pool.add_pool_arguments(parser)
+    pipeline.add_pipeline_arguments(parser)
+    args = parser.parse_args()
+
+    INPUT_FOLDER = args.input_folder
+    OUTPUT_FOLDER = "./experiment_results"
 
     if not os.path.exists(INPUT_FOLDER):
         print(f"Error: Input folder does not exist -> {INPUT_FOLDER}")
@@ -221,63 +566,26 @@ if __name__ == "__main__":
 
     print(f"Found {len(replay_files)} replays. Models to test: {len(MODELS_CONFIG)}")
 
-    for replay_file in replay_files:
-        replay_path = os.path.join(INPUT_FOLDER, replay_file)
-        replay_name_no_ext = os.path.splitext(replay_file)[0]
-
-        print(f"\n>>> [Processing] {replay_file}")
-        p1_name, p1_id, p2_name, p2_id, full_timeline = extract_replay_data(replay_path)
-
-        if not full_timeline:
-            print(f"  -> Invalid data, skipping.")
-            continue
+    replay_paths = [os.path.join(INPUT_FOLDER, f) for f in replay_files]
+    if args.pipeline:
+        async def consume_async(replay_path, result):
+            await run_replay_models_async(replay_path, result, OUTPUT_FOLDER)
+
+        consume = consume_async if ASYNC_BATCHES else (lambda replay_path, result: run_replay_models(replay_path, result, OUTPUT_FOLDER))
+        pipeline.run(replay_paths, extract_replay_data, consume, args.workers, args.queue_depth, args.max_tasks_per_child)
+    elif ASYNC_BATCHES:
+        parsed = replay_pool.iter_parsed(replay_paths, extract_replay_data, args.workers, args.max_tasks_per_child)
+        llm_clients.run_async(run_all_async(parsed, OUTPUT_FOLDER))
+    else:
+        parsed = replay_pool.iter_parsed(replay_paths, extract_replay_data, args.workers, args.max_tasks_per_child)
+        for replay_path, result in parsed:
+            run_replay_models(replay_path, result, OUTPUT_FOLDER)
+
+    llm_clients.print_connection_stats()
+    llm_clients.close_all()
+    print("\n" + "=" * 60)
+    print(f"All tasks completed. Results in: {OUTPUT_FOLDER}")
 
-        for config in MODELS_CONFIG:
-            model_name = config['name']
-            output_filename = f"{model_name}_{replay_name_no_ext}.json"
-            output_path = os.path.join(OUTPUT_FOLDER, output_filename)
-
-            if os.path.exists(output_path):
-                print(f"  -> [{model_name}] Results exist, skipping.")
-                continue
-
-            predictions_log = []
-            BATCH_DURATION = 300
-            current_batch = []
-            batch_index = 0
-            total_states = len(full_timeline)
-
-            print(f"  -> Model start: {model_name} ...")
-
-            for i, game_state in enumerate(full_timeline):
-                current_batch.append(game_state)
-                current_time = game_state['time']
-
-                is_batch_full = current_time >= (batch_index + 1) * BATCH_DURATION
-                is_last_item = (i == total_states - 1)
-
-                if (is_batch_full and current_batch) or (is_last_item and current_batch):
-                    p1_win_rates = get_batch_win_rates(current_batch, p1_name, p2_name, config)
-
-                    for state, wr in zip(current_batch, p1_win_rates):
-                        prediction_data = {
-                            "game_time_seconds": state['time'],
-                            "model_used": model_name,
-                            "player1_id": p1_id,
-                            "p1_win_rate": wr
-                        }
-                        predictions_log.append(prediction_data)
-
-                    current_batch = []
-                    if is_batch_full:
-                        batch_index += 1
-
-            try:
-                with open(output_path, 'w', encoding='utf-8') as f:
-                    json.dump(predictions_log, f, indent=4)
-                print(f"     Saved: {output_filename}")
-            except Exception as e:
-                print(f"     Save Failed: {e}")
 
-    print("\n" + "=" * 60)
-    print(f"All tasks completed. Results in: {OUTPUT_FOLDER}")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
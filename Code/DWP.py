@@ -1,9 +1,15 @@
-import sc2reader
+import argparse
 import json
 import os
 import re
-from collections import defaultdict
-from openai import OpenAI
+import leaderboard
+import llm_clients
+import pipeline
+import replay_cache
+import replay_pool
+import response_cache
+import results_store
+import tracing
 
 MODELS_CONFIG = [
     {
@@ -18,6 +24,10 @@ MODELS_CONFIG = [
 REPLAY_FOLDER_PATH = "replays"
 OUTPUT_FOLDER_PATH = "./dwp_results"
 CHECKPOINTS = [2 * 60, 4 * 60, 6 * 60, 8 * 60, 10 * 60]
+PARSE_PROFILE = "units"
+# Stop decoding tracker events at the last checkpoint. Unit names then reflect morphs up to that
+# point rather than at the end of the game, so counts can differ from a full decode.
+STREAM_DECODE = False
 
 
 def get_unit_name(unit):
@@ -27,11 +37,30 @@ def get_unit_name(unit):
 def parse_replay_states(replay_path):
     print(f"--> [Parsing] {os.path.basename(replay_path)} ...")
     try:
-        replay = sc2reader.load_replay(replay_path, load_level=4)
+        horizon_frame = max(CHECKPOINTS) << 4 if STREAM_DECODE else None
+        replay = replay_cache.load_replay(replay_path, profile=PARSE_PROFILE, horizon_frame=horizon_frame)
     except Exception as e:
         print(f"!!! Parsing Failed: {e}")
         return None, None, None
+    with tracing.span("extract", replay=os.path.basename(replay_path)):
+        return replay_states_from_replay(replay)
 
+
+def take_snapshot(players_state, shared):
+    # Containers are shared with the snapshot instead of copied; the next write to one of them
+    # copies it first (see writable), so a checkpoint costs O(players) however large the state is.
+    shared.update((pid, key) for pid in players_state for key in ('units', 'upgrades', 'resources'))
+    return {str(pid): dict(state) for pid, state in players_state.items()}
+
+
+def writable(players_state, shared, pid, key):
+    if (pid, key) in shared:
+        players_state[pid][key] = players_state[pid][key].copy()
+        shared.discard((pid, key))
+    return players_state[pid][key]
+
+
+def replay_states_from_replay(replay, checkpoints=CHECKPOINTS):
     players_state = {}
     for player in replay.players:
         if player.is_observer or player.is_referee:
@@ -39,23 +68,24 @@ def parse_replay_states(replay_path):
         players_state[player.pid] = {
             'name': player.name,
             'race': getattr(player, 'play_race', 'Unknown'),
-            'units': defaultdict(int),
+            'units': {},
             'upgrades': [],
             'resources': {'minerals': 0, 'vespene': 0, 'supply_used': 0, 'supply_total': 0}
         }
 
     snapshots = []
+    shared = set()
     checkpoint_idx = 0
 
     for event in replay.events:
-        if checkpoint_idx >= len(CHECKPOINTS):
+        if checkpoint_idx >= len(checkpoints):
             break
 
         current_time_seconds = event.second
-        if current_time_seconds >= CHECKPOINTS[checkpoint_idx]:
+        if current_time_seconds >= checkpoints[checkpoint_idx]:
             snapshot = {
-                'time_min': CHECKPOINTS[checkpoint_idx] // 60,
-                'players': json.loads(json.dumps(players_state))
+                'time_min': checkpoints[checkpoint_idx] // 60,
+                'players': take_snapshot(players_state, shared)
             }
             snapshots.append(snapshot)
             checkpoint_idx += 1
@@ -63,34 +93,41 @@ def parse_replay_states(replay_path):
         if event.name == 'PlayerStatsEvent':
             pid = event.player.pid
             if pid in players_state:
-                players_state[pid]['resources']['minerals'] = event.minerals_current
-                players_state[pid]['resources']['vespene'] = event.vespene_current
-                players_state[pid]['resources']['supply_used'] = event.food_used
-                players_state[pid]['resources']['supply_total'] = event.food_made
+                resources = writable(players_state, shared, pid, 'resources')
+                resources['minerals'] = event.minerals_current
+                resources['vespene'] = event.vespene_current
+                resources['supply_used'] = event.food_used
+                resources['supply_total'] = event.food_made
 
         elif event.name == 'UnitBornEvent' and event.unit_controller:
             pid = event.unit_controller.pid
             u_name = get_unit_name(event.unit)
             if pid in players_state:
-                players_state[pid]['units'][u_name] += 1
+                units = writable(players_state, shared, pid, 'units')
+                units[u_name] = units.get(u_name, 0) + 1
 
         elif event.name == 'UnitDoneEvent' and event.unit and event.unit.owner:
             pid = event.unit.owner.pid
             u_name = get_unit_name(event.unit)
             if pid in players_state:
-                players_state[pid]['units'][u_name] += 1
+                units = writable(players_state, shared, pid, 'units')
+                units[u_name] = units.get(u_name, 0) + 1
 
         elif event.name == 'UnitDiedEvent' and event.unit and event.unit.owner:
             pid = event.unit.owner.pid
             u_name = get_unit_name(event.unit)
-            if pid in players_state and players_state[pid]['units'][u_name] > 0:
-                players_state[pid]['units'][u_name] -= 1
+            if pid in players_state:
+                # A death of an untracked type still lists it with a count of 0.
+                count = players_state[pid]['units'].get(u_name)
+                if count != 0:
+                    units = writable(players_state, shared, pid, 'units')
+                    units[u_name] = count - 1 if count else 0
 
         elif event.name == 'UpgradeCompleteEvent' and event.player:
             pid = event.player.pid
             upgrade_name = event.upgrade_type_name
             if pid in players_state and upgrade_name not in players_state[pid]['upgrades']:
-                players_state[pid]['upgrades'].append(upgrade_name)
+                writable(players_state, shared, pid, 'upgrades').append(upgrade_name)
 
     real_winner_pid = -1
     if replay.winner:
@@ -145,15 +182,9 @@ def query_llm(client, model_config, prompt):
         # PAPER PROMPT ALIGNMENT: DWP System Prompt
         system_prompt = "Role: StarCraft II Strategic Forecasting Expert."
 
-        response = client.chat.completions.create(
-            model=model_config["model_id"],
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=model_config["temperature"]
-        )
-        prediction = response.choices[0].message.content.strip()
+        prediction = response_cache.chat_completion(
+            client, model_config["model_id"], system_prompt, prompt, model_config["temperature"]
+        ).strip()
         return prediction.replace("Player", "").replace("player", "").replace("ID", "").strip()
     except Exception as e:
         print(f"  [API Error] {model_config['name']} failed: {e}")
@@ -170,10 +201,7 @@ def process_single_match_with_model(snapshots, real_winner_pid, real_winner_name
     display_name = model_config["name"]
     print(f"  > Model [{display_name}] predicting {match_name} ...")
 
-    client = OpenAI(
-        api_key=model_config["api_key"],
-        base_url=model_config["base_url"]
-    )
+    client = llm_clients.get_client(model_config)
 
     results = {
         "match_name": match_name,
@@ -187,22 +215,25 @@ def process_single_match_with_model(snapshots, real_winner_pid, real_winner_name
 
     for snapshot in snapshots:
         time_mark = snapshot['time_min']
-        prompt = generate_prompt(snapshot)
-        if prompt is None: continue
-
-        predicted_pid_str = query_llm(client, model_config, prompt)
-
-        predicted_pid = -1
-        try:
-            nums = re.findall(r'\d+', predicted_pid_str)
-            if nums:
-                predicted_pid = int(nums[0])
-        except:
-            pass
-
-        predicted_name = get_player_name_by_pid(snapshot['players'], predicted_pid)
-        is_correct = (predicted_pid == real_winner_pid)
-        if is_correct: correct_count += 1
+        with tracing.tags(replay=match_name, model=display_name, timepoint=time_mark):
+            with tracing.span("prompt"):
+                prompt = generate_prompt(snapshot)
+            if prompt is None: continue
+
+            predicted_pid_str = query_llm(client, model_config, prompt)
+
+            with tracing.span("parse"):
+                predicted_pid = -1
+                try:
+                    nums = re.findall(r'\d+', predicted_pid_str)
+                    if nums:
+                        predicted_pid = int(nums[0])
+                except:
+                    pass
+
+                predicted_name = get_player_name_by_pid(snapshot['players'], predicted_pid)
+                is_correct = (predicted_pid == real_winner_pid)
+                if is_correct: correct_count += 1
 
         results["predictions"].append({
             "time_min": time_mark,
@@ -216,13 +247,42 @@ def process_single_match_with_model(snapshots, real_winner_pid, real_winner_name
     output_filename = f"{display_name}_{match_name}.json"
     output_path = os.path.join(OUTPUT_FOLDER_PATH, output_filename)
 
-    with open(output_path, "w", encoding='utf-8') as f:
+    with tracing.span("write", replay=match_name, model=display_name), open(output_path, "w", encoding='utf-8') as f:
         json.dump(results, f, indent=4, ensure_ascii=False)
+    results_store.record("DWP", display_name, match_name, results, output_path)
+    leaderboard.record("DWP", display_name, match_name, results)
 
     print(f"    Done. Accuracy: {accuracy:.2%} -> Saved: {output_filename}")
 
 
+def process_replay(full_path, parsed):
+    snapshots, real_winner_pid, real_winner_name = parsed
+    filename = os.path.basename(full_path)
+    match_name = os.path.splitext(filename)[0]
+
+    print(f"=== Processing: {match_name} ===")
+
+    if not snapshots:
+        print(f"Skipping {filename}: No snapshots.")
+        return
+
+    print(f"Real Winner: {real_winner_name} (ID: {real_winner_pid})")
+
+    for config in MODELS_CONFIG:
+        try:
+            process_single_match_with_model(snapshots, real_winner_pid, real_winner_name, match_name, config)
+        except Exception as e:
+            print(f"  [Fatal Error] Model {config['name']} interrupted: {e}")
+
+    print("\n" + "-" * 30 + "\n")
+
+
 def main():
+    parser = argparse.ArgumentParser(description="DWP: discrete winner prediction benchmark")
+    replay_pool.add_pool_arguments(parser)
+    pipeline.add_pipeline_arguments(parser)
+    args = parser.parse_args()
+
     if not os.path.exists(OUTPUT_FOLDER_PATH):
         os.makedirs(OUTPUT_FOLDER_PATH)
         print(f"Created output dir: {OUTPUT_FOLDER_PATH}")
@@ -234,27 +294,18 @@ def main():
     replay_files = [f for f in os.listdir(REPLAY_FOLDER_PATH) if f.lower().endswith(".sc2replay")]
     print(f"Found {len(replay_files)} replay files.\n")
 
-    for filename in replay_files:
-        full_path = os.path.join(REPLAY_FOLDER_PATH, filename)
-        match_name = os.path.splitext(filename)[0]
-
-        print(f"=== Processing: {match_name} ===")
-        snapshots, real_winner_pid, real_winner_name = parse_replay_states(full_path)
-
-        if not snapshots:
-            print(f"Skipping {filename}: No snapshots.")
-            continue
-
-        print(f"Real Winner: {real_winner_name} (ID: {real_winner_pid})")
-
-        for config in MODELS_CONFIG:
-            try:
-                process_single_match_with_model(snapshots, real_winner_pid, real_winner_name, match_name, config)
-            except Exception as e:
-                print(f"  [Fatal Error] Model {config['name']} interrupted: {e}")
-
-        print("\n" + "-" * 30 + "\n")
-
+    replay_paths = [os.path.join(REPLAY_FOLDER_PATH, f) for f in replay_files]
+    if args.pipeline:
+        pipeline.run(replay_paths, parse_replay_states, process_replay, args.workers, args.queue_depth,
+                     args.max_tasks_per_child)
+    else:
+        parsed = replay_pool.iter_parsed(replay_paths, parse_replay_states, args.workers, args.max_tasks_per_child)
+        for full_path, result in parsed:
+            process_replay(full_path, result)
+
+    llm_clients.print_connection_stats()
+    llm_clients.close_all()
+    leaderboard.flush()
     print(f"All tasks completed. Results in {OUTPUT_FOLDER_PATH}")
 
 
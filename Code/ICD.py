@@ -1,12 +1,23 @@
+import argparse
+import asyncio
 import os
 import sys
 import json
 import re
+from bisect import bisect_left, bisect_right, insort
 from collections import Counter
+from functools import lru_cache, partial
 from datetime import datetime
-from openai import OpenAI
-import sc2reader
-from sc2reader.engine.plugins import SelectionTracker, APMTracker
+import leaderboard
+import llm_clients
+import pipeline
+import replay_cache
+import replay_pool
+import response_cache
+import result_log
+import results_store
+import tracing
+from player_stats import PlayerStatsStore
 
 MODELS_CONFIG = [
     {
@@ -14,15 +25,29 @@ MODELS_CONFIG = [
         "api_key": os.environ.get("ANTHROPIC_API_KEY", "YOUR_API_KEY_HERE"),
         "base_url": "",
         "model_id": "",
-        "temperature": 0
+        "temperature": 0,
+        "max_in_flight": 8,
+        "supports_n": False
     }
 ]
 
+# SAP, ICD and BSS share this script; the file name tells them apart in the results store.
+TASK = os.path.splitext(os.path.basename(__file__))[0].upper()
 REPLAY_FOLDER = "replays"
 OUTPUT_FOLDER = "./sap_results"
 TIME_POINTS = [2.0, 4.0, 6.0, 8.0, 9.0]
 PREDICTION_WINDOW_SECONDS = 90
 NUM_SAMPLES = 5
+# Send all samples of all timepoints of a replay concurrently instead of one request at a time.
+ASYNC_SAMPLING = False
+MAX_IN_FLIGHT_REQUESTS = 8
+# With temperature 0, send one request per timepoint and reuse its answer for every sample.
+COLLAPSE_DETERMINISTIC_SAMPLES = False
+# Ground truth and opponent buildings come from tracker events; game events are never read.
+PARSE_PROFILE = "units"
+# Stop decoding tracker events after the last timepoint's prediction window. Unit names then
+# reflect morphs up to that point rather than at the end of the game, so results can differ.
+STREAM_DECODE = False
 
 VALID_ACTIONS = {
     "Terran": [
@@ -56,99 +81,170 @@ VALID_ACTIONS = {
     ]
 }
 
+# Raw sc2reader names map to canonical action names through clean_name, and action names map to the
+# scoring key through normalize_action. Both are memoized and return interned strings, so every
+# name is rewritten once per process and extraction, prompting and scoring share the same objects.
+INVALID_UNITS = frozenset(["MULE", "Larva", "Broodling", "SCV", "Probe", "Drone", "Egg", "AutoTurret", "KD8Charge"])
+IGNORED_ACTIONS = frozenset(["SupplyDepot", "Pylon", "Overlord", "CreepTumor", "Refinery", "Extractor", "Assimilator"])
+UNSCOUTED_BUILDINGS = frozenset(["SupplyDepot", "Pylon", "Overlord", "CreepTumor"])
+VALID_ACTIONS_TEXT = {race: ", ".join(actions) for race, actions in VALID_ACTIONS.items()}
+
+# Bounded: predictions are free text from the model, the vocabulary itself is a few hundred names.
+@lru_cache(maxsize=1 << 16)
+def _normalized(action):
+    return sys.intern(action.lower().replace(" ", ""))
+
+def normalize_action(action):
+    return _normalized(str(action))
+
+@lru_cache(maxsize=None)
 def clean_name(name):
     if not name: return None
     name = re.sub(r"^(Terran|Zerg|Protoss)", "", name)
     name = name.replace("Lowered", "").replace("Flying", "").replace("Research", "")
-    invalid_keywords = ["MULE", "Larva", "Broodling", "SCV", "Probe", "Drone", "Egg", "AutoTurret", "KD8Charge"]
-    if name in invalid_keywords: return None
-    return name
-
-def get_resources(replay, pid, frame):
-    events = [e for e in replay.tracker_events if e.name == 'PlayerStatsEvent' and e.pid == pid and e.frame <= frame]
-    if not events: return {"minerals": 0, "gas": 0, "supply": 0}
-    latest = events[-1]
+    if name in INVALID_UNITS: return None
+    return sys.intern(name)
+
+def get_resources(stats, pid, frame):
+    latest = stats.latest(pid, frame)
+    if latest is None: return {"minerals": 0, "gas": 0, "supply": 0}
     return {
-        "minerals": latest.minerals_current,
-        "gas": latest.vespene_current,
-        "supply": int(latest.food_used / 4096)
+        "minerals": latest['minerals'],
+        "gas": latest['gas'],
+        "supply": int(latest['food_used'] / 4096)
     }
 
-def extract_full_game_context(replay_path, minute):
-    sc2reader.engine.register_plugin(SelectionTracker())
-    sc2reader.engine.register_plugin(APMTracker())
-
+def load_game_replay(replay_path, horizon_frame=None):
     try:
-        replay = sc2reader.load_replay(replay_path, load_level=4)
+        return replay_cache.load_replay(replay_path, profile=PARSE_PROFILE, horizon_frame=horizon_frame)
     except Exception as e:
         print(f"   [SC2Reader Error]: {e}")
         return None
 
-    target_frame = int(minute * 60 * 22.4)
-    end_frame = target_frame + int(PREDICTION_WINDOW_SECONDS * 22.4)
+def get_ground_truth_action(event, hero):
+    if hasattr(event, 'control_pid') and event.control_pid != hero.pid: return None
+    if hasattr(event, 'player') and event.player != hero: return None
 
-    if target_frame > replay.frames:
-        return None
+    action = None
+    if event.name == 'UnitInitEvent' or (event.name == 'UnitBornEvent' and event.unit.is_building):
+        action = clean_name(event.unit.name)
+    elif event.name == 'UnitTypeChangeEvent' and event.unit.owner == hero:
+        action = clean_name(event.unit_type_name)
+    elif event.name == 'UpgradeCompleteEvent':
+        action = clean_name(event.upgrade_type_name)
 
+    if action in IGNORED_ACTIONS:
+        return None
+    return action
+
+def extract_game_contexts(replay_path, minutes):
+    # The replay is decoded once; every timepoint is then answered from the tables built below.
+    horizon_frame = int((max(minutes) * 60 + PREDICTION_WINDOW_SECONDS) * 22.4) if STREAM_DECODE else None
+    replay = load_game_replay(replay_path, horizon_frame)
+    if replay is None:
+        return {minute: None for minute in minutes}
+    with tracing.span("extract", replay=os.path.basename(replay_path)):
+        return game_contexts_from_replay(replay, minutes)
+
+def game_contexts_from_replay(replay, minutes):
     hero = replay.players[0]
     opponent = replay.players[1]
 
-    resources = get_resources(replay, hero.pid, target_frame)
-
-    current_buildings = set()
-    current_army = []
+    stats = PlayerStatsStore(replay.tracker_events, pids=[hero.pid])
 
+    # Unit births and deaths as one frame-ordered event list; the timepoints are answered in
+    # ascending order by applying the events up to each target frame.
+    unit_events = []
     for unit in hero.units:
-        if unit.started_at is not None and unit.started_at <= target_frame:
-            if unit.died_at is None or unit.died_at > target_frame:
-                c_name = clean_name(unit.name)
-                if not c_name: continue
-                if unit.is_building:
-                    current_buildings.add(c_name)
-                elif unit.is_army:
-                    current_army.append(c_name)
-
-    scouted_info = set()
+        if unit.started_at is None: continue
+        if unit.died_at is not None and unit.died_at <= unit.started_at: continue
+        c_name = clean_name(unit.name)
+        if not c_name: continue
+        if unit.is_building or unit.is_army:
+            key = (len(unit_events), c_name, unit.is_building)
+            unit_events.append((unit.started_at, 1, key))
+            if unit.died_at is not None:
+                unit_events.append((unit.died_at, -1, key))
+    unit_events.sort(key=lambda e: e[0])
+
+    opponent_buildings = []
     for unit in opponent.units:
-        if unit.is_building and unit.started_at is not None and unit.started_at <= target_frame:
+        if unit.is_building and unit.started_at is not None:
             c_name = clean_name(unit.name)
-            if c_name and c_name not in ["SupplyDepot", "Pylon", "Overlord", "CreepTumor"]:
-                scouted_info.add(c_name)
+            if c_name and c_name not in UNSCOUTED_BUILDINGS:
+                opponent_buildings.append((unit.started_at, c_name))
+    opponent_buildings.sort(key=lambda b: b[0])
 
-    ground_truth_actions = set()
+    action_frames, actions = [], []
     for event in replay.events:
-        if event.frame < target_frame or event.frame > end_frame: continue
-        if hasattr(event, 'control_pid') and event.control_pid != hero.pid: continue
-        if hasattr(event, 'player') and event.player != hero: continue
-
-        action = None
-        if event.name == 'UnitInitEvent' or (event.name == 'UnitBornEvent' and event.unit.is_building):
-            action = clean_name(event.unit.name)
-        elif event.name == 'UnitTypeChangeEvent' and event.unit.owner == hero:
-            action = clean_name(event.unit_type_name)
-        elif event.name == 'UpgradeCompleteEvent':
-            if event.frame <= (end_frame + 2000):
-                action = clean_name(event.upgrade_type_name)
-
-        if action and action not in ["SupplyDepot", "Pylon", "Overlord", "CreepTumor", "Refinery", "Extractor", "Assimilator"]:
-            ground_truth_actions.add(action)
+        action = get_ground_truth_action(event, hero)
+        if action:
+            action_frames.append(event.frame)
+            actions.append(action)
+
+    buildings = Counter()
+    army = {}                   # unit name -> sorted indices of the alive units of that name
+    scouted_info = {}
+    next_event = next_scouted = 0
+    contexts = {}
+    for minute in sorted(minutes):
+        target_frame = int(minute * 60 * 22.4)
+        end_frame = target_frame + int(PREDICTION_WINDOW_SECONDS * 22.4)
+
+        if target_frame > replay.frames:
+            contexts[minute] = None
+            continue
 
-    return {
-        "race": hero.play_race,
-        "opponent_race": opponent.play_race,
-        "time_min": minute,
-        "minerals": resources['minerals'],
-        "gas": resources['gas'],
-        "supply": resources['supply'],
-        "my_army_composition": dict(Counter(current_army)),
-        "my_tech_structure": list(current_buildings),
-        "scouted_opponent": list(scouted_info),
-        "ground_truth": list(ground_truth_actions) if ground_truth_actions else ["None"]
-    }
+        resources = get_resources(stats, hero.pid, target_frame)
+
+        while next_event < len(unit_events) and unit_events[next_event][0] <= target_frame:
+            _, delta, (index, c_name, is_building) = unit_events[next_event]
+            next_event += 1
+            if is_building:
+                buildings[c_name] += delta
+            elif delta > 0:
+                insort(army.setdefault(c_name, []), index)
+            else:
+                army[c_name].remove(index)
+        while next_scouted < len(opponent_buildings) and opponent_buildings[next_scouted][0] <= target_frame:
+            scouted_info[opponent_buildings[next_scouted][1]] = True
+            next_scouted += 1
+
+        # Listed in the order the first alive unit of each type was started, as before.
+        army_composition = {c_name: len(alive) for _, c_name, alive in
+                            sorted((alive[0], c_name, alive) for c_name, alive in army.items() if alive)}
+
+        lo = bisect_left(action_frames, target_frame)
+        hi = bisect_right(action_frames, end_frame)
+        ground_truth_actions = set(actions[lo:hi])
+
+        contexts[minute] = {
+            "race": hero.play_race,
+            "opponent_race": opponent.play_race,
+            "time_min": minute,
+            "minerals": resources['minerals'],
+            "gas": resources['gas'],
+            "supply": resources['supply'],
+            "my_army_composition": army_composition,
+            "my_tech_structure": [c_name for c_name, count in buildings.items() if count > 0],
+            "scouted_opponent": list(scouted_info),
+            "ground_truth": list(ground_truth_actions) if ground_truth_actions else ["None"]
+        }
+
+    return contexts
+
+def extract_replay_contexts(replay_path):
+    return extract_game_contexts(replay_path, TIME_POINTS)
+
+def extract_full_game_context(replay_path, minute):
+    return extract_game_contexts(replay_path, [minute])[minute]
+
+def time_point_grid(step_seconds, until_minute):
+    steps = int(until_minute * 60 // step_seconds)
+    return [round((i * step_seconds) / 60, 4) for i in range(1, steps + 1)]
 
 def generate_data_driven_prompt(data):
-    valid_list = VALID_ACTIONS.get(data['race'], [])
-    valid_str = ", ".join(valid_list)
+    valid_str = VALID_ACTIONS_TEXT.get(data['race'], "")
 
     army_str = ", ".join([f"{k}: {v}" for k, v in data['my_army_composition'].items()]) or "None"
     tech_str = ", ".join(data['my_tech_structure']) or "Base Structure Only"
@@ -179,7 +275,8 @@ def calculate_advanced_stats(ground_truth_list, all_samples_preds):
     gt_set = set(ground_truth_list)
     if "None" in gt_set: gt_set.remove("None")
 
-    action_hit_counts = {action: 0 for action in gt_set}
+    # Keyed in ground-truth order, not set order, so a rescore reproduces the stored lists exactly.
+    action_hit_counts = {action: 0 for action in ground_truth_list if action in gt_set}
     total_predictions_made = 0
     total_correct_predictions = 0
 
@@ -206,17 +303,202 @@ def calculate_advanced_stats(ground_truth_list, all_samples_preds):
         "total_correct_predictions": total_correct_predictions
     }
 
-def run_single_experiment(replay_path, model_config):
+# PAPER PROMPT ALIGNMENT: SAP System Prompt
+SYSTEM_PROMPT = (
+    "Role: StarCraft II Macro-management Logic Planner.\n"
+    "Task: Forecast a set of valid strategic actions within a subsequent 90-second window."
+)
+
+def sampling_mode(model_config):
+    if COLLAPSE_DETERMINISTIC_SAMPLES and model_config['temperature'] == 0:
+        return "collapsed"
+    if model_config.get('supports_n', False):
+        return "native_n"
+    return "independent"
+
+def expand_samples(mode, contents):
+    # A collapsed call stands in for every sample; a short `n` response leaves the rest as errors.
+    if mode == "collapsed":
+        return contents * NUM_SAMPLES
+    missing = RuntimeError("Provider returned fewer choices than requested")
+    return [c if c is not None else missing for c in contents]
+
+def request_sample(client, model_config, prompt, sample):
+    return response_cache.chat_completion(
+        client, model_config['model_id'], SYSTEM_PROMPT, prompt, model_config['temperature'], sample=sample
+    )
+
+def request_samples(client, model_config, prompt, samples=None):
+    # samples: indices still needed (all by default); the others are returned as None.
+    mode = sampling_mode(model_config)
+    try:
+        if mode == "collapsed":
+            return expand_samples(mode, [request_sample(client, model_config, prompt, 0)])
+        if mode == "native_n":
+            return expand_samples(mode, response_cache.chat_completions(
+                client, model_config['model_id'], SYSTEM_PROMPT, prompt, model_config['temperature'], NUM_SAMPLES
+            ))
+    except Exception as e:
+        return [e] * NUM_SAMPLES
+
+    sample_outcomes = [None] * NUM_SAMPLES
+    for i in (range(NUM_SAMPLES) if samples is None else samples):
+        try:
+            sample_outcomes[i] = request_sample(client, model_config, prompt, i)
+        except Exception as e:
+            sample_outcomes[i] = e
+    return sample_outcomes
+
+def sample_keys(timepoint, prompt):
+    digest = result_log.prompt_digest(prompt)
+    return [[timepoint, i, digest] for i in range(NUM_SAMPLES)]
+
+def request_logged_samples(client, model_config, prompt, timepoint, log):
+    keys = sample_keys(timepoint, prompt)
+    outcomes, missing = log.split(keys)
+    if missing:
+        log.fill(keys, outcomes, missing, request_samples(client, model_config, prompt, missing))
+    return outcomes
+
+async def request_sample_async(client, model_config, prompt, sample, semaphore):
+    async with semaphore:
+        return await response_cache.chat_completion_async(
+            client, model_config['model_id'], SYSTEM_PROMPT, prompt, model_config['temperature'], sample=sample
+        )
+
+async def request_samples_async(client, model_config, prompt, semaphore, timepoint=None, log=None):
+    with tracing.tags(timepoint=timepoint):
+        if log is None:
+            return await _request_samples_async(client, model_config, prompt, semaphore)
+        keys = sample_keys(timepoint, prompt)
+        outcomes, missing = log.split(keys)
+        if missing:
+            log.fill(keys, outcomes, missing, await _request_samples_async(client, model_config, prompt, semaphore, missing))
+        return outcomes
+
+async def _request_samples_async(client, model_config, prompt, semaphore, samples=None):
+    mode = sampling_mode(model_config)
+    try:
+        if mode == "collapsed":
+            return expand_samples(mode, [await request_sample_async(client, model_config, prompt, 0, semaphore)])
+        if mode == "native_n":
+            async with semaphore:
+                return expand_samples(mode, await response_cache.chat_completions_async(
+                    client, model_config['model_id'], SYSTEM_PROMPT, prompt, model_config['temperature'], NUM_SAMPLES
+                ))
+    except Exception as e:
+        return [e] * NUM_SAMPLES
+
+    samples = range(NUM_SAMPLES) if samples is None else samples
+    fresh = await asyncio.gather(*[request_sample_async(client, model_config, prompt, i, semaphore)
+                                   for i in samples], return_exceptions=True)
+    sample_outcomes = [None] * NUM_SAMPLES
+    for i, outcome in zip(samples, fresh):
+        sample_outcomes[i] = outcome
+    return sample_outcomes
+
+async def collect_samples_async(model_config, prompts, timepoints=None, log=None):
+    # Every request of every timepoint goes out at once, bounded by the model's in-flight limit.
+    client = llm_clients.get_async_client(model_config)
+    semaphore = asyncio.Semaphore(model_config.get('max_in_flight', MAX_IN_FLIGHT_REQUESTS))
+    timepoints = timepoints or [None] * len(prompts)
+    return await asyncio.gather(*[request_samples_async(client, model_config, prompt, semaphore, timepoint, log)
+                                  for prompt, timepoint in zip(prompts, timepoints)])
+
+def record_sample(timepoint_log, all_samples_preds_list, gt_set, sample_id, outcome):
+    try:
+        if isinstance(outcome, BaseException): raise outcome
+        raw_text = outcome
+        match = re.search(r"\{.*\}", raw_text, re.DOTALL)
+        json_str = match.group(0) if match else raw_text
+        res_json = json.loads(json_str)
+        preds = [normalize_action(p) for p in res_json.get("predictions", [])]
+        analysis = res_json.get("analysis", "N/A")
+
+        all_samples_preds_list.append(preds)
+        is_hit = len(gt_set.intersection(set(preds))) > 0
+
+        timepoint_log["samples"].append({
+            "id": sample_id,
+            "raw_response": raw_text,
+            "predictions": preds,
+            "analysis": analysis,
+            "is_hit": is_hit
+        })
+    except Exception as e:
+        timepoint_log["samples"].append({"id": sample_id, "error": str(e)})
+
+def build_timepoint_log(minute, data):
+    if data is None:
+        return {"time_min": minute, "status": "Skipped"}
+    with tracing.span("prompt", timepoint=minute):
+        prompt = generate_data_driven_prompt(data)
+    gt_normalized = [normalize_action(x) for x in data['ground_truth']]
+    return {
+        "time_min": minute,
+        "status": "Success",
+        "ground_truth": gt_normalized,
+        "extracted_data": data,
+        "prompt": prompt,
+        "samples": []
+    }
+
+def finish_timepoint(timepoint_log, outcomes):
+    gt_normalized = timepoint_log["ground_truth"]
+    gt_set = set(gt_normalized)
+    all_samples_preds_list = []
+    with tracing.span("parse", timepoint=timepoint_log["time_min"]):
+        for i, outcome in enumerate(outcomes):
+            record_sample(timepoint_log, all_samples_preds_list, gt_set, i + 1, outcome)
+
+        advanced_stats = calculate_advanced_stats(gt_normalized, all_samples_preds_list)
+        timepoint_log["advanced_analysis"] = advanced_stats
+
+    valid_samples = [s for s in timepoint_log["samples"] if "is_hit" in s]
+    hit_count = sum(1 for s in valid_samples if s["is_hit"])
+    pass_rate = (hit_count / len(valid_samples) * 100) if valid_samples else 0
+    timepoint_log["pass_rate_percent"] = pass_rate
+    return hit_count, len(valid_samples)
+
+def result_path(replay_path, model_config):
     replay_filename = os.path.basename(replay_path)
-    model_name = model_config['name']
-    output_filename = f"{model_name}_{replay_filename.replace('.SC2Replay', '')}.json"
-    output_path = os.path.join(OUTPUT_FOLDER, output_filename)
+    output_filename = f"{model_config['name']}_{replay_filename.replace('.SC2Replay', '')}.json"
+    return os.path.join(OUTPUT_FOLDER, output_filename)
 
+def prepare_experiment(replay_path, model_config, contexts=None):
+    output_path = result_path(replay_path, model_config)
     if os.path.exists(output_path):
-        print(f"   [Skip] Result already exists: {output_filename}")
-        return
+        print(f"   [Skip] Result already exists: {os.path.basename(output_path)}")
+        return None
+
+    print(f"\n   >>> Model: {model_config['name']} | Replay: {os.path.basename(replay_path)}")
+    if contexts is None:
+        contexts = extract_replay_contexts(replay_path)
+    return [build_timepoint_log(minute, contexts[minute]) for minute in TIME_POINTS]
+
+def active_prompts(timepoint_logs):
+    active = [log for log in timepoint_logs if log["status"] == "Success"]
+    return [log["prompt"] for log in active], [log["time_min"] for log in active]
 
-    print(f"\n   >>> Model: {model_name} | Replay: {replay_filename}")
+def open_result_log(replay_path, model_config):
+    log = result_log.ResultLog(result_path(replay_path, model_config))
+    if len(log):
+        print(f"   [Resume] {len(log)} samples already logged in {os.path.basename(log.path)}")
+    return log
+
+def global_summary(hits, samples):
+    return {
+        "total_samples": samples,
+        "total_hits": hits,
+        "overall_accuracy": (hits / samples * 100) if samples > 0 else 0
+    }
+
+def assemble_experiment(replay_path, model_config, timepoint_logs, get_outcomes, log):
+    # get_outcomes(timepoint_log) returns the NUM_SAMPLES outcomes of one active timepoint.
+    replay_filename = os.path.basename(replay_path)
+    model_name = model_config['name']
+    output_path = result_path(replay_path, model_config)
+    output_filename = os.path.basename(output_path)
 
     full_log = {
         "experiment_meta": {
@@ -228,96 +510,154 @@ def run_single_experiment(replay_path, model_config):
         "global_summary": {}
     }
 
-    client = OpenAI(api_key=model_config['api_key'], base_url=model_config['base_url'])
     global_hits = 0
     global_samples = 0
 
-    # PAPER PROMPT ALIGNMENT: SAP System Prompt
-    system_prompt = (
-        "Role: StarCraft II Macro-management Logic Planner.\n"
-        "Task: Forecast a set of valid strategic actions within a subsequent 90-second window."
-    )
-
-    for minute in TIME_POINTS:
+    for timepoint_log in timepoint_logs:
+        minute = timepoint_log["time_min"]
         print(f"       Timepoint: {minute}m", end="", flush=True)
 
-        data = extract_full_game_context(replay_path, minute)
-        if data is None:
+        if timepoint_log["status"] == "Skipped":
             print(" -> Skipped (No Data)")
-            full_log["timepoints_results"].append({"time_min": minute, "status": "Skipped"})
+            full_log["timepoints_results"].append(timepoint_log)
             continue
 
-        prompt = generate_data_driven_prompt(data)
-        gt_normalized = [str(x).lower().replace(" ", "") for x in data['ground_truth']]
-        gt_set = set(gt_normalized)
+        sample_outcomes = get_outcomes(timepoint_log)
+        timepoint_log["sampling_mode"] = sampling_mode(model_config)
 
-        timepoint_log = {
-            "time_min": minute,
-            "status": "Success",
-            "ground_truth": gt_normalized,
-            "extracted_data": data,
-            "prompt": prompt,
-            "samples": []
-        }
-
-        all_samples_preds_list = []
-
-        for i in range(NUM_SAMPLES):
-            try:
-                resp = client.chat.completions.create(
-                    model=model_config['model_id'],
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=model_config['temperature']
-                )
-                raw_text = resp.choices[0].message.content
-                match = re.search(r"\{.*\}", raw_text, re.DOTALL)
-                json_str = match.group(0) if match else raw_text
-                res_json = json.loads(json_str)
-                preds = [str(p).lower().replace(" ", "") for p in res_json.get("predictions", [])]
-                analysis = res_json.get("analysis", "N/A")
-
-                all_samples_preds_list.append(preds)
-                is_hit = len(gt_set.intersection(set(preds))) > 0
-
-                timepoint_log["samples"].append({
-                    "id": i + 1,
-                    "raw_response": raw_text,
-                    "predictions": preds,
-                    "analysis": analysis,
-                    "is_hit": is_hit
-                })
-            except Exception as e:
-                timepoint_log["samples"].append({"id": i + 1, "error": str(e)})
-
-        advanced_stats = calculate_advanced_stats(gt_normalized, all_samples_preds_list)
-        timepoint_log["advanced_analysis"] = advanced_stats
-
-        valid_samples = [s for s in timepoint_log["samples"] if "is_hit" in s]
-        hit_count = sum(1 for s in valid_samples if s["is_hit"])
-        pass_rate = (hit_count / len(valid_samples) * 100) if valid_samples else 0
-        timepoint_log["pass_rate_percent"] = pass_rate
+        hit_count, valid_count = finish_timepoint(timepoint_log, sample_outcomes)
 
         full_log["timepoints_results"].append(timepoint_log)
         global_hits += hit_count
-        global_samples += len(valid_samples)
+        global_samples += valid_count
 
-        print(f" -> Done. Pass Rate: {pass_rate:.0f}%")
+        print(f" -> Done. Pass Rate: {timepoint_log['pass_rate_percent']:.0f}%")
 
-    global_accuracy = (global_hits / global_samples * 100) if global_samples > 0 else 0
-    full_log["global_summary"] = {
-        "total_samples": global_samples,
-        "total_hits": global_hits,
-        "overall_accuracy": global_accuracy
-    }
+    full_log["global_summary"] = global_summary(global_hits, global_samples)
 
-    with open(output_path, 'w', encoding='utf-8') as f:
+    with tracing.span("write"), open(output_path, 'w', encoding='utf-8') as f:
         json.dump(full_log, f, indent=4, ensure_ascii=False)
+    results_store.record(TASK, model_name, replay_filename, full_log, output_path)
+    leaderboard.record(TASK, model_name, replay_filename, full_log)
+    log.finish()
     print(f"   Saved to {output_filename}")
 
+def run_single_experiment(replay_path, model_config, contexts=None):
+    with tracing.tags(replay=os.path.basename(replay_path), model=model_config['name']):
+        timepoint_logs = prepare_experiment(replay_path, model_config, contexts)
+        if timepoint_logs is None:
+            return
+
+        with open_result_log(replay_path, model_config) as log:
+            if ASYNC_SAMPLING:
+                prompts, minutes = active_prompts(timepoint_logs)
+                pending = iter(llm_clients.run_async(collect_samples_async(model_config, prompts, minutes, log)))
+                get_outcomes = lambda timepoint_log: next(pending)
+            else:
+                client = llm_clients.get_client(model_config)
+
+                def get_outcomes(timepoint_log):
+                    minute = timepoint_log["time_min"]
+                    with tracing.tags(timepoint=minute):
+                        return request_logged_samples(client, model_config, timepoint_log["prompt"], minute, log)
+
+            assemble_experiment(replay_path, model_config, timepoint_logs, get_outcomes, log)
+
+async def run_single_experiment_async(replay_path, model_config, contexts=None):
+    # Same experiment for callers that already run an event loop, such as the --pipeline runner.
+    with tracing.tags(replay=os.path.basename(replay_path), model=model_config['name']):
+        timepoint_logs = prepare_experiment(replay_path, model_config, contexts)
+        if timepoint_logs is None:
+            return
+
+        prompts, minutes = active_prompts(timepoint_logs)
+        with open_result_log(replay_path, model_config) as log:
+            pending = iter(await collect_samples_async(model_config, prompts, minutes, log))
+            assemble_experiment(replay_path, model_config, timepoint_logs, lambda timepoint_log: next(pending), log)
+
+def stored_outcomes(timepoint_log):
+    # The outcomes a stored timepoint was built from: raw responses, and the errors of samples that never
+    # produced one, so finish_timepoint() can parse and score them again like a live run.
+    return [sample["raw_response"] if "raw_response" in sample else RuntimeError(sample.get("error", "No response"))
+            for sample in timepoint_log["samples"]]
+
+def rescore_results(folder):
+    # Re-parses the stored raw responses with the live parser and re-scores them, e.g. after a parsing
+    # or normalization change. Prompts and raw responses are kept; everything derived from them is rewritten.
+    if not os.path.isdir(folder):
+        print(f"Error: Output folder '{folder}' does not exist.")
+        return
+    payloads = []
+    for output_filename in sorted(os.listdir(folder)):
+        if not output_filename.endswith(".json"): continue
+        output_path = os.path.join(folder, output_filename)
+        try:
+            with open(output_path, encoding='utf-8') as f:
+                payloads.append((output_path, json.load(f)))
+        except (OSError, ValueError) as e:
+            print(f"   [Rescore] Skipping {output_filename}: {e}")
+
+    rescored = 0
+    changed = 0
+    for output_path, full_log in payloads:
+        global_hits = 0
+        global_samples = 0
+        # The derived fields as stored; every one of them is replaced below, never mutated.
+        before = [(tp.get("ground_truth"), tp.get("samples"), tp.get("advanced_analysis"), tp.get("pass_rate_percent"))
+                  for tp in full_log.get("timepoints_results", [])] + [full_log.get("global_summary")]
+        for timepoint_log in full_log.get("timepoints_results", []):
+            if timepoint_log.get("status") != "Success": continue
+            data = timepoint_log.get("extracted_data") or timepoint_log
+            timepoint_log["ground_truth"] = [normalize_action(x) for x in data["ground_truth"]]
+            outcomes = stored_outcomes(timepoint_log)
+            timepoint_log["samples"] = []
+            hit_count, valid_count = finish_timepoint(timepoint_log, outcomes)
+            global_hits += hit_count
+            global_samples += valid_count
+            rescored += 1
+        full_log["global_summary"] = global_summary(global_hits, global_samples)
+        after = [(tp.get("ground_truth"), tp.get("samples"), tp.get("advanced_analysis"), tp.get("pass_rate_percent"))
+                 for tp in full_log.get("timepoints_results", [])] + [full_log.get("global_summary")]
+        # Writing the indented JSON is most of a rescore; files whose scores did not change are left alone.
+        if after == before: continue
+
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(full_log, f, indent=4, ensure_ascii=False)
+        meta = full_log.get("experiment_meta", {})
+        results_store.record(TASK, meta.get("model_name"), meta.get("replay_file"), full_log, output_path)
+        leaderboard.record(TASK, meta.get("model_name"), meta.get("replay_file"), full_log)
+        changed += 1
+    print(f"Rescored {rescored} timepoints in {len(payloads)} result files, {changed} files changed")
+
+async def process_replay_async(replay_path, contexts):
+    for model_config in MODELS_CONFIG:
+        try:
+            await run_single_experiment_async(replay_path, model_config, contexts)
+        except Exception as e:
+            print(f"Critical Error running {model_config['name']} on {os.path.basename(replay_path)}: {e}")
+
 def main():
+    parser = argparse.ArgumentParser(description="SAP: strategic action prediction benchmark")
+    replay_pool.add_pool_arguments(parser)
+    pipeline.add_pipeline_arguments(parser)
+    parser.add_argument("--grid-seconds", type=float,
+                        help="Ask at every N seconds of game time up to the last default timepoint instead of TIME_POINTS")
+    parser.add_argument("--rescore", action="store_true",
+                        help="Re-score the stored results in the output folder instead of running experiments")
+    args = parser.parse_args()
+
+    global TIME_POINTS
+    if args.grid_seconds:
+        TIME_POINTS = time_point_grid(args.grid_seconds, max(TIME_POINTS))
+        print(f"Timepoint grid: {len(TIME_POINTS)} points every {args.grid_seconds:g}s")
+    # Bound to the timepoints explicitly so worker processes do not depend on the module global.
+    extract = partial(extract_game_contexts, minutes=TIME_POINTS)
+
+    if args.rescore:
+        rescore_results(OUTPUT_FOLDER)
+        leaderboard.flush()
+        return
+
     if not os.path.exists(OUTPUT_FOLDER):
         os.makedirs(OUTPUT_FOLDER)
         print(f"Created output directory: {OUTPUT_FOLDER}")
@@ -334,15 +674,33 @@ def main():
 
     print(f"Found {len(replay_files)} replays. Models to test: {len(MODELS_CONFIG)}")
 
-    for replay_file in replay_files:
-        replay_path = os.path.join(REPLAY_FOLDER, replay_file)
+    replay_paths = [os.path.join(REPLAY_FOLDER, f) for f in replay_files]
+    pending = [p for p in replay_paths if any(not os.path.exists(result_path(p, m)) for m in MODELS_CONFIG)]
+    if len(pending) < len(replay_paths):
+        print(f"   [Skip] {len(replay_paths) - len(pending)} replays already have results for every model")
+
+    if args.pipeline:
+        pipeline.run(pending, extract, process_replay_async, args.workers, args.queue_depth,
+                     args.max_tasks_per_child)
+        llm_clients.print_connection_stats()
+        llm_clients.close_all()
+        leaderboard.flush()
+        print("\nAll experiments completed!")
+        return
+
+    parsed = replay_pool.iter_parsed(pending, extract, args.workers, args.max_tasks_per_child)
+    for replay_path, contexts in parsed:
+        replay_file = os.path.basename(replay_path)
         for model_config in MODELS_CONFIG:
             try:
-                run_single_experiment(replay_path, model_config)
+                run_single_experiment(replay_path, model_config, contexts)
             except Exception as e:
                 print(f"Critical Error running {model_config['name']} on {replay_file}: {e}")
                 continue
 
+    llm_clients.print_connection_stats()
+    llm_clients.close_all()
+    leaderboard.flush()
     print("\nAll experiments completed!")
 
 if __name__ == "__main__":
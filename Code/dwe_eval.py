@@ -0,0 +1,225 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+import replay_cache
+import results_store
+
+# Scores DWE win-probability curves against the replay outcome. Every prediction of every result
+# file becomes one row of flat arrays (model, replay, time, p, label); each metric is then a few
+# array reductions grouped by model, so the corpus is scored without a per-file loop.
+RESULTS_FOLDER = "./experiment_results"
+REPLAY_FOLDER = "./replays"
+CALIBRATION_BINS = 10
+TIME_BUCKET_EDGES = (300, 600, 900, 1200)   # seconds; the last bucket is open-ended
+LOG_LOSS_EPS = 1e-6
+
+
+def load_curves(results_folder):
+    curves = []
+    for path in results_store.result_files("DWE", results_folder):
+        try:
+            with open(path, encoding="utf-8") as f:
+                payload = json.load(f)
+            model, replay = results_store.identify("DWE", path, payload)
+        except (OSError, ValueError, KeyError, IndexError, TypeError) as e:
+            print(f"   [DWE Eval] Skipping {os.path.basename(path)}: {e}")
+            continue
+        if payload:
+            curves.append((model, replay, payload))
+    return curves
+
+
+def load_winners(replay_folder, replays):
+    # replay -> (pid of the first player, pids of the winning team); replays without a recorded
+    # winner are left out. Parsed replays come from the replay cache, so reruns do not decode again.
+    winners = {}
+    for replay in replays:
+        replay_path = os.path.join(replay_folder, replay + ".SC2Replay")
+        try:
+            parsed = replay_cache.load_replay(replay_path, profile="tracker-only")
+        except Exception as e:
+            print(f"   [DWE Eval] No outcome for {replay}: {e}")
+            continue
+        if parsed.winner is None or not parsed.players:
+            continue
+        winners[replay] = (parsed.players[0].pid, {p.pid for p in parsed.winner.players})
+    return winners
+
+
+def build_arrays(curves, winners, include_padded=False):
+    models = sorted({model for model, _, _ in curves})
+    replays = sorted({replay for _, replay, _ in curves})
+    model_index = {model: i for i, model in enumerate(models)}
+    replay_index = {replay: i for i, replay in enumerate(replays)}
+    columns = {"model": [], "replay": [], "time": [], "p": [], "label": []}
+    for model, replay, payload in curves:
+        if replay not in winners: continue
+        first_pid, winner_pids = winners[replay]
+        rows = [r for r in payload if include_padded or not r.get("padded", False)]
+        columns["model"].extend([model_index[model]] * len(rows))
+        columns["replay"].extend([replay_index[replay]] * len(rows))
+        columns["time"].extend(r["game_time_seconds"] for r in rows)
+        columns["p"].extend(r["p1_win_rate"] for r in rows)
+        columns["label"].extend((r.get("player1_id") or first_pid) in winner_pids for r in rows)
+    arrays = {
+        "model": np.array(columns["model"], dtype=np.int64),
+        "replay": np.array(columns["replay"], dtype=np.int64),
+        "time": np.array(columns["time"], dtype=np.float64),
+        "p": np.clip(np.array(columns["p"], dtype=np.float64), 0.0, 1.0),
+        "label": np.array(columns["label"], dtype=np.float64),
+    }
+    return models, replays, arrays
+
+
+def _mean_by(group, values, n_groups):
+    counts = np.bincount(group, minlength=n_groups)
+    sums = np.bincount(group, weights=values, minlength=n_groups)
+    return np.divide(sums, counts, out=np.full(n_groups, np.nan), where=counts > 0)
+
+
+def calibration_error(model, p, label, n_models):
+    # Expected calibration error over equal-width probability bins.
+    bins = np.minimum((p * CALIBRATION_BINS).astype(np.int64), CALIBRATION_BINS - 1)
+    cell = model * CALIBRATION_BINS + bins
+    size = n_models * CALIBRATION_BINS
+    counts = np.bincount(cell, minlength=size)
+    gap = np.abs(np.bincount(cell, weights=p, minlength=size) - np.bincount(cell, weights=label, minlength=size))
+    # sum over bins of (n_b / N) * |mean p_b - mean y_b| == sum_b |sum p_b - sum y_b| / N
+    totals = counts.reshape(n_models, CALIBRATION_BINS).sum(axis=1)
+    return np.divide(gap.reshape(n_models, CALIBRATION_BINS).sum(axis=1), totals,
+                     out=np.full(n_models, np.nan), where=totals > 0)
+
+
+def roc_auc(model, p, label, n_models):
+    # Mann-Whitney form: ranks are taken within each model, ties share their average rank.
+    order = np.lexsort((p, model))
+    m, ps, ys = model[order], p[order], label[order]
+    new_value = np.ones(len(ps), dtype=bool)
+    new_value[1:] = (ps[1:] != ps[:-1]) | (m[1:] != m[:-1])
+    starts = np.flatnonzero(new_value)
+    ends = np.append(starts[1:], len(ps))
+    model_start = np.searchsorted(m, np.arange(n_models))
+    # 1-based rank within the model, averaged over each run of equal values.
+    run_rank = (starts + ends + 1) / 2.0 - model_start[m[starts]]
+    ranks = np.repeat(run_rank, ends - starts)
+    positives = np.bincount(m, weights=ys, minlength=n_models)
+    negatives = np.bincount(m, minlength=n_models) - positives
+    rank_sum = np.bincount(m, weights=ranks * ys, minlength=n_models)
+    pairs = positives * negatives
+    return np.divide(rank_sum - positives * (positives + 1) / 2, pairs, out=np.full(n_models, np.nan), where=pairs > 0)
+
+
+def convergence(model, replay, t, correct, n_models, n_replays):
+    # Per (model, replay) curve: the first time after which every prediction is on the winner's
+    # side, also as a fraction of the curve length. Curves that end on the wrong side never converge.
+    curve = model * n_replays + replay
+    order = np.lexsort((t, curve))
+    curve, t, correct = curve[order], t[order], correct[order]
+    starts = np.flatnonzero(np.diff(curve, prepend=-1) != 0)
+    ends = np.append(starts[1:], len(curve))
+    index = np.arange(len(curve))
+    last_wrong = np.maximum.reduceat(np.where(correct, -1, index), starts)
+    first_settled = np.maximum(last_wrong + 1, starts)
+    converged = first_settled < ends
+    settled_time = np.where(converged, t[np.minimum(first_settled, len(t) - 1)], np.nan)
+    span = t[ends - 1]
+    fraction = np.divide(settled_time, span, out=np.zeros(len(starts)), where=span > 0)
+    return curve[starts] // n_replays, converged, settled_time, np.where(converged, fraction, np.nan)
+
+
+def time_bucket_labels():
+    edges = (0,) + TIME_BUCKET_EDGES
+    labels = [f"{lo // 60}-{hi // 60}m" for lo, hi in zip(edges, edges[1:])]
+    return labels + [f"{edges[-1] // 60}m+"]
+
+
+def score(models, replays, arrays):
+    n_models, n_replays = len(models), len(replays)
+    model, p, y, t = arrays["model"], arrays["p"], arrays["label"], arrays["time"]
+    if len(p) == 0:
+        return {}
+    correct = (p > 0.5) == (y == 1)   # 0.5 is no call and counts as wrong
+
+    q = np.clip(p, LOG_LOSS_EPS, 1 - LOG_LOSS_EPS)
+    brier = _mean_by(model, (p - y) ** 2, n_models)
+    log_loss = _mean_by(model, -(y * np.log(q) + (1 - y) * np.log(1 - q)), n_models)
+    accuracy = _mean_by(model, correct.astype(np.float64), n_models)
+    ece = calibration_error(model, p, y, n_models)
+    auc = roc_auc(model, p, y, n_models)
+
+    n_buckets = len(TIME_BUCKET_EDGES) + 1
+    bucket = np.searchsorted(np.array(TIME_BUCKET_EDGES, dtype=np.float64), t, side="right")
+    bucket_accuracy = _mean_by(model * n_buckets + bucket, correct.astype(np.float64), n_models * n_buckets)
+    bucket_accuracy = bucket_accuracy.reshape(n_models, n_buckets)
+
+    curve_model, converged, settled_time, settled_fraction = convergence(
+        model, arrays["replay"], t, correct, n_models, n_replays)
+    curves = np.bincount(curve_model, minlength=n_models)
+    converged_share = np.divide(np.bincount(curve_model, weights=converged, minlength=n_models), curves,
+                                out=np.full(n_models, np.nan), where=curves > 0)
+
+    labels = time_bucket_labels()
+    report = {}
+    for i, name in enumerate(models):
+        if not curves[i]: continue
+        mine = curve_model == i
+        settled = converged[mine]
+        report[name] = {
+            "curves": int(curves[i]),
+            "points": int(np.count_nonzero(model == i)),
+            "brier": round(float(brier[i]), 4),
+            "log_loss": round(float(log_loss[i]), 4),
+            "ece": round(float(ece[i]), 4),
+            "auc": None if np.isnan(auc[i]) else round(float(auc[i]), 4),
+            "accuracy": round(float(accuracy[i]), 4),
+            "accuracy_by_time": {label: None if np.isnan(v) else round(float(v), 4)
+                                 for label, v in zip(labels, bucket_accuracy[i])},
+            "converged_share": round(float(converged_share[i]), 4),
+            "median_convergence_seconds": float(np.median(settled_time[mine][settled])) if settled.any() else None,
+            "median_convergence_fraction": round(float(np.median(settled_fraction[mine][settled])), 4) if settled.any() else None,
+        }
+    return report
+
+
+def print_report(report):
+    print(f"{'Model':<24}{'Curves':>7}{'Brier':>8}{'LogLoss':>9}{'ECE':>7}{'AUC':>7}{'Acc':>7}{'Conv%':>7}{'Conv(s)':>9}")
+    for name, r in sorted(report.items(), key=lambda item: item[1]["brier"]):
+        auc = f"{r['auc']:.3f}" if r["auc"] is not None else "-"
+        conv = f"{r['median_convergence_seconds']:.0f}" if r["median_convergence_seconds"] is not None else "-"
+        print(f"{name or '<unnamed>':<24}{r['curves']:>7}{r['brier']:>8.3f}{r['log_loss']:>9.3f}{r['ece']:>7.3f}"
+              f"{auc:>7}{r['accuracy']:>7.1%}{r['converged_share']:>7.0%}{conv:>9}")
+        print("    accuracy by time: " + ", ".join(f"{label} {v:.0%}" if v is not None else f"{label} -"
+                                                   for label, v in r["accuracy_by_time"].items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score DWE win-probability curves against replay outcomes.")
+    parser.add_argument("--results", default=RESULTS_FOLDER)
+    parser.add_argument("--replays", default=REPLAY_FOLDER)
+    parser.add_argument("--include-padded", action="store_true",
+                        help="Also score data points the model never answered (padded with 0.5)")
+    parser.add_argument("-o", "--output", help="Write the per-model report as JSON")
+    args = parser.parse_args()
+
+    curves = load_curves(args.results)
+    winners = load_winners(args.replays, sorted({replay for _, replay, _ in curves}))
+    t0 = time.perf_counter()
+    models, replays, arrays = build_arrays(curves, winners, args.include_padded)
+    report = score(models, replays, arrays)
+    elapsed = time.perf_counter() - t0
+
+    print(f"Scored {len(arrays['p'])} predictions from {len(curves)} result files "
+          f"({len(winners)} replays with a known winner) in {elapsed:.2f}s\n")
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {os.path.abspath(args.output)}")
+
+
+if __name__ == "__main__":
+    main()
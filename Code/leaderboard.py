@@ -0,0 +1,294 @@
+import argparse
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+
+import results_store
+
+# Leaderboard metrics computed from the result files, written as the leaderboard.json that index.html
+# overlays on its built-in table. Each (model, replay) result is reduced to a small counter vector;
+# per-model totals are sums of those vectors, so a new result updates one row instead of a rescan.
+# Only metrics whose inputs the task scripts store are computed: the SAP columns from sap_results and
+# the DWP columns except DWP_PSS from dwp_results. KEI has no task script, ICD and BSS results are in
+# the SAP format rather than the one their columns are defined on, and the DWE and CSP results carry
+# no ground truth; those columns, and DWP_PSS, keep the Table 2 values embedded in the page, which
+# lists the recomputed ones from "metrics".
+OUTPUT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "leaderboard.json")
+# Opt-in like SC2_RESULTS_DB: with SC2_LEADERBOARD=leaderboard.json the task scripts fold every result
+# they write into that file (see record() and flush()). Without it the leaderboard is only built by the
+# CLI below.
+LIVE_PATH = os.environ.get("SC2_LEADERBOARD", "")
+# A lock file older than this was left behind by a writer that was killed mid-write.
+LOCK_STALE_SECONDS = 30
+DWP_MINUTES = (2, 4, 6, 8, 10)
+EARLY_MINUTES = (2, 4)
+LATE_MINUTES = (8, 10)
+
+_lock = threading.Lock()
+_pending = []   # (task, model, replay, counters) recorded by this process, not yet in LIVE_PATH
+
+
+def sap_counters(payload):
+    # samples, hits, predictions made, correct predictions, ground-truth slots (actions x samples):
+    # the sums LEADERBOARD_QUERIES["sap"] takes over the same per-timepoint counts in the results store.
+    counters = np.zeros(5)
+    for tp in payload.get("timepoints_results", []):
+        if tp.get("status") != "Success": continue
+        samples, hits, _, made, correct, gt_size = results_store.sap_timepoint_counts(tp)
+        counters += (samples, hits, made, correct, gt_size * samples)
+    return counters
+
+
+def dwp_counters(payload):
+    # correct predictions per checkpoint minute, then predictions per checkpoint minute
+    counters = np.zeros(2 * len(DWP_MINUTES))
+    for p in payload.get("predictions", []):
+        if p["time_min"] not in DWP_MINUTES: continue
+        i = DWP_MINUTES.index(p["time_min"])
+        counters[i] += bool(p["is_correct"])
+        counters[len(DWP_MINUTES) + i] += 1
+    return counters
+
+
+def _ratio(num, den):
+    return np.divide(num, den, out=np.zeros_like(num, dtype=float), where=den > 0)
+
+
+def sap_metrics(totals):
+    samples, hits, made, correct, slots = totals.T
+    precision, recall = _ratio(correct, made), _ratio(correct, slots)
+    return {
+        "SAP_PSR": 100 * _ratio(hits, samples),
+        "SAP_Prec": precision,
+        "SAP_Rec": recall,
+        "SAP_F1": _ratio(2 * precision * recall, precision + recall),
+    }
+
+
+def dwp_metrics(totals):
+    n = len(DWP_MINUTES)
+    correct, count = totals[:, :n], totals[:, n:]
+    pick = lambda minutes: [DWP_MINUTES.index(m) for m in minutes]
+    metrics = {f"DWP_Acc{m}": _ratio(correct[:, i], count[:, i]) for i, m in enumerate(DWP_MINUTES)}
+    metrics["DWP_Acc"] = 100 * _ratio(correct.sum(axis=1), count.sum(axis=1))
+    metrics["DWP_EGF"] = _ratio(correct[:, pick(EARLY_MINUTES)].sum(axis=1), count[:, pick(EARLY_MINUTES)].sum(axis=1))
+    metrics["DWP_LGR"] = _ratio(correct[:, pick(LATE_MINUTES)].sum(axis=1), count[:, pick(LATE_MINUTES)].sum(axis=1))
+    return metrics
+
+
+TASKS = {
+    "SAP": (sap_counters, sap_metrics, 5),
+    "DWP": (dwp_counters, dwp_metrics, 2 * len(DWP_MINUTES)),
+}
+
+
+class Aggregator:
+    def __init__(self):
+        self.models = {task: [] for task in TASKS}
+        self.totals = {task: np.zeros((0, TASKS[task][2])) for task in TASKS}
+        self.results = {task: {} for task in TASKS}   # "model\treplay" -> counter vector
+
+    def _row(self, task, model):
+        if model not in self.models[task]:
+            self.models[task].append(model)
+            self.totals[task] = np.vstack([self.totals[task], np.zeros(TASKS[task][2])])
+        return self.models[task].index(model)
+
+    def add(self, task, model, replay, payload):
+        self.add_counters(task, model, replay, TASKS[task][0](payload))
+
+    def add_counters(self, task, model, replay, counters):
+        # A result seen before (a rerun) replaces its earlier contribution.
+        key = f"{model}\t{replay}"
+        previous = self.results[task].get(key)
+        row = self._row(task, model)
+        self.totals[task][row] += counters - (previous if previous is not None else 0)
+        self.results[task][key] = counters
+
+    def rebuild(self, task, entries):
+        # entries: (model, replay, payload); totals are summed in one scatter-add.
+        self.models[task], self.totals[task], self.results[task] = [], np.zeros((0, TASKS[task][2])), {}
+        if not entries:
+            return
+        for model, replay, payload in entries:
+            self.results[task][f"{model}\t{replay}"] = TASKS[task][0](payload)
+        keys = list(self.results[task])
+        self.models[task] = sorted({key.split("\t", 1)[0] for key in keys})
+        rows = np.array([self.models[task].index(key.split("\t", 1)[0]) for key in keys])
+        self.totals[task] = np.zeros((len(self.models[task]), TASKS[task][2]))
+        np.add.at(self.totals[task], rows, np.array([self.results[task][key] for key in keys]))
+
+    def metrics(self):
+        board = {}
+        for task, (_, compute, _) in TASKS.items():
+            if not self.models[task]: continue
+            for key, values in compute(self.totals[task]).items():
+                for model, value in zip(self.models[task], values):
+                    board.setdefault(model, {})[key] = round(float(value), 3)
+        return board
+
+    def coverage(self):
+        counts = {}
+        for task in TASKS:
+            for key in self.results[task]:
+                model = key.split("\t", 1)[0]
+                counts.setdefault(task, {}).setdefault(model, 0)
+                counts[task][model] += 1
+        return counts
+
+    def to_state(self):
+        return {task: {key: vector.tolist() for key, vector in self.results[task].items()} for task in TASKS}
+
+    @classmethod
+    def from_state(cls, state):
+        aggregator = cls()
+        for task, results in state.items():
+            if task not in TASKS: continue
+            aggregator.rebuild(task, [])
+            for key, vector in results.items():
+                row = aggregator._row(task, key.split("\t", 1)[0])
+                aggregator.totals[task][row] += vector
+                aggregator.results[task][key] = np.array(vector)
+        return aggregator
+
+
+def state_path(output_path):
+    return os.path.splitext(output_path)[0] + "_state.json"
+
+
+def load_results(task, folder):
+    entries = []
+    for path in results_store.result_files(task, folder):
+        try:
+            with open(path, encoding="utf-8") as f:
+                payload = json.load(f)
+            model, replay = results_store.identify(task, path, payload)
+        except (OSError, ValueError, KeyError, IndexError, TypeError) as e:
+            print(f"   [Leaderboard] Skipping {os.path.basename(path)}: {e}")
+            continue
+        entries.append((model, replay, payload))
+    return entries
+
+
+def write(aggregator, output_path):
+    models = aggregator.metrics()
+    board = {
+        "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "metrics": sorted({key for values in models.values() for key in values}),
+        "models": models,
+        "coverage": aggregator.coverage(),
+    }
+    for path, data in ((output_path, board), (state_path(output_path), aggregator.to_state())):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, path)
+    return board
+
+
+def load_aggregator(output_path):
+    path = state_path(output_path)
+    if not os.path.exists(path):
+        return Aggregator()
+    with open(path, encoding="utf-8") as f:
+        return Aggregator.from_state(json.load(f))
+
+
+def add_result(task, result_path, output_path=OUTPUT_PATH):
+    # Incremental update for one new (model, replay) result file.
+    with open(result_path, encoding="utf-8") as f:
+        payload = json.load(f)
+    model, replay = results_store.identify(task, result_path, payload)
+    with file_lock(output_path):
+        aggregator = load_aggregator(output_path)
+        aggregator.add(task, model, replay, payload)
+        return write(aggregator, output_path)
+
+
+@contextmanager
+def file_lock(path):
+    # Exclusive across processes and platforms: whoever creates the lock file holds it.
+    lock_path = path + ".lock"
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > LOCK_STALE_SECONDS:
+                    os.remove(lock_path)
+                    continue
+            except OSError:
+                continue
+            time.sleep(0.05)
+    try:
+        yield
+    finally:
+        os.close(fd)
+        os.remove(lock_path)
+
+
+def record(task, model, replay, payload):
+    # Called by the task scripts next to results_store.record; a no-op unless SC2_LEADERBOARD is set
+    # or for tasks without leaderboard metrics (ICD and BSS share the SAP script but not its columns).
+    # Only the counter vector is kept here; flush() writes the run's results in one update.
+    if not LIVE_PATH or task not in TASKS:
+        return
+    counters = TASKS[task][0](payload)
+    with _lock:
+        _pending.append((task, model, results_store.replay_key(replay), counters))
+
+
+def flush():
+    # Folds the recorded results into LIVE_PATH once per run. The file is re-read under a file lock, so
+    # runs sharing SC2_LEADERBOARD merge their results instead of overwriting each other's.
+    with _lock:
+        pending = _pending[:]
+        del _pending[:]
+    if not pending:
+        return
+    try:
+        with file_lock(LIVE_PATH):
+            aggregator = load_aggregator(LIVE_PATH)
+            for task, model, replay, counters in pending:
+                aggregator.add_counters(task, model, replay, counters)
+            write(aggregator, LIVE_PATH)
+    except (OSError, ValueError) as e:
+        print(f"   [Leaderboard] Could not add {len(pending)} results to {LIVE_PATH}: {e}")
+
+
+# The task scripts flush when they finish; this catches runs that end early.
+atexit.register(flush)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute leaderboard metrics from result files for index.html.")
+    parser.add_argument("-o", "--output", default=OUTPUT_PATH)
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_build = sub.add_parser("build", help="Recompute every metric from the result folders")
+    p_build.add_argument("--sap", default="./sap_results")
+    p_build.add_argument("--dwp", default="./dwp_results")
+    p_add = sub.add_parser("add", help="Fold one new result file into the existing leaderboard")
+    p_add.add_argument("task", choices=sorted(TASKS))
+    p_add.add_argument("result")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        aggregator = Aggregator()
+        for task, folder in (("SAP", args.sap), ("DWP", args.dwp)):
+            if os.path.isdir(folder):
+                aggregator.rebuild(task, load_results(task, folder))
+        board = write(aggregator, args.output)
+    else:
+        board = add_result(args.task, args.result, args.output)
+    print(f"Leaderboard for {len(board['models'])} models written to {os.path.abspath(args.output)}")
+
+
+if __name__ == "__main__":
+    main()
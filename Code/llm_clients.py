@@ -0,0 +1,202 @@
+import asyncio
+import threading
+import time
+from collections import deque
+
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+# Connection pool defaults; any model entry in MODELS_CONFIG may override them with
+# "pool_size", "keepalive_connections", "keepalive_expiry", "timeout" and "connect_timeout".
+POOL_MAX_CONNECTIONS = 32
+POOL_MAX_KEEPALIVE = 16
+KEEPALIVE_EXPIRY = 90.0
+REQUEST_TIMEOUT = 120.0
+CONNECT_TIMEOUT = 10.0
+
+_lock = threading.Lock()
+_clients = {}
+_async_clients = {}
+_stats = {}
+_limiters = {}
+
+
+class ConnectionStats:
+    def __init__(self):
+        self.requests = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+
+    # httpcore reports every new TCP connection through the request "trace" extension,
+    # so requests minus connections is the number of requests served on a kept-alive socket.
+    def trace(self, event_name, info):
+        if event_name == "connection.connect_tcp.complete":
+            with self._lock:
+                self.connections += 1
+
+    async def trace_async(self, event_name, info):
+        self.trace(event_name, info)
+
+    def on_request(self, request):
+        with self._lock:
+            self.requests += 1
+        request.extensions["trace"] = self.trace
+
+    async def on_request_async(self, request):
+        with self._lock:
+            self.requests += 1
+        request.extensions["trace"] = self.trace_async
+
+    def summary(self):
+        reused = max(self.requests - self.connections, 0)
+        return {
+            "requests": self.requests,
+            "connections_opened": self.connections,
+            "requests_on_reused_connections": reused,
+            "reuse_ratio": (reused / self.requests) if self.requests else 0.0,
+        }
+
+
+class TokenRateLimiter:
+    # Sliding one-minute window over the (estimated) tokens sent to one model. A request larger
+    # than the whole limit is let through on an empty window rather than blocking forever.
+    WINDOW_SECONDS = 60.0
+
+    def __init__(self, tokens_per_minute):
+        self.tokens_per_minute = tokens_per_minute
+        self.sent = deque()
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens):
+        # Books the tokens and returns 0, or returns the seconds until enough of the window expires.
+        now = time.monotonic()
+        with self._lock:
+            while self.sent and now - self.sent[0][0] >= self.WINDOW_SECONDS:
+                self.used -= self.sent.popleft()[1]
+            if not self.sent or self.used + tokens <= self.tokens_per_minute:
+                self.sent.append((now, tokens))
+                self.used += tokens
+                return 0.0
+            excess = self.used + tokens - self.tokens_per_minute
+            for sent_at, sent_tokens in self.sent:
+                excess -= sent_tokens
+                if excess <= 0:
+                    return max(sent_at + self.WINDOW_SECONDS - now, 0.01)
+            return self.WINDOW_SECONDS
+
+    def acquire(self, tokens):
+        delay = self._reserve(tokens)
+        while delay > 0:
+            time.sleep(delay)
+            delay = self._reserve(tokens)
+
+    async def acquire_async(self, tokens):
+        delay = self._reserve(tokens)
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = self._reserve(tokens)
+
+
+def rate_limiter(config):
+    # Shared by every caller of the same model; None unless the entry sets "tokens_per_minute".
+    tokens_per_minute = config.get("tokens_per_minute")
+    if not tokens_per_minute:
+        return None
+    key = (config["name"], config["model_id"], tokens_per_minute)
+    with _lock:
+        if key not in _limiters:
+            _limiters[key] = TokenRateLimiter(tokens_per_minute)
+        return _limiters[key]
+
+
+def _pool_settings(config):
+    limits = httpx.Limits(
+        max_connections=config.get("pool_size", POOL_MAX_CONNECTIONS),
+        max_keepalive_connections=config.get("keepalive_connections", POOL_MAX_KEEPALIVE),
+        keepalive_expiry=config.get("keepalive_expiry", KEEPALIVE_EXPIRY),
+    )
+    timeout = httpx.Timeout(config.get("timeout", REQUEST_TIMEOUT), connect=config.get("connect_timeout", CONNECT_TIMEOUT))
+    return limits, timeout
+
+
+def _client_key(config):
+    return (config["name"], config["base_url"], config["api_key"], config.get("pool_size"),
+            config.get("keepalive_connections"), config.get("keepalive_expiry"), config.get("timeout"),
+            config.get("connect_timeout"))
+
+
+def _stats_for(config):
+    if config["name"] not in _stats:
+        _stats[config["name"]] = ConnectionStats()
+    return _stats[config["name"]]
+
+
+def get_client(config):
+    key = _client_key(config)
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            stats = _stats_for(config)
+            limits, timeout = _pool_settings(config)
+            http_client = httpx.Client(limits=limits, timeout=timeout, follow_redirects=True,
+                                       event_hooks={"request": [stats.on_request]})
+            client = OpenAI(api_key=config["api_key"], base_url=config["base_url"], timeout=timeout,
+                            http_client=http_client)
+            _clients[key] = client
+    return client
+
+
+def get_async_client(config):
+    # Async connections belong to the event loop that opened them, so async clients are
+    # pooled per running loop; call close_async_clients() before that loop finishes.
+    loop = asyncio.get_running_loop()
+    key = (_client_key(config), id(loop))
+    with _lock:
+        client = _async_clients.get(key)
+        if client is None:
+            stats = _stats_for(config)
+            limits, timeout = _pool_settings(config)
+            http_client = httpx.AsyncClient(limits=limits, timeout=timeout, follow_redirects=True,
+                                            event_hooks={"request": [stats.on_request_async]})
+            client = AsyncOpenAI(api_key=config["api_key"], base_url=config["base_url"], timeout=timeout,
+                                 http_client=http_client)
+            _async_clients[key] = client
+    return client
+
+
+async def close_async_clients():
+    loop_id = id(asyncio.get_running_loop())
+    with _lock:
+        keys = [key for key in _async_clients if key[1] == loop_id]
+        clients = [_async_clients.pop(key) for key in keys]
+    for client in clients:
+        await client.close()
+
+
+def run_async(coro):
+    # asyncio.run() for code that uses get_async_client(); the loop's clients are closed before it ends.
+    async def runner():
+        try:
+            return await coro
+        finally:
+            await close_async_clients()
+    return asyncio.run(runner())
+
+
+def close_all():
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        client.close()
+
+
+def connection_stats():
+    return {name: stats.summary() for name, stats in _stats.items()}
+
+
+def print_connection_stats():
+    for name, summary in connection_stats().items():
+        print(f"[Connections] {name or '<unnamed>'}: {summary['requests']} requests over "
+              f"{summary['connections_opened']} connections ({summary['reuse_ratio']:.0%} reused)")
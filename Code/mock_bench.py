@@ -0,0 +1,142 @@
+import argparse
+import glob
+import importlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import llm_clients
+import mock_llm_server
+import replay_cache
+import response_cache
+import synthetic_replay
+
+# Runs the task scripts end to end against mock_llm_server: every task's MODELS_CONFIG is pointed at
+# an in-process server and its main() is run in a scratch working directory, on synthetic replays or
+# on copies of real ones. Reports result files and requests per second for each task.
+TASKS = ("SAP", "DWE", "DWP", "CSP")
+# Result files of each task, relative to the working directory the task ran in.
+RESULT_PATTERNS = {
+    "SAP": "sap_results/*.json",
+    "DWE": "experiment_results/*.json",
+    "DWP": "dwp_results/*.json",
+    "CSP": "csp_*.json",
+}
+MOCK_MODEL_NAME = "mock"
+
+
+def mock_model(base_url):
+    return {
+        "name": MOCK_MODEL_NAME,
+        "api_key": "mock",
+        "base_url": base_url,
+        "model_id": "mock",
+        "temperature": 0.7,
+    }
+
+
+def result_files(task, workdir):
+    return sorted(glob.glob(os.path.join(workdir, RESULT_PATTERNS[task])))
+
+
+def prepare_replays(workdir, count, replay_folder=None, minutes=15, units_per_player=300):
+    target = os.path.join(workdir, "replays")
+    if replay_folder:
+        os.makedirs(target, exist_ok=True)
+        names = sorted(f for f in os.listdir(replay_folder) if f.endswith(".SC2Replay"))[:count]
+        for name in names:
+            shutil.copy(os.path.join(replay_folder, name), target)
+        return len(names)
+    return len(synthetic_replay.write_corpus(target, count, minutes=minutes, units_per_player=units_per_player))
+
+
+def run_task(task, base_url, task_args=()):
+    module = importlib.import_module(task)
+    module.MODELS_CONFIG = [mock_model(base_url)]
+    argv = sys.argv
+    sys.argv = [f"{task}.py", *task_args]
+    try:
+        t0 = time.perf_counter()
+        module.main()
+        return time.perf_counter() - t0
+    finally:
+        sys.argv = argv
+
+
+def run_bench(tasks, workdir, count=3, replay_folder=None, task_args=(), **server_settings):
+    # Returns {task: {"results", "seconds", "requests"}}. The replay cache lives in the working
+    # directory (synthetic replays exist only there) and the response cache is bypassed so every
+    # request reaches the server.
+    workdir = os.path.abspath(workdir)
+    os.makedirs(workdir, exist_ok=True)
+    cwd = os.getcwd()
+    saved = (replay_cache.CACHE_DIR, replay_cache.CACHE_ENABLED, response_cache.CACHE_MODE,
+             os.environ.get("SC2_REPLAY_CACHE_DIR"))
+    server, base_url = mock_llm_server.start_server(**server_settings)
+    report = {}
+    try:
+        os.chdir(workdir)
+        replay_cache.CACHE_DIR = os.environ["SC2_REPLAY_CACHE_DIR"] = os.path.join(workdir, ".replay_cache")
+        replay_cache.CACHE_ENABLED = True
+        response_cache.CACHE_MODE = "off"
+        replays = prepare_replays(workdir, count, replay_folder)
+        print(f"Mock server at {base_url}, {replays} replays in {workdir}")
+
+        for task in tasks:
+            before = server.stats.by_task.get(task, 0)
+            seconds = run_task(task, base_url, task_args)
+            report[task] = {
+                "results": len(result_files(task, workdir)),
+                "seconds": seconds,
+                "requests": server.stats.by_task.get(task, 0) - before,
+            }
+    finally:
+        os.chdir(cwd)
+        replay_cache.CACHE_DIR, replay_cache.CACHE_ENABLED, response_cache.CACHE_MODE, cache_env = saved
+        if cache_env is None:
+            os.environ.pop("SC2_REPLAY_CACHE_DIR", None)
+        else:
+            os.environ["SC2_REPLAY_CACHE_DIR"] = cache_env
+        llm_clients.close_all()
+        server.shutdown()
+        server.server_close()
+    return report
+
+
+def print_report(report):
+    print(f"\n{'Task':<6}{'Results':>9}{'Seconds':>10}{'Results/s':>11}{'Requests':>10}{'Requests/s':>12}")
+    for task, r in report.items():
+        seconds = max(r["seconds"], 1e-9)
+        print(f"{task:<6}{r['results']:>9}{r['seconds']:>10.2f}{r['results'] / seconds:>11.2f}"
+              f"{r['requests']:>10}{r['requests'] / seconds:>12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the task scripts end to end against the mock LLM server.")
+    parser.add_argument("--tasks", nargs="+", default=list(TASKS), choices=TASKS)
+    parser.add_argument("--count", type=int, default=3, help="Number of replays to run")
+    parser.add_argument("--replays", help="Copy real replays from this folder instead of generating synthetic ones")
+    parser.add_argument("--workdir", help="Keep the results in this folder (default: a temporary folder)")
+    parser.add_argument("--latency-mean-ms", type=float, default=mock_llm_server.DEFAULT_SETTINGS["latency_mean_ms"])
+    parser.add_argument("--latency-spread-ms", type=float, default=mock_llm_server.DEFAULT_SETTINGS["latency_spread_ms"])
+    parser.add_argument("--error-rate", type=float, default=mock_llm_server.DEFAULT_SETTINGS["error_rate"])
+    parser.add_argument("--workers", type=int, default=1, help="Replay parsing processes passed to every task")
+    parser.add_argument("--pipeline", action="store_true", help="Run every task with --pipeline")
+    args = parser.parse_args()
+
+    task_args = ["--workers", str(args.workers)] + (["--pipeline"] if args.pipeline else [])
+    workdir = args.workdir or tempfile.mkdtemp(prefix="sc2_mock_bench_")
+    try:
+        report = run_bench(args.tasks, workdir, args.count, args.replays, task_args,
+                           latency_mean_ms=args.latency_mean_ms, latency_spread_ms=args.latency_spread_ms,
+                           error_rate=args.error_rate)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    print_report(report)
+
+
+if __name__ == "__main__":
+    main()
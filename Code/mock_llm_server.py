@@ -0,0 +1,309 @@
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Offline stand-in for an OpenAI-compatible /v1/chat/completions endpoint. Point a model entry's
+# "base_url" at http://127.0.0.1:<port>/v1 to benchmark the task scripts without network or quota.
+# mock_bench.py does that in-process for SAP, DWE, DWP and CSP and reports their throughput.
+DEFAULT_SETTINGS = {
+    "latency_dist": "lognormal",   # fixed | uniform | normal | lognormal | exponential
+    "latency_mean_ms": 0.0,
+    "latency_spread_ms": 0.0,
+    "error_rate": 0.0,             # fraction of requests answered with HTTP 500
+    "rate_limit_rps": 0.0,         # token bucket refill rate, 0 disables 429s
+    "rate_limit_burst": 10,
+    "seed": 0,
+}
+
+# Tasks are recognised by the role line of their system prompt.
+TASK_ROLES = {
+    "SAP": "Macro-management Logic Planner",
+    "DWE": "Real-time Momentum Analyst",
+    "DWP": "Strategic Forecasting Expert",
+    "CSP": "Battlefield Conflict Analyst",
+}
+CONFLICT_GAP_SECONDS = 20
+
+
+def sample_latency(settings, rng):
+    mean = settings["latency_mean_ms"] / 1000.0
+    spread = settings["latency_spread_ms"] / 1000.0
+    if mean <= 0:
+        return 0.0
+    dist = settings["latency_dist"]
+    if dist == "fixed":
+        return mean
+    if dist == "uniform":
+        return rng.uniform(max(mean - spread, 0.0), mean + spread)
+    if dist == "normal":
+        return max(rng.gauss(mean, spread), 0.0)
+    if dist == "exponential":
+        return rng.expovariate(1.0 / mean)
+    # Lognormal with the requested mean and standard deviation, the usual shape of API latency.
+    sigma2 = math.log(1.0 + (spread / mean) ** 2)
+    return rng.lognormvariate(math.log(mean) - sigma2 / 2, math.sqrt(sigma2))
+
+
+def detect_task(system_prompt):
+    for task, role in TASK_ROLES.items():
+        if role in system_prompt:
+            return task
+    return None
+
+
+def sap_response(prompt, rng):
+    match = re.search(r"Select actions ONLY from: \[(.*?)\]", prompt)
+    whitelist = [a.strip() for a in match.group(1).split(",") if a.strip()] if match else []
+    predictions = rng.sample(whitelist, min(len(whitelist), rng.randint(1, 4)))
+    return json.dumps({"predictions": predictions, "analysis": "Mock forecast."})
+
+
+def dwe_response(prompt, rng):
+    match = re.search(r"Input Data \((\d+) timestamps\)", prompt)
+    count = int(match.group(1)) if match else 0
+    armies = re.findall(r"Army\((\d+(?:\.\d+)?)\)[^|\n]*\|[^\n]*?Army\((\d+(?:\.\d+)?)\)", prompt)
+    rates = []
+    for i in range(count):
+        diff = (float(armies[i][0]) - float(armies[i][1])) if i < len(armies) else 0.0
+        p = 1.0 / (1.0 + math.exp(-diff / 2000.0)) + rng.uniform(-0.05, 0.05)
+        rates.append(round(min(max(p, 0.0), 1.0), 3))
+    return json.dumps(rates)
+
+
+def dwp_response(prompt, rng):
+    pids = re.findall(r"\[Player ID: (\w+)\]", prompt)
+    return rng.choice(pids) if pids else "1"
+
+
+def csp_response(prompt, rng):
+    match = re.search(r"Data: (\[.*?\]) \.\.\. \(truncated", prompt, re.DOTALL)
+    try:
+        events = json.loads(match.group(1)) if match else []
+    except ValueError:
+        events = []
+
+    episodes = []
+    for event in sorted(events, key=lambda e: e.get("second", 0)):
+        if episodes and event.get("second", 0) - episodes[-1][-1].get("second", 0) <= CONFLICT_GAP_SECONDS:
+            episodes[-1].append(event)
+        else:
+            episodes.append([event])
+
+    conflicts = []
+    for episode in episodes:
+        xs = [e.get("x") or 0 for e in episode]
+        ys = [e.get("y") or 0 for e in episode]
+        intensity = "High" if len(episode) >= 20 else "Medium" if len(episode) >= 5 else "Low"
+        conflicts.append({
+            "start": episode[0].get("second", 0),
+            "end": episode[-1].get("second", 0),
+            "region": [round(sum(xs) / len(xs)), round(sum(ys) / len(ys))],
+            "intensity": intensity,
+        })
+    return json.dumps({"conflicts": conflicts})
+
+
+GENERATORS = {"SAP": sap_response, "DWE": dwe_response, "DWP": dwp_response, "CSP": csp_response}
+
+
+def generate_content(task, prompt, rng):
+    generator = GENERATORS.get(task)
+    return generator(prompt, rng) if generator else "OK"
+
+
+def raw_prompt_key(seed, system_prompt, prompt):
+    return json.dumps([seed, system_prompt, prompt]).encode("utf-8")
+
+
+class ServerStats:
+    def __init__(self):
+        self.started = time.time()
+        self.requests = 0
+        self.completed = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.by_task = {}
+        self._lock = threading.Lock()
+
+    def add(self, field, task=None):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+            if task is not None:
+                self.by_task[task] = self.by_task.get(task, 0) + 1
+
+    def summary(self):
+        elapsed = time.time() - self.started
+        return {
+            "uptime_seconds": elapsed,
+            "requests": self.requests,
+            "completed": self.completed,
+            "errors": self.errors,
+            "rate_limited": self.rate_limited,
+            "by_task": dict(self.by_task),
+            "completed_per_second": (self.completed / elapsed) if elapsed > 0 else 0.0,
+        }
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self):
+        # Returns 0 when a request may proceed, otherwise the seconds until a token is available.
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out as separate writes; without TCP_NODELAY each keep-alive response
+    # waits on the client's delayed ACK (~40 ms), which would dominate every benchmark.
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, status, message, error_type, headers=None):
+        self.send_json(status, {"error": {"message": message, "type": error_type}}, headers)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            self.send_json(200, self.server.stats.summary())
+        else:
+            self.send_error_json(404, f"Unknown path {self.path}", "not_found")
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length)
+        if self.path.rstrip("/") not in ("/v1/chat/completions", "/chat/completions"):
+            self.send_error_json(404, f"Unknown path {self.path}", "not_found")
+            return
+        try:
+            body = json.loads(raw)
+            messages = body["messages"]
+        except (ValueError, KeyError):
+            self.send_error_json(400, "Request body must be JSON with a 'messages' list", "invalid_request_error")
+            return
+
+        server = self.server
+        system_prompt = "\n".join(m.get("content", "") for m in messages if m.get("role") == "system")
+        prompt = "\n".join(m.get("content", "") for m in messages if m.get("role") == "user")
+        task = detect_task(system_prompt)
+        server.stats.add("requests", task or "unknown")
+
+        if server.bucket is not None:
+            wait = server.bucket.take()
+            if wait > 0:
+                server.stats.add("rate_limited")
+                self.send_error_json(429, "Rate limit reached", "rate_limit_error",
+                                     {"Retry-After": str(max(1, math.ceil(wait)))})
+                return
+
+        with server.rng_lock:
+            latency = sample_latency(server.settings, server.rng)
+            fail = server.rng.random() < server.settings["error_rate"]
+        time.sleep(latency)
+        if fail:
+            server.stats.add("errors")
+            self.send_error_json(500, "Injected server error", "server_error")
+            return
+
+        # Answers depend only on the prompt, the choice index and the seed, so reruns are reproducible.
+        digest = hashlib.sha256(raw_prompt_key(server.settings["seed"], system_prompt, prompt)).hexdigest()
+        choices = []
+        for i in range(int(body.get("n", 1) or 1)):
+            rng = random.Random(f"{digest}:{i}")
+            content = generate_content(task, prompt, rng)
+            choices.append({"index": i, "finish_reason": "stop",
+                            "message": {"role": "assistant", "content": content}})
+
+        prompt_tokens = (len(system_prompt) + len(prompt)) // 4
+        completion_tokens = sum(len(c["message"]["content"]) for c in choices) // 4
+        server.stats.add("completed")
+        self.send_json(200, {
+            "id": f"mock-{digest[:16]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": choices,
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        })
+
+
+def make_server(host="127.0.0.1", port=0, **overrides):
+    settings = dict(DEFAULT_SETTINGS, **overrides)
+    server = ThreadingHTTPServer((host, port), MockHandler)
+    server.daemon_threads = True
+    server.settings = settings
+    server.stats = ServerStats()
+    server.rng = random.Random(settings["seed"])
+    server.rng_lock = threading.Lock()
+    server.bucket = TokenBucket(settings["rate_limit_rps"], settings["rate_limit_burst"]) if settings["rate_limit_rps"] > 0 else None
+    return server
+
+
+def start_server(host="127.0.0.1", port=0, **overrides):
+    # Serves from a daemon thread; returns the server and its base_url for MODELS_CONFIG.
+    server = make_server(host, port, **overrides)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible mock server for offline benchmarking.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency-dist", default=DEFAULT_SETTINGS["latency_dist"],
+                        choices=["fixed", "uniform", "normal", "lognormal", "exponential"])
+    parser.add_argument("--latency-mean-ms", type=float, default=DEFAULT_SETTINGS["latency_mean_ms"])
+    parser.add_argument("--latency-spread-ms", type=float, default=DEFAULT_SETTINGS["latency_spread_ms"],
+                        help="Half-width for uniform, standard deviation for normal and lognormal")
+    parser.add_argument("--error-rate", type=float, default=DEFAULT_SETTINGS["error_rate"])
+    parser.add_argument("--rate-limit-rps", type=float, default=DEFAULT_SETTINGS["rate_limit_rps"],
+                        help="Requests per second before answering 429 (0 disables)")
+    parser.add_argument("--rate-limit-burst", type=int, default=DEFAULT_SETTINGS["rate_limit_burst"])
+    parser.add_argument("--seed", type=int, default=DEFAULT_SETTINGS["seed"])
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, latency_dist=args.latency_dist, latency_mean_ms=args.latency_mean_ms,
+                         latency_spread_ms=args.latency_spread_ms, error_rate=args.error_rate,
+                         rate_limit_rps=args.rate_limit_rps, rate_limit_burst=args.rate_limit_burst, seed=args.seed)
+    print(f"Mock LLM server on http://{args.host}:{server.server_address[1]}/v1 (stats at /stats)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(server.stats.summary(), indent=2))
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
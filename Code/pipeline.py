@@ -0,0 +1,160 @@
+import asyncio
+import inspect
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import llm_clients
+from replay_pool import MAX_TASKS_PER_CHILD
+
+# Parsed replays waiting for the request stage. Memory is bounded by
+# workers (parses in flight) + QUEUE_DEPTH (parsed, queued) + 1 (being requested).
+QUEUE_DEPTH = 4
+_DONE = object()
+
+
+def add_pipeline_arguments(parser):
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Overlap replay parsing with LLM requests through a bounded queue")
+    parser.add_argument("--queue-depth", type=int, default=QUEUE_DEPTH,
+                        help="Parsed replays allowed to wait for the request stage")
+    return parser
+
+
+class PipelineStats:
+    def __init__(self, queue_depth):
+        self.queue_depth = queue_depth
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+        self.parsed = 0
+        self.parse_errors = 0
+        self.consumed = 0
+        self.producer_stall = 0.0   # parser output blocked because the queue was full
+        self.consumer_stall = 0.0   # request stage idle because the queue was empty
+        self.occupancy = []
+
+    def sample(self, queue):
+        self.occupancy.append(queue.qsize())
+
+    def summary(self):
+        samples = self.occupancy or [0]
+        return {
+            "elapsed_seconds": self.elapsed,
+            "replays_parsed": self.parsed,
+            "parse_errors": self.parse_errors,
+            "replays_processed": self.consumed,
+            "queue_depth": self.queue_depth,
+            "mean_occupancy": sum(samples) / len(samples),
+            "max_occupancy": max(samples),
+            "producer_stall_seconds": self.producer_stall,
+            "consumer_stall_seconds": self.consumer_stall,
+        }
+
+
+def print_pipeline_stats(stats):
+    s = stats.summary()
+    print(f"[Pipeline] {s['replays_processed']} replays in {s['elapsed_seconds']:.1f}s | queue {s['mean_occupancy']:.1f} avg / "
+          f"{s['max_occupancy']} max of {s['queue_depth']} | parser blocked {s['producer_stall_seconds']:.1f}s, "
+          f"requests starved {s['consumer_stall_seconds']:.1f}s")
+
+
+def _submit(loop, pool, extract_fn, replay_path):
+    # Bridges a multiprocessing.Pool result into an asyncio future on the pipeline's loop.
+    future = loop.create_future()
+
+    def resolve(setter, value):
+        if not future.done():
+            setter(value)
+
+    pool.apply_async(extract_fn, (replay_path,),
+                     callback=lambda r: loop.call_soon_threadsafe(resolve, future.set_result, r),
+                     error_callback=lambda e: loop.call_soon_threadsafe(resolve, future.set_exception, e))
+    return future
+
+
+async def _produce(replay_paths, submit, window, queue, stats):
+    # At most `window` parses run ahead of the queue, and results enter it in input order.
+    pending = deque()
+
+    async def deliver(replay_path, future):
+        try:
+            result = await future
+        except Exception as e:
+            stats.parse_errors += 1
+            print(f"[Parse Error] {os.path.basename(replay_path)}: {e}")
+            return
+        stats.parsed += 1
+        t0 = time.perf_counter()
+        await queue.put((replay_path, result))
+        stats.producer_stall += time.perf_counter() - t0
+        stats.sample(queue)
+
+    for replay_path in replay_paths:
+        pending.append((replay_path, submit(replay_path)))
+        if len(pending) >= window:
+            await deliver(*pending.popleft())
+    while pending:
+        await deliver(*pending.popleft())
+    await queue.put(_DONE)
+
+
+async def _consume(queue, consume_fn, stats):
+    is_async = inspect.iscoroutinefunction(consume_fn)
+    while True:
+        t0 = time.perf_counter()
+        item = await queue.get()
+        stats.consumer_stall += time.perf_counter() - t0
+        stats.sample(queue)
+        if item is _DONE:
+            return
+        replay_path, result = item
+        try:
+            if is_async:
+                await consume_fn(replay_path, result)
+            else:
+                # Synchronous request stages run off the loop so parsing keeps flowing meanwhile.
+                await asyncio.to_thread(consume_fn, replay_path, result)
+        except Exception as e:
+            print(f"[Pipeline Error] {os.path.basename(replay_path)}: {e}")
+        stats.consumed += 1
+
+
+async def run_async(replay_paths, extract_fn, consume_fn, workers=1, queue_depth=QUEUE_DEPTH,
+                    max_tasks_per_child=MAX_TASKS_PER_CHILD):
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=max(queue_depth, 1))
+    stats = PipelineStats(queue_depth)
+
+    if workers <= 1:
+        executor = ThreadPoolExecutor(max_workers=1)
+        submit = lambda replay_path: loop.run_in_executor(executor, extract_fn, replay_path)
+        shutdown = lambda: executor.shutdown(wait=True)
+    else:
+        pool = multiprocessing.Pool(workers, maxtasksperchild=max_tasks_per_child)
+        submit = lambda replay_path: _submit(loop, pool, extract_fn, replay_path)
+
+        def shutdown():
+            pool.terminate()
+            pool.join()
+
+    try:
+        await asyncio.gather(
+            _produce(replay_paths, submit, max(workers, 1), queue, stats),
+            _consume(queue, consume_fn, stats),
+        )
+    finally:
+        shutdown()
+        await llm_clients.close_async_clients()
+        stats.elapsed = time.perf_counter() - stats.started
+    return stats
+
+
+def run(replay_paths, extract_fn, consume_fn, workers=1, queue_depth=QUEUE_DEPTH,
+        max_tasks_per_child=MAX_TASKS_PER_CHILD):
+    # consume_fn(replay_path, result) may be a coroutine function (awaited on the loop) or a
+    # plain function (run in a thread). Replays are consumed in input order.
+    stats = asyncio.run(run_async(replay_paths, extract_fn, consume_fn, workers, queue_depth, max_tasks_per_child))
+    print_pipeline_stats(stats)
+    return stats
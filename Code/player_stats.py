@@ -0,0 +1,61 @@
+import numpy as np
+
+# Column name -> (PlayerStatsEvent attribute, dtype). Integer counters stay integers so
+# values rendered into prompts look exactly like the raw event fields.
+STAT_COLUMNS = {
+    "frame": ("frame", np.int64),
+    "second": ("second", np.int64),
+    "minerals": ("minerals_current", np.int64),
+    "gas": ("vespene_current", np.int64),
+    "minerals_rate": ("minerals_collection_rate", np.int64),
+    "gas_rate": ("vespene_collection_rate", np.int64),
+    "food_used": ("food_used", np.float64),
+    "food_made": ("food_made", np.float64),
+}
+
+
+class PlayerStatsStore:
+    def __init__(self, tracker_events, pids=None):
+        rows = {}
+        for event in tracker_events:
+            if event.name != 'PlayerStatsEvent': continue
+            if pids is not None and event.pid not in pids: continue
+            rows.setdefault(event.pid, []).append(event)
+
+        self.columns = {}
+        for pid, events in rows.items():
+            self.columns[pid] = {
+                name: np.fromiter((getattr(e, attr) for e in events), dtype=dtype, count=len(events))
+                for name, (attr, dtype) in STAT_COLUMNS.items()
+            }
+
+    def __contains__(self, pid):
+        return pid in self.columns
+
+    def __len__(self):
+        return sum(len(cols["frame"]) for cols in self.columns.values())
+
+    def indices_at(self, pid, values, key="frame"):
+        # Index of the latest row with column `key` <= each value, or -1 if there is none.
+        if pid not in self.columns:
+            return np.full(np.shape(values), -1, dtype=np.int64)
+        return np.searchsorted(self.columns[pid][key], values, side="right") - 1
+
+    def index_at(self, pid, value, key="frame"):
+        return int(self.indices_at(pid, value, key))
+
+    def row(self, pid, idx):
+        if idx < 0: return None
+        return {name: col[idx].item() for name, col in self.columns[pid].items()}
+
+    def latest(self, pid, frame):
+        return self.row(pid, self.index_at(pid, frame))
+
+    def sample(self, pid, values, key="frame"):
+        # Columns gathered at every value in one pass; rows before the first event are masked out.
+        idx = self.indices_at(pid, values, key)
+        valid = idx >= 0
+        safe = np.where(valid, idx, 0)
+        if pid not in self.columns:
+            return valid, {}
+        return valid, {name: col[safe] for name, col in self.columns[pid].items()}
@@ -0,0 +1,388 @@
+import argparse
+import gzip
+import hashlib
+import json
+import os
+from datetime import timedelta
+
+import sc2reader
+from sc2reader.decoders import BitPackedDecoder
+from sc2reader.engine import GameEngine
+from sc2reader.engine.plugins import APMTracker, ContextLoader, GameHeartNormalizer, SelectionTracker
+from sc2reader.factories import SC2Factory
+from sc2reader.readers import TrackerEventsReader
+from sc2reader.resources import Replay
+
+import tracing
+
+CACHE_DIR = os.environ.get("SC2_REPLAY_CACHE_DIR", "./.replay_cache")
+CACHE_MAX_BYTES = int(os.environ.get("SC2_REPLAY_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+CACHE_ENABLED = os.environ.get("SC2_REPLAY_CACHE", "1") != "0"
+CACHE_FORMAT_VERSION = 1
+
+# Tracker event fields kept in the cache, per event type. Everything the task scripts read
+# from replay.tracker_events must be listed here; object references are rebuilt on load.
+EVENT_FIELDS = {
+    "PlayerStatsEvent": ("pid", "minerals_current", "vespene_current", "minerals_collection_rate",
+                         "vespene_collection_rate", "workers_active_count", "food_used", "food_made"),
+    "UnitBornEvent": ("unit_id", "unit_type_name", "control_pid", "upkeep_pid", "x", "y"),
+    "UnitInitEvent": ("unit_id", "unit_type_name", "control_pid", "upkeep_pid", "x", "y"),
+    "UnitDoneEvent": ("unit_id",),
+    "UnitDiedEvent": ("unit_id", "killer_pid", "killing_player_id", "killing_unit_id", "x", "y"),
+    "UnitOwnerChangeEvent": ("unit_id", "control_pid", "upkeep_pid"),
+    "UnitTypeChangeEvent": ("unit_id", "unit_type_name"),
+    "UpgradeCompleteEvent": ("pid", "upgrade_type_name", "count"),
+}
+EVENT_NAMES = list(EVENT_FIELDS)
+
+# Parse profiles: sc2reader load level plus the engine plugins run over the events.
+#   tracker-only  raw tracker event fields and the player list, no unit objects
+#   units         tracker events with unit objects, owners and kill attribution
+#   full          game events too, with the selection and APM trackers; never cached, because an
+#                 entry keeps tracker events only and would serve less than a live decode
+PARSE_PROFILES = {
+    "tracker-only": (3, ()),
+    "units": (3, (GameHeartNormalizer, ContextLoader)),
+    "full": (4, (GameHeartNormalizer, ContextLoader, SelectionTracker, APMTracker)),
+}
+DEFAULT_PROFILE = "units"
+# Cached profiles, leanest first. A cache entry decoded with a richer profile can serve any leaner one.
+PROFILE_ORDER = ["tracker-only", "units"]
+
+_engines = {}
+
+
+class CachedEntity:
+    def __init__(self, pid, name, play_race, is_human, is_observer, is_referee):
+        self.pid = pid
+        self.name = name
+        self.play_race = play_race
+        self.is_human = is_human
+        self.is_observer = is_observer
+        self.is_referee = is_referee
+        self.units = []
+
+    def __repr__(self):
+        return f"Player {self.pid} - {self.name} ({self.play_race})"
+
+
+class CachedTeam:
+    def __init__(self, players):
+        self.players = players
+
+
+class CachedUnit:
+    def __init__(self, unit_id, name, started_at, finished_at, died_at, is_building, is_army, is_worker):
+        self.id = unit_id
+        self.name = name
+        self.owner = None
+        self.started_at = started_at
+        self.finished_at = finished_at
+        self.died_at = died_at
+        self.is_building = is_building
+        self.is_army = is_army
+        self.is_worker = is_worker
+        self.killing_player = self.killed_by = None
+        self.killing_unit = None
+
+    def __repr__(self):
+        return f"{self.name} [{self.id:X}]"
+
+
+class CachedEvent:
+    def __init__(self, name, frame, fields):
+        self.name = name
+        self.frame = frame
+        self.second = frame >> 4
+        self.__dict__.update(fields)
+
+
+class CachedReplay:
+    def __init__(self, data):
+        self.filename = data["filename"]
+        self.cache_key = data.get("cache_key")
+        self.profile = data.get("profile", DEFAULT_PROFILE)
+        self.horizon_frame = data.get("horizon_frame")
+        self.build = data["build"]
+        self.frames = data["frames"]
+        self.game_length = self.length = timedelta(seconds=data["game_length"])
+
+        self.entities, self.entity = [], {}
+        for pid, name, play_race, is_human, is_observer, is_referee in data["entities"]:
+            entity = CachedEntity(pid, name, play_race, is_human, is_observer, is_referee)
+            self.entities.append(entity)
+            self.entity[pid] = entity
+        self.players = [self.entity[pid] for pid in data["players"]]
+        self.player = {p.pid: p for p in self.players}
+        self.humans = [p for p in self.players if p.is_human]
+
+        self.objects = {}
+        for unit_id, name, owner_pid, started_at, finished_at, died_at, flags in data["units"]:
+            unit = CachedUnit(unit_id, name, started_at, finished_at, died_at,
+                              bool(flags & 1), bool(flags & 2), bool(flags & 4))
+            unit.owner = self.entity.get(owner_pid)
+            self.objects[unit_id] = unit
+        for pid, unit_ids in data["player_units"]:
+            self.entity[pid].units = [self.objects[u] for u in unit_ids]
+
+        self.winner = None
+        if data["winner"] is not None:
+            self.winner = CachedTeam([self.player[pid] for pid in data["winner"]])
+
+        self.tracker_events = [self._load_event(row) for row in data["events"]]
+        # Only tracker events are cached, so the merged stream is the tracker stream.
+        self.events = self.tracker_events
+
+    def _load_event(self, row):
+        name = EVENT_NAMES[row[0]]
+        fields = dict(zip(EVENT_FIELDS[name], row[2:]))
+        if "pid" in fields:
+            fields["player"] = self.entity.get(fields["pid"])
+        if "unit_id" in fields:
+            fields["unit"] = self.objects.get(fields["unit_id"])
+        if "upkeep_pid" in fields:
+            fields["unit_upkeeper"] = self.entity.get(fields["upkeep_pid"])
+            fields["unit_controller"] = self.entity.get(fields["control_pid"])
+        if "killing_player_id" in fields:
+            fields["killing_player"] = fields["killer"] = self.player.get(fields["killing_player_id"])
+            fields["killing_unit"] = self.objects.get(fields["killing_unit_id"])
+            if fields["unit"] is not None:
+                fields["unit"].killing_player = fields["unit"].killed_by = fields["killing_player"]
+                fields["unit"].killing_unit = fields["killing_unit"]
+        if "x" in fields:
+            fields["location"] = (fields["x"], fields["y"])
+        return CachedEvent(name, row[1], fields)
+
+
+def pack_replay(replay):
+    units = []
+    for unit in replay.objects.values():
+        flags = (1 if unit.is_building else 0) | (2 if unit.is_army else 0) | (4 if unit.is_worker else 0)
+        owner_pid = unit.owner.pid if unit.owner is not None else None
+        units.append([unit.id, unit.name, owner_pid, unit.started_at, unit.finished_at, unit.died_at, flags])
+
+    events = []
+    for event in replay.tracker_events:
+        if event.name not in EVENT_FIELDS: continue
+        row = [EVENT_NAMES.index(event.name), event.frame]
+        row.extend(getattr(event, field, None) for field in EVENT_FIELDS[event.name])
+        events.append(row)
+
+    winner = None
+    if replay.winner is not None and hasattr(replay.winner, 'players'):
+        winner = [p.pid for p in replay.winner.players]
+
+    return {
+        "format": CACHE_FORMAT_VERSION,
+        "sc2reader": sc2reader.__version__,
+        "filename": replay.filename,
+        "build": replay.build,
+        "frames": replay.frames,
+        "game_length": int(replay.game_length.total_seconds()),
+        "entities": [[e.pid, e.name, getattr(e, 'play_race', None), bool(e.is_human), bool(e.is_observer),
+                      bool(e.is_referee)] for e in replay.entities],
+        "players": [p.pid for p in replay.players],
+        "player_units": [[e.pid, [u.id for u in getattr(e, 'units', [])]] for e in replay.entities],
+        "units": units,
+        "winner": winner,
+        "events": events,
+    }
+
+
+def iter_tracker_events(data, build, horizon_frame=None):
+    # Same decoding loop as sc2reader's TrackerEventsReader, but lazy. With a horizon it stops after
+    # the first event past horizon_frame, which is kept so consumers see time cross the horizon.
+    dispatch = TrackerEventsReader().EVENT_DISPATCH
+    decoder = BitPackedDecoder(data)
+    frames = 0
+    while not decoder.done():
+        decoder._buffer.read(3)
+        frames += decoder.read_vint()
+        decoder._buffer.read(1)
+        etype = decoder.read_vint()
+        yield dispatch[etype](frames, decoder.read_struct(), build)
+        if horizon_frame is not None and frames > horizon_frame:
+            return
+
+
+class HorizonTrackerEventsReader:
+    def __init__(self, horizon_frame):
+        self.horizon_frame = horizon_frame
+
+    def __call__(self, data, replay):
+        return list(iter_tracker_events(data, replay.build, self.horizon_frame))
+
+
+class HorizonReplay(Replay):
+    # Tracker events past horizon_frame are never decoded, so unit objects only see type changes
+    # and deaths up to the horizon. Game events (load level 4) are still decoded in full.
+    def __init__(self, replay_file, horizon_frame=None, **options):
+        self.horizon_frame = horizon_frame
+        super().__init__(replay_file, **options)
+
+    def register_default_readers(self):
+        super().register_default_readers()
+        self.register_reader("replay.tracker.events", HorizonTrackerEventsReader(self.horizon_frame))
+
+
+def file_digest(replay_path):
+    h = hashlib.sha256()
+    with open(replay_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def cache_path_for(digest, profile=DEFAULT_PROFILE, horizon_frame=None):
+    variant = profile if horizon_frame is None else f"{profile}.h{horizon_frame}"
+    return os.path.join(CACHE_DIR, digest[:2],
+                        f"{digest}.{variant}.sc2reader-{sc2reader.__version__}.v{CACHE_FORMAT_VERSION}.json.gz")
+
+
+def engine_for(profile):
+    # One engine per profile per process, so plugins are registered once instead of per replay.
+    if profile not in _engines:
+        _engines[profile] = GameEngine(plugins=[plugin() for plugin in PARSE_PROFILES[profile][1]])
+    return _engines[profile]
+
+
+def decode_replay(replay_path, profile=DEFAULT_PROFILE, horizon_frame=None):
+    load_level = PARSE_PROFILES[profile][0]
+    if horizon_frame is None:
+        return sc2reader.load_replay(replay_path, load_level=load_level, engine=engine_for(profile))
+    return SC2Factory().load(HorizonReplay, replay_path, load_level=load_level, engine=engine_for(profile),
+                             horizon_frame=horizon_frame)
+
+
+def read_entry(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_entry(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=6) as f:
+        json.dump(data, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+def load_replay(replay_path, profile=DEFAULT_PROFILE, horizon_frame=None):
+    # horizon_frame: decode tracker events only up to this frame (see HorizonReplay).
+    with tracing.span("decode", replay=os.path.basename(replay_path), profile=profile,
+                      horizon_frame=horizon_frame) as trace_args:
+        return _load_replay(replay_path, profile, horizon_frame, trace_args)
+
+
+def _load_replay(replay_path, profile, horizon_frame, trace_args):
+    if not CACHE_ENABLED or profile not in PROFILE_ORDER:
+        trace_args["cache"] = "bypass"
+        return decode_replay(replay_path, profile, horizon_frame)
+
+    digest = file_digest(replay_path)
+    for candidate in PROFILE_ORDER[PROFILE_ORDER.index(profile):]:
+        path = cache_path_for(digest, candidate, horizon_frame)
+        if not os.path.exists(path): continue
+        try:
+            data = read_entry(path)
+            os.utime(path)
+            trace_args["cache"] = "hit"
+            return CachedReplay(data)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"   [Replay Cache] Dropping unreadable entry {os.path.basename(path)}: {e}")
+            remove_entry(path)
+
+    trace_args["cache"] = "miss"
+    path = cache_path_for(digest, profile, horizon_frame)
+    data = pack_replay(decode_replay(replay_path, profile, horizon_frame))
+    data["cache_key"] = digest
+    data["profile"] = profile
+    data["horizon_frame"] = horizon_frame
+    try:
+        write_entry(path, data)
+        evict(CACHE_MAX_BYTES)
+    except OSError as e:
+        print(f"   [Replay Cache] Could not store {os.path.basename(replay_path)}: {e}")
+    return CachedReplay(data)
+
+
+def list_entries():
+    entries = []
+    if not os.path.isdir(CACHE_DIR):
+        return entries
+    for root, _, files in os.walk(CACHE_DIR):
+        for name in files:
+            if not name.endswith(".json.gz"): continue
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+    return entries
+
+
+def remove_entry(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def evict(max_bytes):
+    entries = sorted(list_entries())
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, path in entries:
+        if total <= max_bytes: break
+        remove_entry(path)
+        total -= size
+        removed += 1
+    return removed, total
+
+
+def invalidate(replay_paths):
+    removed = 0
+    for replay_path in replay_paths:
+        digest = file_digest(replay_path)
+        for _, _, path in list_entries():
+            if os.path.basename(path).startswith(digest):
+                remove_entry(path)
+                removed += 1
+    return removed
+
+
+def clear():
+    removed = 0
+    for _, _, path in list_entries():
+        remove_entry(path)
+        removed += 1
+    return removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the parsed-replay cache.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="Show cache size and entry count")
+    sub.add_parser("clear", help="Remove every cache entry")
+    p_evict = sub.add_parser("evict", help="Evict least recently used entries down to a size limit")
+    p_evict.add_argument("--max-bytes", type=int, default=CACHE_MAX_BYTES)
+    p_inv = sub.add_parser("invalidate", help="Remove the entries of specific replay files")
+    p_inv.add_argument("replays", nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "stats":
+        entries = list_entries()
+        total = sum(size for _, size, _ in entries)
+        print(f"{CACHE_DIR}: {len(entries)} entries, {total / 1024 ** 2:.1f} MiB (limit {CACHE_MAX_BYTES / 1024 ** 2:.0f} MiB)")
+    elif args.command == "clear":
+        print(f"Removed {clear()} entries from {CACHE_DIR}")
+    elif args.command == "evict":
+        removed, total = evict(args.max_bytes)
+        print(f"Evicted {removed} entries, {total / 1024 ** 2:.1f} MiB remaining")
+    elif args.command == "invalidate":
+        print(f"Removed {invalidate(args.replays)} entries")
+
+
+if __name__ == "__main__":
+    main()
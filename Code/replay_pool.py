@@ -0,0 +1,49 @@
+import multiprocessing
+import os
+
+# Workers are replaced after this many replays so sc2reader's per-replay garbage cannot pile up.
+MAX_TASKS_PER_CHILD = 8
+
+
+def add_pool_arguments(parser):
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of replay parsing processes (1 parses in-process)")
+    parser.add_argument("--max-tasks-per-child", type=int, default=MAX_TASKS_PER_CHILD,
+                        help="Replays a worker parses before it is recycled")
+    return parser
+
+
+def longest_first(replay_paths):
+    # File size tracks game length closely enough to schedule the slowest parses first.
+    def size(i):
+        try:
+            return os.path.getsize(replay_paths[i])
+        except OSError:
+            return 0
+    return sorted(range(len(replay_paths)), key=size, reverse=True)
+
+
+def iter_parsed(replay_paths, extract_fn, workers=1, max_tasks_per_child=MAX_TASKS_PER_CHILD):
+    # Yields (replay_path, result) in the order of replay_paths whatever order the workers
+    # finish in, so downstream output is identical to a serial run.
+    if workers <= 1:
+        for replay_path in replay_paths:
+            try:
+                result = extract_fn(replay_path)
+            except Exception as e:
+                print(f"[Parse Error] {os.path.basename(replay_path)}: {e}")
+                continue
+            yield replay_path, result
+        return
+
+    with multiprocessing.Pool(workers, maxtasksperchild=max_tasks_per_child) as pool:
+        pending = [None] * len(replay_paths)
+        for i in longest_first(replay_paths):
+            pending[i] = pool.apply_async(extract_fn, (replay_paths[i],))
+        for replay_path, async_result in zip(replay_paths, pending):
+            try:
+                result = async_result.get()
+            except Exception as e:
+                print(f"[Parse Error] {os.path.basename(replay_path)}: {e}")
+                continue
+            yield replay_path, result
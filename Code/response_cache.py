@@ -0,0 +1,230 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import tracing
+
+CACHE_PATH = os.environ.get("SC2_RESPONSE_CACHE_PATH", "./.llm_response_cache.sqlite")
+# "readwrite" serves hits and stores misses, "readonly" serves hits and refuses to call the API
+# (for reproducible re-scoring), "off" bypasses the cache entirely.
+CACHE_MODE = os.environ.get("SC2_RESPONSE_CACHE", "readwrite")
+CACHE_MAX_BYTES = int(os.environ.get("SC2_RESPONSE_CACHE_MAX_BYTES", 1024 ** 3))
+EVICT_CHECK_EVERY = 200
+
+_lock = threading.Lock()
+_conn = None
+_conn_pid = None
+_inserts_since_check = 0
+
+
+class ResponseCacheMiss(Exception):
+    pass
+
+
+def _connection():
+    global _conn, _conn_pid
+    if _conn is None or _conn_pid != os.getpid():
+        directory = os.path.dirname(os.path.abspath(CACHE_PATH))
+        os.makedirs(directory, exist_ok=True)
+        _conn = sqlite3.connect(CACHE_PATH, timeout=30, check_same_thread=False)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model_id TEXT, temperature REAL, content TEXT, "
+            "size INTEGER, created REAL, last_access REAL)"
+        )
+        _conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        _conn.commit()
+        _conn_pid = os.getpid()
+    return _conn
+
+
+def cache_key(model_id, temperature, system_prompt, user_prompt, sample=0, **extra):
+    payload = json.dumps([model_id, temperature, system_prompt, user_prompt, sample, sorted(extra.items())],
+                         ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def lookup(key):
+    with _lock:
+        conn = _connection()
+        row = conn.execute("SELECT content FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+        conn.commit()
+    return row[0]
+
+
+def store(key, model_id, temperature, content):
+    global _inserts_since_check
+    now = time.time()
+    with _lock:
+        conn = _connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO responses (key, model_id, temperature, content, size, created, last_access) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, model_id, temperature, content, len(content.encode("utf-8")), now, now),
+        )
+        conn.commit()
+        _inserts_since_check += 1
+        check = _inserts_since_check >= EVICT_CHECK_EVERY
+        if check:
+            _inserts_since_check = 0
+    if check:
+        evict(CACHE_MAX_BYTES)
+
+
+def _before_request(key):
+    if CACHE_MODE == "off":
+        return None
+    content = lookup(key)
+    if content is None and CACHE_MODE == "readonly":
+        raise ResponseCacheMiss(f"No cached response for {key[:12]} (response cache is read-only)")
+    return content
+
+
+def _after_response(key, model_id, temperature, content):
+    if CACHE_MODE == "readwrite" and content is not None:
+        store(key, model_id, temperature, content)
+
+
+def _messages(system_prompt, user_prompt):
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+
+
+def chat_completion(client, model_id, system_prompt, user_prompt, temperature, sample=0, **kwargs):
+    key = cache_key(model_id, temperature, system_prompt, user_prompt, sample, **kwargs)
+    with tracing.span("llm", model_id=model_id, sample=sample) as trace_args:
+        content = _before_request(key)
+        trace_args["cache"] = "hit" if content is not None else "miss"
+        if content is not None:
+            return content
+
+        response = client.chat.completions.create(
+            model=model_id, messages=_messages(system_prompt, user_prompt), temperature=temperature, **kwargs
+        )
+        content = response.choices[0].message.content
+        _after_response(key, model_id, temperature, content)
+        return content
+
+
+async def chat_completion_async(client, model_id, system_prompt, user_prompt, temperature, sample=0, **kwargs):
+    key = cache_key(model_id, temperature, system_prompt, user_prompt, sample, **kwargs)
+    with tracing.async_span("llm", model_id=model_id, sample=sample) as trace_args:
+        content = _before_request(key)
+        trace_args["cache"] = "hit" if content is not None else "miss"
+        if content is not None:
+            return content
+
+        response = await client.chat.completions.create(
+            model=model_id, messages=_messages(system_prompt, user_prompt), temperature=temperature, **kwargs
+        )
+        content = response.choices[0].message.content
+        _after_response(key, model_id, temperature, content)
+        return content
+
+
+# Multi-sample requests use the provider's `n` parameter. Choice i is cached under sample
+# index i, the same slot a standalone chat_completion(..., sample=i) uses, so both request
+# styles share entries and only the missing samples are requested.
+def _missing_samples(model_id, temperature, system_prompt, user_prompt, n, kwargs):
+    keys = [cache_key(model_id, temperature, system_prompt, user_prompt, i, **kwargs) for i in range(n)]
+    contents = [_before_request(key) for key in keys]
+    return keys, contents, [i for i, content in enumerate(contents) if content is None]
+
+
+def _fill_samples(keys, contents, missing, choices, model_id, temperature):
+    for i, choice in zip(missing, choices):
+        contents[i] = choice.message.content
+        _after_response(keys[i], model_id, temperature, contents[i])
+    return contents
+
+
+def chat_completions(client, model_id, system_prompt, user_prompt, temperature, n, **kwargs):
+    with tracing.span("llm", model_id=model_id, n=n) as trace_args:
+        keys, contents, missing = _missing_samples(model_id, temperature, system_prompt, user_prompt, n, kwargs)
+        trace_args["cache_misses"] = len(missing)
+        if not missing:
+            return contents
+        response = client.chat.completions.create(
+            model=model_id, messages=_messages(system_prompt, user_prompt), temperature=temperature,
+            n=len(missing), **kwargs
+        )
+        return _fill_samples(keys, contents, missing, response.choices, model_id, temperature)
+
+
+async def chat_completions_async(client, model_id, system_prompt, user_prompt, temperature, n, **kwargs):
+    with tracing.async_span("llm", model_id=model_id, n=n) as trace_args:
+        keys, contents, missing = _missing_samples(model_id, temperature, system_prompt, user_prompt, n, kwargs)
+        trace_args["cache_misses"] = len(missing)
+        if not missing:
+            return contents
+        response = await client.chat.completions.create(
+            model=model_id, messages=_messages(system_prompt, user_prompt), temperature=temperature,
+            n=len(missing), **kwargs
+        )
+        return _fill_samples(keys, contents, missing, response.choices, model_id, temperature)
+
+
+def cache_size():
+    with _lock:
+        row = _connection().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+    return row[0], row[1]
+
+
+def evict(max_bytes):
+    # Least recently used responses go first until the stored content fits in max_bytes.
+    removed = 0
+    with _lock:
+        conn = _connection()
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= max_bytes:
+            return removed
+        doomed = []
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_access"):
+            if total <= max_bytes: break
+            doomed.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+        conn.commit()
+        removed = len(doomed)
+    return removed
+
+
+def clear():
+    with _lock:
+        conn = _connection()
+        removed = conn.execute("DELETE FROM responses").rowcount
+        conn.commit()
+        conn.execute("VACUUM")
+    return removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the LLM response cache.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="Show entry count and size")
+    sub.add_parser("clear", help="Remove every cached response")
+    p_evict = sub.add_parser("evict", help="Evict least recently used responses down to a size limit")
+    p_evict.add_argument("--max-bytes", type=int, default=CACHE_MAX_BYTES)
+    args = parser.parse_args()
+
+    if args.command == "stats":
+        count, size = cache_size()
+        print(f"{CACHE_PATH}: {count} responses, {size / 1024 ** 2:.1f} MiB (limit {CACHE_MAX_BYTES / 1024 ** 2:.0f} MiB, mode {CACHE_MODE})")
+    elif args.command == "clear":
+        print(f"Removed {clear()} responses")
+    elif args.command == "evict":
+        print(f"Evicted {evict(args.max_bytes)} responses")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import threading
+
+# Append-only write-ahead log of finished work units (SAP samples, DWE batches), kept next to the
+# result file as "<output>.wal.jsonl". A restarted run answers logged units from it instead of
+# requesting them again; once the final JSON is written the log is deleted.
+WAL_SUFFIX = ".wal.jsonl"
+
+
+def wal_path(output_path):
+    return output_path + WAL_SUFFIX
+
+
+def prompt_digest(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def read_records(path):
+    # A crash can leave a torn last line; it is dropped and truncated away so later appends start clean.
+    records = []
+    if not os.path.exists(path):
+        return records
+    with open(path, "rb") as f:
+        raw = f.read()
+    complete = raw[:raw.rfind(b"\n") + 1]
+    if len(complete) != len(raw):
+        with open(path, "r+b") as f:
+            f.truncate(len(complete))
+    for line in complete.decode("utf-8").splitlines():
+        if not line.strip(): continue
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            continue
+    return records
+
+
+class ResultLog:
+    def __init__(self, output_path):
+        self.path = wal_path(output_path)
+        self.entries = {}
+        for record in read_records(self.path):
+            self.entries[json.dumps(record["key"])] = record["value"]
+        self._file = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get(self, key):
+        return self.entries.get(json.dumps(key))
+
+    def append(self, key, value):
+        line = json.dumps({"key": key, "value": value}, ensure_ascii=False)
+        with self._lock:
+            self.entries[json.dumps(key)] = value
+            if self._file is None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")
+            # Flushed per unit: a killed run loses at most the unit in flight.
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def split(self, keys):
+        # Logged values for keys, None where the unit still has to run, plus the missing positions.
+        values = [self.get(key) for key in keys]
+        return values, [i for i, value in enumerate(values) if value is None]
+
+    def fill(self, keys, values, missing, fresh):
+        # Failures (exceptions) are returned but never logged, so a rerun retries them.
+        for i in missing:
+            values[i] = fresh[i]
+            if fresh[i] is not None and not isinstance(fresh[i], BaseException):
+                self.append(keys[i], fresh[i])
+        return values
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def finish(self):
+        # Called after the final result file is written: the log has been compacted into it.
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List write-ahead logs of interrupted experiments.")
+    parser.add_argument("folders", nargs="+")
+    args = parser.parse_args()
+
+    for folder in args.folders:
+        for path in sorted(glob.glob(os.path.join(glob.escape(folder), "*" + WAL_SUFFIX))):
+            print(f"{path}: {len(read_records(path))} logged units")
+
+
+if __name__ == "__main__":
+    main()
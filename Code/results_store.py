@@ -0,0 +1,319 @@
+import argparse
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# Optional consolidated results backend. With SC2_RESULTS_DB=results.sqlite every task script also
+# records its results here (the per-experiment JSON files are still written), and existing result
+# folders can be imported. Leaderboard metrics then come from indexed queries, not a directory scan.
+STORE_PATH = os.environ.get("SC2_RESULTS_DB", "")
+ENABLED = bool(STORE_PATH)
+IMPORT_BATCH = 200
+
+# SAP, ICD and BSS are produced by the same script and share its result format.
+TASK_FORMATS = {"SAP": "sap", "ICD": "sap", "BSS": "sap", "DWE": "dwe", "DWP": "dwp", "CSP": "csp"}
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS experiments ("
+    "task TEXT, model TEXT, replay TEXT, source TEXT, recorded REAL, payload TEXT, "
+    "PRIMARY KEY (task, model, replay))",
+    "CREATE TABLE IF NOT EXISTS sap_timepoints ("
+    "task TEXT, model TEXT, replay TEXT, time_min REAL, status TEXT, samples INTEGER, hits INTEGER, "
+    "errors INTEGER, predictions_made INTEGER, correct_predictions INTEGER, ground_truth_size INTEGER, "
+    "PRIMARY KEY (task, model, replay, time_min))",
+    "CREATE TABLE IF NOT EXISTS sap_samples ("
+    "task TEXT, model TEXT, replay TEXT, time_min REAL, sample INTEGER, is_hit INTEGER, error TEXT, "
+    "predictions TEXT, PRIMARY KEY (task, model, replay, time_min, sample))",
+    "CREATE TABLE IF NOT EXISTS dwe_predictions ("
+    "task TEXT, model TEXT, replay TEXT, game_time_seconds INTEGER, player1_id INTEGER, p1_win_rate REAL, "
+    "padded INTEGER DEFAULT 0, PRIMARY KEY (task, model, replay, game_time_seconds))",
+    "CREATE TABLE IF NOT EXISTS dwp_predictions ("
+    "task TEXT, model TEXT, replay TEXT, time_min INTEGER, predicted_winner_id INTEGER, "
+    "real_winner_id INTEGER, is_correct INTEGER, PRIMARY KEY (task, model, replay, time_min))",
+    "CREATE TABLE IF NOT EXISTS csp_conflicts ("
+    "task TEXT, model TEXT, replay TEXT, idx INTEGER, start REAL, end REAL, region_x REAL, region_y REAL, "
+    "intensity TEXT, PRIMARY KEY (task, model, replay, idx))",
+]
+ROW_TABLES = {
+    "sap": ["sap_timepoints", "sap_samples"],
+    "dwe": ["dwe_predictions"],
+    "dwp": ["dwp_predictions"],
+    "csp": ["csp_conflicts"],
+}
+TABLE_COLUMNS = {
+    "sap_timepoints": 11, "sap_samples": 8, "dwe_predictions": 7, "dwp_predictions": 7, "csp_conflicts": 9,
+}
+# Columns added after a table was first released: appended to stores created by an older version, so
+# positional inserts keep matching. Rows recorded before then get the default.
+ADDED_COLUMNS = {
+    "dwe_predictions": [("padded", "INTEGER DEFAULT 0")],
+}
+INDEXED = {
+    "experiments": ["task", "model", "replay"],
+    "sap_timepoints": ["model", "replay", "time_min"],
+    "sap_samples": ["model", "replay", "time_min"],
+    "dwe_predictions": ["model", "replay", "game_time_seconds"],
+    "dwp_predictions": ["model", "replay", "time_min"],
+    "csp_conflicts": ["model", "replay"],
+}
+
+_lock = threading.Lock()
+_conn = None
+_conn_pid = None
+
+
+def connect(path):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    for statement in SCHEMA:
+        conn.execute(statement)
+    for table, added in ADDED_COLUMNS.items():
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        for column, decl in added:
+            if column not in existing:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+    for table, columns in INDEXED.items():
+        for column in columns:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_{column} ON {table} ({column})")
+    conn.commit()
+    return conn
+
+
+def _connection():
+    global _conn, _conn_pid
+    if _conn is None or _conn_pid != os.getpid():
+        _conn = connect(STORE_PATH)
+        _conn_pid = os.getpid()
+    return _conn
+
+
+def replay_key(name):
+    return os.path.basename(name).replace(".SC2Replay", "")
+
+
+def sap_timepoint_counts(tp):
+    # samples, hits, errors, predictions made, correct predictions, ground-truth size of one timepoint.
+    # The only SAP reducer: these are the sap_timepoints columns that LEADERBOARD_QUERIES["sap"] sums,
+    # and leaderboard.sap_counters sums the same tuples straight from a result file.
+    tp_samples = tp.get("samples", [])
+    valid = [s for s in tp_samples if "is_hit" in s]
+    stats = tp.get("advanced_analysis", {})
+    return (len(valid), sum(1 for s in valid if s["is_hit"]), len(tp_samples) - len(valid),
+            stats.get("total_predictions_made", 0), stats.get("total_correct_predictions", 0),
+            len(set(tp.get("ground_truth", [])) - {"None"}))
+
+
+def sap_rows(task, model, replay, payload):
+    timepoints, samples = [], []
+    for tp in payload.get("timepoints_results", []):
+        minute = tp["time_min"]
+        tp_samples = tp.get("samples", [])
+        timepoints.append((task, model, replay, minute, tp.get("status")) + sap_timepoint_counts(tp))
+        for s in tp_samples:
+            samples.append((task, model, replay, minute, s.get("id"), int(s["is_hit"]) if "is_hit" in s else None,
+                            s.get("error"), json.dumps(s.get("predictions", []))))
+    return {"sap_timepoints": timepoints, "sap_samples": samples}
+
+
+def dwe_rows(task, model, replay, payload):
+    # padded: the model never answered this data point and DWE filled in PAD_WIN_RATE.
+    return {"dwe_predictions": [(task, model, replay, p["game_time_seconds"], p.get("player1_id"), p["p1_win_rate"],
+                                 int(bool(p.get("padded", False)))) for p in payload]}
+
+
+def dwp_rows(task, model, replay, payload):
+    real = payload.get("real_winner_id")
+    return {"dwp_predictions": [(task, model, replay, p["time_min"], p["predicted_winner_id"], real, int(p["is_correct"]))
+                                for p in payload.get("predictions", [])]}
+
+
+def parse_conflicts(text):
+    # CSP stores the raw model answer; conflicts are taken from its first JSON object, if any.
+    match = re.search(r"\{.*\}", text or "", re.DOTALL)
+    try:
+        conflicts = json.loads(match.group(0)).get("conflicts", []) if match else []
+    except (ValueError, AttributeError):
+        return []
+    return [c for c in conflicts if isinstance(c, dict)]
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def csp_rows(task, model, replay, payload):
+    rows = []
+    for i, conflict in enumerate(parse_conflicts(payload)):
+        region = conflict.get("region")
+        x, y = (region[0], region[1]) if isinstance(region, (list, tuple)) and len(region) >= 2 else (None, None)
+        rows.append((task, model, replay, i, _number(conflict.get("start")), _number(conflict.get("end")),
+                     _number(x), _number(y), str(conflict.get("intensity")) if conflict.get("intensity") else None))
+    return {"csp_conflicts": rows}
+
+
+ROW_BUILDERS = {"sap": sap_rows, "dwe": dwe_rows, "dwp": dwp_rows, "csp": csp_rows}
+
+
+def write_experiments(conn, experiments):
+    # One transaction per batch; re-recording an experiment replaces its previous rows.
+    now = time.time()
+    with conn:
+        for task, model, replay, payload, source in experiments:
+            fmt = TASK_FORMATS[task]
+            for table in ["experiments"] + ROW_TABLES[fmt]:
+                conn.execute(f"DELETE FROM {table} WHERE task = ? AND model = ? AND replay = ?", (task, model, replay))
+            stored = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)
+            conn.execute("INSERT INTO experiments (task, model, replay, source, recorded, payload) VALUES (?, ?, ?, ?, ?, ?)",
+                         (task, model, replay, source, now, stored))
+            for table, rows in ROW_BUILDERS[fmt](task, model, replay, payload).items():
+                if rows:
+                    marks = ", ".join("?" * TABLE_COLUMNS[table])
+                    conn.executemany(f"INSERT OR REPLACE INTO {table} VALUES ({marks})", rows)
+
+
+def record(task, model, replay, payload, source=None):
+    # Called by the task scripts after writing a result file; a no-op unless SC2_RESULTS_DB is set.
+    if not ENABLED:
+        return
+    try:
+        with _lock:
+            write_experiments(_connection(), [(task, model, replay_key(replay), payload, source)])
+    except sqlite3.Error as e:
+        print(f"   [Results Store] Could not record {task} {model}/{replay}: {e}")
+
+
+def identify(task, path, payload, models=None):
+    # (model, replay) of a result file; CSP and empty DWE results only carry them in the file name.
+    fmt = TASK_FORMATS[task]
+    stem = os.path.basename(path)[:-len(".json")]
+    if fmt == "sap":
+        meta = payload["experiment_meta"]
+        return meta["model_name"], replay_key(meta["replay_file"])
+    if fmt == "dwp":
+        return payload["model_name"], payload["match_name"]
+    if fmt == "csp":
+        stem = replay_key(stem[len("csp_"):])
+    model = payload[0]["model_used"] if fmt == "dwe" and payload else None
+    for name in models or []:
+        if stem.startswith(name + "_"):
+            model = name
+    if model is None:
+        model = stem.split("_", 1)[0]
+    return model, stem[len(model) + 1:]
+
+
+def result_files(task, folder):
+    pattern = re.compile(r"^csp_.*\.json$") if task == "CSP" else re.compile(r"^(?!csp_|extracted_events_).*\.json$")
+    return sorted(os.path.join(folder, f) for f in os.listdir(folder) if pattern.match(f))
+
+
+def import_folder(task, folder, models=None, conn=None):
+    conn = conn or _connection()
+    batch, imported, skipped = [], 0, 0
+    for path in result_files(task, folder):
+        try:
+            with open(path, encoding="utf-8") as f:
+                payload = f.read() if task == "CSP" else json.load(f)
+            model, replay = identify(task, path, payload, models)
+        except (OSError, ValueError, KeyError, IndexError, TypeError) as e:
+            print(f"   [Results Store] Skipping {os.path.basename(path)}: {e}")
+            skipped += 1
+            continue
+        batch.append((task, model, replay, payload, path))
+        if len(batch) >= IMPORT_BATCH:
+            write_experiments(conn, batch)
+            imported += len(batch)
+            batch = []
+    if batch:
+        write_experiments(conn, batch)
+        imported += len(batch)
+    return imported, skipped
+
+
+LEADERBOARD_QUERIES = {
+    "sap": (
+        "SELECT model, COUNT(DISTINCT replay), SUM(samples), SUM(hits), SUM(predictions_made), "
+        "SUM(correct_predictions), SUM(ground_truth_size * samples) FROM sap_timepoints "
+        "WHERE task = ? AND status = 'Success' GROUP BY model",
+        ["model", "replays", "samples", "hits", "predictions_made", "correct_predictions", "ground_truth_slots"],
+    ),
+    "dwp": (
+        "SELECT model, COUNT(DISTINCT replay), COUNT(*), SUM(is_correct) FROM dwp_predictions "
+        "WHERE task = ? GROUP BY model",
+        ["model", "replays", "predictions", "correct"],
+    ),
+    "dwe": (
+        "SELECT model, COUNT(DISTINCT replay), COUNT(*), AVG(p1_win_rate) FROM dwe_predictions "
+        "WHERE task = ? AND NOT padded GROUP BY model",
+        ["model", "replays", "predictions", "mean_p1_win_rate"],
+    ),
+    "csp": (
+        "SELECT e.model, COUNT(DISTINCT e.replay), COUNT(c.idx) FROM experiments e "
+        "LEFT JOIN csp_conflicts c ON c.task = e.task AND c.model = e.model AND c.replay = e.replay "
+        "WHERE e.task = ? GROUP BY e.model",
+        ["model", "replays", "conflicts"],
+    ),
+}
+
+
+def leaderboard(task, conn=None):
+    conn = conn or _connection()
+    sql, columns = LEADERBOARD_QUERIES[TASK_FORMATS[task]]
+    rows = [dict(zip(columns, row)) for row in conn.execute(sql, (task,))]
+    for row in rows:
+        if "hits" in row:
+            row["psr"] = 100.0 * row["hits"] / row["samples"] if row["samples"] else 0.0
+            precision = row["correct_predictions"] / row["predictions_made"] if row["predictions_made"] else 0.0
+            recall = row["correct_predictions"] / row["ground_truth_slots"] if row["ground_truth_slots"] else 0.0
+            row.update(precision=precision, recall=recall,
+                       f1=2 * precision * recall / (precision + recall) if precision + recall else 0.0)
+        if "correct" in row:
+            row["accuracy"] = 100.0 * row["correct"] / row["predictions"] if row["predictions"] else 0.0
+        if "conflicts" in row:
+            row["conflicts_per_replay"] = row["conflicts"] / row["replays"] if row["replays"] else 0.0
+    return sorted(rows, key=lambda r: r["model"])
+
+
+def main():
+    global STORE_PATH
+    parser = argparse.ArgumentParser(description="Consolidated SQLite store for benchmark results.")
+    parser.add_argument("--db", default=STORE_PATH or "./sc2cog_results.sqlite")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_import = sub.add_parser("import", help="Import a folder of result files for one task")
+    p_import.add_argument("task", choices=sorted(TASK_FORMATS))
+    p_import.add_argument("folder")
+    p_import.add_argument("--models", nargs="*", help="Model names, to split file names that contain underscores")
+    p_board = sub.add_parser("leaderboard", help="Per-model metrics for one or more tasks")
+    p_board.add_argument("tasks", nargs="*", default=sorted(TASK_FORMATS))
+    sub.add_parser("stats", help="Row counts per table")
+    args = parser.parse_args()
+
+    STORE_PATH = args.db
+    if args.command == "import":
+        t0 = time.perf_counter()
+        imported, skipped = import_folder(args.task, args.folder, args.models)
+        print(f"Imported {imported} {args.task} results ({skipped} skipped) in {time.perf_counter() - t0:.2f}s")
+    elif args.command == "leaderboard":
+        for task in args.tasks:
+            t0 = time.perf_counter()
+            rows = leaderboard(task)
+            if not rows: continue
+            print(f"== {task} ({(time.perf_counter() - t0) * 1000:.1f} ms)")
+            for row in rows:
+                print("   " + ", ".join(f"{k}={v:.3f}" if isinstance(v, float) else f"{k}={v}" for k, v in row.items()))
+    elif args.command == "stats":
+        conn = _connection()
+        for table in INDEXED:
+            print(f"{table}: {conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]} rows")
+
+
+if __name__ == "__main__":
+    main()
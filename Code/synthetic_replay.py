@@ -0,0 +1,279 @@
+import argparse
+import math
+import os
+import random
+import time
+
+import sc2reader
+
+import replay_cache
+
+# Synthetic replays are produced in the replay cache's packed format and loaded through
+# replay_cache.CachedReplay, so the extractors see exactly the objects a cache hit gives them.
+FRAMES_PER_SECOND = 22.4
+STATS_INTERVAL_FRAMES = 160
+MAP_SIZE = 200
+STARTING_WORKERS = 12
+
+RACES = {
+    "Terran": {
+        "worker": "SCV",
+        "army": ["Marine", "Marauder", "SiegeTank", "Medivac", "Hellion", "VikingFighter", "Liberator", "Cyclone"],
+        "buildings": ["SupplyDepot", "Barracks", "Factory", "Starport", "CommandCenter", "Refinery",
+                      "EngineeringBay", "Armory", "BarracksReactor", "FactoryTechLab"],
+        "morphs": {"CommandCenter": "OrbitalCommand"},
+        "upgrades": ["Stimpack", "ShieldWall", "PunisherGrenades", "TerranInfantryWeaponsLevel1",
+                     "TerranInfantryArmorsLevel1", "TerranVehicleWeaponsLevel1"],
+    },
+    "Protoss": {
+        "worker": "Probe",
+        "army": ["Zealot", "Stalker", "Adept", "Immortal", "Colossus", "Sentry", "Oracle", "VoidRay"],
+        "buildings": ["Pylon", "Gateway", "Nexus", "Assimilator", "CyberneticsCore", "Forge",
+                      "RoboticsFacility", "Stargate", "TwilightCouncil", "RoboticsBay"],
+        "morphs": {"Gateway": "WarpGate"},
+        "upgrades": ["WarpGateResearch", "BlinkTech", "Charge", "ExtendedThermalLance",
+                     "ProtossGroundWeaponsLevel1", "ProtossShieldsLevel1"],
+    },
+    "Zerg": {
+        "worker": "Drone",
+        "army": ["Zergling", "Roach", "Hydralisk", "Queen", "Mutalisk", "Ravager", "Baneling", "Ultralisk"],
+        "buildings": ["Hatchery", "Extractor", "SpawningPool", "RoachWarren", "EvolutionChamber",
+                      "HydraliskDen", "Spire", "BanelingNest", "InfestationPit"],
+        "morphs": {"Hatchery": "Lair"},
+        "upgrades": ["zerglingmovementspeed", "GlialReconstitution", "overlordspeed",
+                     "ZergMissileWeaponsLevel1", "ZergGroundArmorsLevel1", "CentrificalHooks"],
+    },
+}
+
+
+def _row(name, frame, *fields):
+    return [replay_cache.EVENT_NAMES.index(name), frame, *fields]
+
+
+def make_replay_data(minutes=15, units_per_player=300, death_rate=0.5, players=2, seed=0,
+                     building_share=0.15, worker_share=0.35):
+    # Unit births skew towards the late game and every unit dies with probability death_rate,
+    # killed by a unit of another player, which matches the shape of tracker streams in real games.
+    rng = random.Random(seed)
+    frames = int(minutes * 60 * FRAMES_PER_SECOND)
+    race_names = list(RACES)
+
+    entities, units, events, player_units = [], [], [], []
+    next_unit_id = 1
+    owned = {}
+
+    for pid in range(1, players + 1):
+        race = race_names[rng.randrange(len(race_names))]
+        palette = RACES[race]
+        entities.append([pid, f"Synthetic{pid}", race, True, False, False])
+        owned[pid] = []
+
+        for i in range(max(units_per_player, STARTING_WORKERS)):
+            if i < STARTING_WORKERS:
+                kind, name, start = "worker", palette["worker"], 0
+            else:
+                roll = rng.random()
+                kind = "building" if roll < building_share else "worker" if roll < building_share + worker_share else "army"
+                name = rng.choice(palette["buildings"] if kind == "building" else
+                                  [palette["worker"]] if kind == "worker" else palette["army"])
+                start = int(frames * math.sqrt(rng.random()))
+            unit_id = next_unit_id
+            next_unit_id += 1
+            x, y = rng.uniform(0, MAP_SIZE), rng.uniform(0, MAP_SIZE)
+
+            if kind == "building":
+                finished = min(start + int(rng.uniform(20, 70) * FRAMES_PER_SECOND), frames)
+                events.append(_row("UnitInitEvent", start, unit_id, name, pid, pid, x, y))
+                events.append(_row("UnitDoneEvent", finished, unit_id))
+                final_name = name
+                if name in palette["morphs"] and rng.random() < 0.6 and finished < frames:
+                    final_name = palette["morphs"][name]
+                    events.append(_row("UnitTypeChangeEvent", rng.randint(finished, frames), unit_id, final_name))
+                flags = 1
+            else:
+                finished = start
+                events.append(_row("UnitBornEvent", start, unit_id, name, pid, pid, x, y))
+                final_name = name
+                flags = 4 if kind == "worker" else 2
+
+            units.append([unit_id, final_name, pid, start, finished, None, flags])
+            owned[pid].append(unit_id)
+        player_units.append([pid, owned[pid]])
+
+        for upgrade in rng.sample(palette["upgrades"], rng.randint(0, len(palette["upgrades"]))):
+            events.append(_row("UpgradeCompleteEvent", rng.randint(frames // 5, frames), pid, upgrade, 1))
+
+    unit_index = {u[0]: u for u in units}
+    pids = [e[0] for e in entities]
+    for unit in units:
+        if rng.random() >= death_rate or unit[4] >= frames: continue
+        enemies = [p for p in pids if p != unit[2]]
+        if not enemies: continue
+        killer_pid = rng.choice(enemies)
+        killer_id = rng.choice(owned[killer_pid])
+        died = rng.randint(unit[4] + 1, frames)
+        unit[5] = died
+        if unit_index[killer_id][3] > died:
+            killer_id = None
+        events.append(_row("UnitDiedEvent", died, unit[0], killer_pid, killer_pid, killer_id,
+                           rng.uniform(0, MAP_SIZE), rng.uniform(0, MAP_SIZE)))
+
+    # PlayerStatsEvent every 10 game seconds, with supply following the units alive at that frame.
+    for pid in pids:
+        supply_changes = []
+        for unit in units:
+            if unit[2] != pid or unit[6] & 1: continue
+            supply = 1 if unit[6] & 4 else 2
+            supply_changes.append((unit[4], supply))
+            if unit[5] is not None:
+                supply_changes.append((unit[5], -supply))
+        supply_changes.sort()
+        food_used, j = 0, 0
+        minerals, gas = 50, 0
+        for frame in range(0, frames + 1, STATS_INTERVAL_FRAMES):
+            while j < len(supply_changes) and supply_changes[j][0] <= frame:
+                food_used += supply_changes[j][1]
+                j += 1
+            progress = frame / frames if frames else 0
+            minerals_rate = int(400 + 2000 * progress + rng.uniform(-100, 100))
+            gas_rate = int(1200 * progress + rng.uniform(0, 80))
+            minerals = max(0, int(minerals + rng.uniform(-300, 300)))
+            gas = max(0, int(gas + rng.uniform(-150, 150)))
+            food_made = min(200.0, float(15 + 8 * (food_used // 8 + 1)))
+            events.append(_row("PlayerStatsEvent", frame, pid, minerals, gas, minerals_rate, gas_rate,
+                               min(food_used, 200) // 2, float(min(food_used, 200)), food_made))
+
+    events.sort(key=lambda row: row[1])
+    winner = [pids[rng.randrange(len(pids))]] if pids else None
+
+    return {
+        "format": replay_cache.CACHE_FORMAT_VERSION,
+        "sc2reader": sc2reader.__version__,
+        "filename": f"synthetic_{minutes}m_{units_per_player}u_{seed}.SC2Replay",
+        "cache_key": f"synthetic-{seed}",
+        "build": 0,
+        "frames": frames,
+        "game_length": int(frames / FRAMES_PER_SECOND),
+        "entities": entities,
+        "players": pids,
+        "player_units": player_units,
+        "units": units,
+        "winner": winner,
+        "events": events,
+    }
+
+
+def make_replay(**knobs):
+    return replay_cache.CachedReplay(make_replay_data(**knobs))
+
+
+def write_corpus(folder, count, seed=0, **knobs):
+    # Writes count placeholder .SC2Replay files and stores a synthetic replay as the replay cache entry
+    # of each, so the task scripts can run on them unchanged. sc2reader cannot decode the placeholders,
+    # so this only works while the replay cache is enabled and the entries stay in it.
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for i in range(count):
+        replay_path = os.path.join(folder, f"synthetic_{seed + i}.SC2Replay")
+        with open(replay_path, "w", encoding="utf-8") as f:
+            f.write(f"synthetic replay {seed + i} {sorted(knobs.items())}\n")
+        digest = replay_cache.file_digest(replay_path)
+        data = make_replay_data(seed=seed + i, **knobs)
+        data.update(cache_key=digest, profile=replay_cache.DEFAULT_PROFILE, horizon_frame=None)
+        replay_cache.write_entry(replay_cache.cache_path_for(digest, replay_cache.DEFAULT_PROFILE), data)
+        paths.append(replay_path)
+    return paths
+
+
+def extractor_suite():
+    import CSP
+    import DWE
+    import DWP
+    import SAP
+    return {
+        "SAP": lambda replay: SAP.game_contexts_from_replay(replay, SAP.TIME_POINTS),
+        "DWE": DWE.replay_data_from_replay,
+        "DWP": DWP.replay_states_from_replay,
+        "CSP": CSP.battle_events_from_replay,
+    }
+
+
+def bench(minutes_list, units_list, death_rate, players, repeat, seed):
+    extractors = extractor_suite()
+    rows = []
+    for minutes in minutes_list:
+        for units_per_player in units_list:
+            replay = make_replay(minutes=minutes, units_per_player=units_per_player, death_rate=death_rate,
+                                 players=players, seed=seed)
+            n_events = len(replay.tracker_events)
+            timings = {}
+            for name, extract in extractors.items():
+                best = None
+                for _ in range(repeat):
+                    t0 = time.perf_counter()
+                    extract(replay)
+                    elapsed = time.perf_counter() - t0
+                    best = elapsed if best is None else min(best, elapsed)
+                timings[name] = best
+            rows.append((minutes, units_per_player, n_events, timings))
+            cells = "  ".join(f"{name} {t * 1000:8.1f}ms" for name, t in timings.items())
+            print(f"{minutes:>4}m {units_per_player:>6}u {n_events:>8} events | {cells}")
+
+    # Log-log slope of time against event count between the smallest and largest inputs:
+    # ~1 is linear, anything near 2 means an extractor went quadratic.
+    if len(rows) > 1:
+        rows.sort(key=lambda r: r[2])
+        small, large = rows[0], rows[-1]
+        if large[2] > small[2]:
+            print("Scaling exponent (time vs events):")
+            for name in extractors:
+                t_small, t_large = max(small[3][name], 1e-9), max(large[3][name], 1e-9)
+                slope = math.log(t_large / t_small) / math.log(large[2] / small[2])
+                flag = "  <-- superlinear" if slope > 1.5 else ""
+                print(f"  {name}: {slope:.2f}{flag}")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic replays and benchmark the extractors on them.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_bench = sub.add_parser("bench", help="Time every extractor across game lengths and unit counts")
+    p_bench.add_argument("--minutes", type=float, nargs="+", default=[10, 20, 40])
+    p_bench.add_argument("--units", type=int, nargs="+", default=[200, 800])
+    p_bench.add_argument("--death-rate", type=float, default=0.5)
+    p_bench.add_argument("--players", type=int, default=2)
+    p_bench.add_argument("--repeat", type=int, default=3)
+    p_bench.add_argument("--seed", type=int, default=0)
+
+    p_corpus = sub.add_parser("corpus", help="Run every extractor over many synthetic replays")
+    p_corpus.add_argument("--count", type=int, default=1000)
+    p_corpus.add_argument("--minutes", type=float, default=15)
+    p_corpus.add_argument("--units", type=int, default=300)
+    p_corpus.add_argument("--death-rate", type=float, default=0.5)
+    p_corpus.add_argument("--players", type=int, default=2)
+    p_corpus.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        bench(args.minutes, args.units, args.death_rate, args.players, args.repeat, args.seed)
+    elif args.command == "corpus":
+        extractors = extractor_suite()
+        totals = {name: 0.0 for name in extractors}
+        t_gen = 0.0
+        for i in range(args.count):
+            t0 = time.perf_counter()
+            replay = make_replay(minutes=args.minutes, units_per_player=args.units, death_rate=args.death_rate,
+                                 players=args.players, seed=args.seed + i)
+            t_gen += time.perf_counter() - t0
+            for name, extract in extractors.items():
+                t0 = time.perf_counter()
+                extract(replay)
+                totals[name] += time.perf_counter() - t0
+        print(f"Generated {args.count} replays in {t_gen:.1f}s")
+        for name, total in totals.items():
+            print(f"  {name}: {total:.2f}s total, {args.count / total if total else 0:.1f} replays/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import asyncio
+import gc
+import json
+import re
+
+import pytest
+
+import DWE
+import llm_clients
+import response_cache
+
+MODEL = {"name": "stub", "api_key": "stub", "base_url": "", "model_id": "stub", "temperature": 0, "max_in_flight": 2}
+
+
+def test_semaphores_belong_to_their_event_loop():
+    async def semaphores():
+        first, again = DWE.model_semaphore(MODEL), DWE.model_semaphore(MODEL)
+        other = DWE.model_semaphore(dict(MODEL, name="other"))
+        assert first is again and first is not other
+        async with first:
+            async with first:
+                assert first.locked()
+        return first
+
+    gc.collect()
+    before = len(DWE._semaphores)
+    one = asyncio.run(semaphores())
+    two = asyncio.run(semaphores())
+    assert one is not two
+    gc.collect()
+    assert len(DWE._semaphores) == before
+
+
+def states(times):
+    side = {"min_rate": 800, "gas_rate": 200, "army_value": 1000, "army_killed_val": 0, "army_lost_val": 0}
+    return [{"time": t, "p1": side, "p2": side} for t in times]
+
+
+def asked_times(prompt):
+    return [int(t) for t in re.findall(r"\[T=(\d+)s\]", prompt)]
+
+
+@pytest.fixture
+def stub_api(monkeypatch):
+    # answer(times, attempt) -> the JSON array a model sends back for a prompt asking about times.
+    # Every request is recorded as (asked times, attempt); async requests are held for delay(times) seconds.
+    state = {"answer": None, "requests": [], "delay": lambda times: 0}
+
+    def chat_completion(client, model_id, system_prompt, user_prompt, temperature, sample=0, **kwargs):
+        times = asked_times(user_prompt)
+        state["requests"].append((times, sample))
+        return json.dumps(state["answer"](times, sample))
+
+    async def chat_completion_async(client, model_id, system_prompt, user_prompt, *args, **kwargs):
+        await asyncio.sleep(state["delay"](asked_times(user_prompt)))
+        return chat_completion(client, model_id, system_prompt, user_prompt, *args, **kwargs)
+
+    monkeypatch.setattr(response_cache, "chat_completion", chat_completion)
+    monkeypatch.setattr(response_cache, "chat_completion_async", chat_completion_async)
+    monkeypatch.setattr(llm_clients, "get_client", lambda config: None)
+    monkeypatch.setattr(llm_clients, "get_async_client", lambda config: None)
+    return state
+
+
+def win_rate(t):
+    return t / 1000
+
+
+def batch_win_rates(batch, async_batches):
+    if not async_batches:
+        return DWE.get_batch_win_rates(batch, "P1", "P2", MODEL)
+
+    async def run():
+        return await DWE.get_batch_win_rates_async(batch, "P1", "P2", MODEL, DWE.model_semaphore(MODEL))
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("async_batches", [False, True])
+def test_only_missing_timestamps_are_asked_again(stub_api, async_batches):
+    # First answer: nulls for 20s and 40s and the last two cut off; the retry drops 60s again.
+    def answer(times, attempt):
+        if attempt == 0:
+            return [None if t in (20, 40) else win_rate(t) for t in times][:-2]
+        return ["n/a" if t == 60 and attempt == 1 else win_rate(t) for t in times]
+
+    stub_api["answer"] = answer
+    rates, padded = batch_win_rates(states(range(0, 80, 10)), async_batches)
+
+    assert stub_api["requests"] == [(list(range(0, 80, 10)), 0), ([20, 40, 60, 70], 1), ([60], 2)]
+    assert rates == [win_rate(t) for t in range(0, 80, 10)]
+    assert padded == [False] * 8
+
+
+@pytest.mark.parametrize("async_batches", [False, True])
+def test_unanswered_timestamps_are_padded_after_the_last_retry(stub_api, async_batches):
+    stub_api["answer"] = lambda times, attempt: [None if t == 30 else win_rate(t) for t in times]
+    rates, padded = batch_win_rates(states(range(0, 50, 10)), async_batches)
+
+    assert [times for times, _ in stub_api["requests"]] == [[0, 10, 20, 30, 40]] + [[30]] * DWE.MAX_BATCH_RETRIES
+    assert [attempt for _, attempt in stub_api["requests"]] == list(range(DWE.MAX_BATCH_RETRIES + 1))
+    assert rates == [0.0, 0.01, 0.02, DWE.PAD_WIN_RATE, 0.04]
+    assert padded == [False, False, False, True, False]
+
+
+def test_failed_requests_pad_the_whole_batch(stub_api, monkeypatch):
+    def fail(times, attempt):
+        raise RuntimeError("connection reset")
+
+    stub_api["answer"] = fail
+    monkeypatch.setattr(DWE, "MAX_BATCH_RETRIES", 1)
+    assert DWE.get_batch_win_rates(states([0, 10]), "P1", "P2", MODEL) == ([0.5, 0.5], [True, True])
+    assert len(stub_api["requests"]) == 2
+
+
+def test_predictions_keep_batch_order_and_padded_flags(stub_api):
+    stub_api["answer"] = lambda times, attempt: [None if t == 10 else win_rate(t) for t in times]
+    stub_api["delay"] = lambda times: 0.05 if 0 in times else 0
+    batches = [states([0, 10]), states([20, 30])]
+
+    async def run():
+        semaphore = DWE.model_semaphore(MODEL)
+        # The later batch finishes first; gather still returns the answers in batch order.
+        return await asyncio.gather(*[DWE.get_batch_win_rates_async(batch, "P1", "P2", MODEL, semaphore)
+                                      for batch in batches])
+
+    log = DWE.predictions_for(batches, asyncio.run(run()), "stub", 1)
+    assert [times for times, _ in stub_api["requests"]][:2] == [[20, 30], [0, 10]]
+    assert [(p["game_time_seconds"], p["p1_win_rate"], p["padded"]) for p in log] == [
+        (0, 0.0, False), (10, 0.5, True), (20, 0.02, False), (30, 0.03, False)]
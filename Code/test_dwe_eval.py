@@ -0,0 +1,89 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+import dwe_eval
+
+# Player 1 (pid 1) wins r1 and loses r2.
+WINNERS = {"r1": (1, {1}), "r2": (1, {2})}
+
+
+def curve(*points, padded=()):
+    return [{"game_time_seconds": t, "player1_id": 1, "p1_win_rate": p, "padded": t in padded} for t, p in points]
+
+
+CURVES = [
+    ("a", "r1", curve((100, 0.6), (400, 0.8), (700, 0.5), padded=(700,))),
+    ("a", "r2", curve((100, 0.6), (400, 0.3))),
+    ("b", "r1", curve((100, 0.9), (400, 0.5))),
+]
+
+
+def report(include_padded=False):
+    return dwe_eval.score(*dwe_eval.build_arrays(CURVES, WINNERS, include_padded))
+
+
+def test_metrics_match_hand_computed_values():
+    a = report()["a"]
+    # p = 0.6, 0.8 (won), 0.6, 0.3 (lost)
+    assert a["points"] == 4 and a["curves"] == 2
+    assert a["brier"] == pytest.approx((0.4 ** 2 + 0.2 ** 2 + 0.6 ** 2 + 0.3 ** 2) / 4)
+    assert a["log_loss"] == pytest.approx(round(-(math.log(0.6) + math.log(0.8) + math.log(0.4) + math.log(0.7)) / 4, 4))
+    # Bins 6 (0.6, 0.6 vs one win), 8 (0.8 vs a win) and 3 (0.3 vs a loss): (0.2 + 0.2 + 0.3) / 4
+    assert a["ece"] == pytest.approx(0.175)
+    # Positive/negative pairs (0.6, 0.6) tie, (0.6, 0.3), (0.8, 0.6) and (0.8, 0.3) are ordered: 3.5 / 4
+    assert a["auc"] == pytest.approx(0.875)
+    assert a["accuracy"] == pytest.approx(0.75)
+    assert a["accuracy_by_time"]["0-5m"] == pytest.approx(0.5) and a["accuracy_by_time"]["5-10m"] == 1.0
+    assert a["accuracy_by_time"]["10-15m"] is None
+    # r1 is on the winner's side from 100s (of 400s), r2 from 400s (of 400s).
+    assert a["converged_share"] == 1.0
+    assert a["median_convergence_seconds"] == 250.0 and a["median_convergence_fraction"] == pytest.approx(0.625)
+
+
+def test_single_class_model_has_no_auc():
+    b = report()["b"]
+    assert b["auc"] is None
+    assert b["brier"] == pytest.approx((0.1 ** 2 + 0.5 ** 2) / 2)
+    # 0.5 is no call: the curve ends on the wrong side and never converges.
+    assert b["accuracy"] == 0.5 and b["converged_share"] == 0.0 and b["median_convergence_seconds"] is None
+
+
+def test_padded_rows_are_left_out_unless_asked_for():
+    models, replays, arrays = dwe_eval.build_arrays(CURVES, WINNERS)
+    assert len(arrays["p"]) == 6 and 700 not in arrays["time"]
+    padded = report(include_padded=True)["a"]
+    assert padded["points"] == 5
+    assert padded["brier"] == pytest.approx((0.4 ** 2 + 0.2 ** 2 + 0.5 ** 2 + 0.6 ** 2 + 0.3 ** 2) / 5)
+
+
+def test_replays_without_a_winner_are_not_scored():
+    models, replays, arrays = dwe_eval.build_arrays(CURVES, {"r2": WINNERS["r2"]})
+    assert models == ["a", "b"] and len(arrays["p"]) == 2
+    assert set(dwe_eval.score(models, replays, arrays)) == {"a"}
+
+
+def pairwise_auc(p, y):
+    pos, neg = [x for x, label in zip(p, y) if label], [x for x, label in zip(p, y) if not label]
+    if not pos or not neg:
+        return None
+    return sum(1.0 if a > b else 0.5 if a == b else 0.0 for a in pos for b in neg) / (len(pos) * len(neg))
+
+
+def test_rank_sum_auc_matches_pairwise_count_with_ties():
+    rng = random.Random(7)
+    n_models = 4
+    model = np.array([rng.randrange(n_models) for _ in range(400)], dtype=np.int64)
+    p = np.array([rng.choice([0.0, 0.25, 0.5, 0.75, 1.0]) for _ in model])
+    label = np.array([float(rng.random() < 0.4) for _ in model])
+    label[model == 3] = 1.0   # one model only ever sees wins
+    auc = dwe_eval.roc_auc(model, p, label, n_models)
+    for i in range(n_models):
+        expected = pairwise_auc(p[model == i], label[model == i])
+        if expected is None:
+            assert np.isnan(auc[i])
+        else:
+            assert auc[i] == pytest.approx(expected)
+    assert dwe_eval.roc_auc(np.zeros(4, dtype=np.int64), np.full(4, 0.5), np.array([1.0, 0.0, 1.0, 0.0]), 1)[0] == 0.5
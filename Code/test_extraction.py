@@ -0,0 +1,230 @@
+from collections import Counter
+
+from sc2reader.readers import TrackerEventsReader
+
+import SAP
+import replay_cache
+import synthetic_replay
+
+SEEDS = range(6)
+MINUTES = 14
+BUILD = 90136   # any build past the old 4-point coordinate and kill attribution formats
+
+
+def baseline_context(replay, minute):
+    # The per-timepoint scan extract_full_game_context ran before the single-pass extractor.
+    target_frame = int(minute * 60 * 22.4)
+    end_frame = target_frame + int(SAP.PREDICTION_WINDOW_SECONDS * 22.4)
+    if target_frame > replay.frames:
+        return None
+    hero, opponent = replay.players[0], replay.players[1]
+
+    stats = [e for e in replay.tracker_events if e.name == 'PlayerStatsEvent' and e.pid == hero.pid and e.frame <= target_frame]
+    resources = {"minerals": 0, "gas": 0, "supply": 0}
+    if stats:
+        resources = {"minerals": stats[-1].minerals_current, "gas": stats[-1].vespene_current,
+                     "supply": int(stats[-1].food_used / 4096)}
+
+    current_buildings, current_army = set(), []
+    for unit in hero.units:
+        if unit.started_at is not None and unit.started_at <= target_frame:
+            if unit.died_at is None or unit.died_at > target_frame:
+                c_name = SAP.clean_name(unit.name)
+                if not c_name: continue
+                if unit.is_building:
+                    current_buildings.add(c_name)
+                elif unit.is_army:
+                    current_army.append(c_name)
+
+    scouted_info = set()
+    for unit in opponent.units:
+        if unit.is_building and unit.started_at is not None and unit.started_at <= target_frame:
+            c_name = SAP.clean_name(unit.name)
+            if c_name and c_name not in ["SupplyDepot", "Pylon", "Overlord", "CreepTumor"]:
+                scouted_info.add(c_name)
+
+    ground_truth_actions = set()
+    for event in replay.events:
+        if event.frame < target_frame or event.frame > end_frame: continue
+        if hasattr(event, 'control_pid') and event.control_pid != hero.pid: continue
+        if hasattr(event, 'player') and event.player != hero: continue
+        action = None
+        if event.name == 'UnitInitEvent' or (event.name == 'UnitBornEvent' and event.unit.is_building):
+            action = SAP.clean_name(event.unit.name)
+        elif event.name == 'UnitTypeChangeEvent' and event.unit.owner == hero:
+            action = SAP.clean_name(event.unit_type_name)
+        elif event.name == 'UpgradeCompleteEvent':
+            action = SAP.clean_name(event.upgrade_type_name)
+        if action and action not in ["SupplyDepot", "Pylon", "Overlord", "CreepTumor", "Refinery", "Extractor", "Assimilator"]:
+            ground_truth_actions.add(action)
+
+    return {
+        "race": hero.play_race,
+        "opponent_race": opponent.play_race,
+        "time_min": minute,
+        "minerals": resources['minerals'],
+        "gas": resources['gas'],
+        "supply": resources['supply'],
+        "my_army_composition": dict(Counter(current_army)),
+        "my_tech_structure": list(current_buildings),
+        "scouted_opponent": list(scouted_info),
+        "ground_truth": list(ground_truth_actions) if ground_truth_actions else ["None"]
+    }
+
+
+def comparable(context):
+    # Lists built from sets carry no order; the army composition keeps its key order.
+    if context is None:
+        return None
+    context = dict(context)
+    for key in ("my_tech_structure", "scouted_opponent", "ground_truth"):
+        context[key] = sorted(context[key])
+    context["my_army_composition"] = list(context["my_army_composition"].items())
+    return context
+
+
+def assert_matches_baseline(replay, minutes):
+    contexts = SAP.game_contexts_from_replay(replay, minutes)
+    assert sorted(contexts) == sorted(minutes)
+    for minute in minutes:
+        assert comparable(contexts[minute]) == comparable(baseline_context(replay, minute)), minute
+
+
+def test_sap_contexts_match_per_timepoint_scan():
+    dense = SAP.time_point_grid(15, MINUTES + 2)   # runs past the end of the game
+    for seed in SEEDS:
+        replay = synthetic_replay.make_replay(seed=seed, minutes=MINUTES)
+        assert_matches_baseline(replay, SAP.TIME_POINTS)
+        assert_matches_baseline(replay, dense)
+        assert_matches_baseline(replay, [9.0, 2.0, 6.5, 2.0 + 1 / 60])
+
+
+def test_extract_game_contexts_wrappers_agree():
+    replay = synthetic_replay.make_replay(seed=1, minutes=MINUTES)
+    contexts = SAP.game_contexts_from_replay(replay, SAP.TIME_POINTS)
+    for minute in SAP.TIME_POINTS:
+        assert SAP.game_contexts_from_replay(replay, [minute])[minute] == contexts[minute]
+
+
+# A minimal writer for sc2reader's bit-packed tracker stream, so the horizon decoder can be checked
+# against sc2reader's own reader without shipping a replay file.
+def _vint(value):
+    out = bytearray()
+    byte, value = ((abs(value) & 0x3F) << 1) | (value < 0), abs(value) >> 6
+    while value:
+        out.append(byte | 0x80)
+        byte, value = value & 0x7F, value >> 7
+    out.append(byte)
+    return bytes(out)
+
+
+def _struct(value):
+    if isinstance(value, dict):
+        return b"\x05" + _vint(len(value)) + b"".join(_vint(k) + _struct(v) for k, v in value.items())
+    if isinstance(value, str):
+        raw = value.encode("utf8")
+        return b"\x02" + _vint(len(raw)) + raw
+    return b"\x09" + _vint(int(value or 0))
+
+
+def _unit(unit_id):
+    return {0: unit_id >> 18, 1: unit_id & 0x3FFFF}
+
+
+def encode_tracker_events(rows):
+    etypes = {"PlayerStatsEvent": 0, "UnitBornEvent": 1, "UnitDiedEvent": 2, "UnitTypeChangeEvent": 4,
+              "UpgradeCompleteEvent": 5, "UnitInitEvent": 6, "UnitDoneEvent": 7}
+    out, frame = bytearray(), 0
+    for row in rows:
+        name, fields = replay_cache.EVENT_NAMES[row[0]], row[2:]
+        if name == "PlayerStatsEvent":
+            pid, minerals, gas, minerals_rate, gas_rate, workers, food_used, food_made = fields
+            stats = {i: 0 for i in range(39)}
+            stats.update({0: minerals, 1: gas, 2: minerals_rate, 3: gas_rate, 4: workers,
+                          29: food_used * 4096, 30: food_made * 4096})
+            data = {0: pid, 1: stats}
+        elif name in ("UnitBornEvent", "UnitInitEvent"):
+            unit_id, unit_type, control, upkeep, x, y = fields
+            data = {**_unit(unit_id), 2: unit_type, 3: control, 4: upkeep, 5: x, 6: y}
+        elif name == "UnitDiedEvent":
+            unit_id, killer_pid, _, killing_unit_id, x, y = fields
+            killing = _unit(killing_unit_id or 0)
+            data = {**_unit(unit_id), 2: killer_pid, 3: x, 4: y, 5: killing[0], 6: killing[1]}
+        elif name == "UnitTypeChangeEvent":
+            data = {**_unit(fields[0]), 2: fields[1]}
+        elif name == "UnitDoneEvent":
+            data = _unit(fields[0])
+        else:
+            data = {0: fields[0], 1: fields[1], 2: fields[2]}
+        out += b"\x03\x00\x09" + _vint(row[1] - frame) + b"\x09" + _vint(etypes[name]) + _struct(data)
+        frame = row[1]
+    return bytes(out)
+
+
+class _Build:
+    build = BUILD
+
+
+def _decoded(events):
+    return [(type(e).__name__, vars(e)) for e in events]
+
+
+def test_lazy_tracker_decoder_matches_sc2reader():
+    for seed in SEEDS:
+        stream = encode_tracker_events(synthetic_replay.make_replay_data(seed=seed, minutes=MINUTES)["events"])
+        expected = _decoded(TrackerEventsReader()(stream, _Build()))
+        assert len(expected) > 1000
+        assert _decoded(replay_cache.iter_tracker_events(stream, BUILD)) == expected
+
+
+def test_horizon_decoder_keeps_the_first_event_past_the_horizon():
+    rows = synthetic_replay.make_replay_data(seed=2, minutes=MINUTES)["events"]
+    stream = encode_tracker_events(rows)
+    full = _decoded(TrackerEventsReader()(stream, _Build()))
+    for horizon_frame in (0, 1000, rows[500][1], rows[-1][1] - 1, rows[-1][1], rows[-1][1] + 10):
+        cut = next((i + 1 for i, row in enumerate(rows) if row[1] > horizon_frame), len(rows))
+        decoded = _decoded(replay_cache.HorizonTrackerEventsReader(horizon_frame)(stream, _Build()))
+        assert decoded == full[:cut], horizon_frame
+
+
+def horizon_view(data, horizon_frame):
+    # The replay a horizon decode produces: the tracker stream up to the first event past the horizon
+    # (counted by the real decoder), so units only see births, deaths and morphs in that prefix.
+    kept = len(list(replay_cache.iter_tracker_events(encode_tracker_events(data["events"]), BUILD, horizon_frame)))
+    events = data["events"][:kept]
+    born, died, names = set(), {}, {}
+    for row in events:
+        name = replay_cache.EVENT_NAMES[row[0]]
+        if name in ("UnitBornEvent", "UnitInitEvent"):
+            born.add(row[2])
+            names[row[2]] = row[3]
+        elif name == "UnitTypeChangeEvent":
+            names[row[2]] = row[3]
+        elif name == "UnitDiedEvent":
+            died[row[2]] = row[1]
+    units = [[u[0], names[u[0]], u[2], u[3], u[4], died.get(u[0]), u[6]] for u in data["units"] if u[0] in born]
+    player_units = [[pid, [u for u in ids if u in born]] for pid, ids in data["player_units"]]
+    return dict(data, events=events, units=units, player_units=player_units, horizon_frame=horizon_frame)
+
+
+def test_sap_contexts_with_and_without_horizon():
+    # SAP's STREAM_DECODE horizon covers the last timepoint plus the prediction window. Within it a
+    # horizon decode sees the same units and events, except units that morph only after the horizon:
+    # sc2reader names a unit by its final type, which a truncated decode never reaches. The full
+    # replay is compared with those late morphs undone.
+    minutes = SAP.TIME_POINTS
+    horizon_frame = int((max(minutes) * 60 + SAP.PREDICTION_WINDOW_SECONDS) * 22.4)
+    for seed in SEEDS:
+        data = synthetic_replay.make_replay_data(seed=seed, minutes=MINUTES)
+        horizon = replay_cache.CachedReplay(horizon_view(data, horizon_frame))
+        late = {row[2] for row in data["events"]
+                if replay_cache.EVENT_NAMES[row[0]] == "UnitTypeChangeEvent" and row[1] > horizon_frame}
+        unmorphed = dict(data, units=[[u[0], horizon.objects[u[0]].name if u[0] in late and u[0] in horizon.objects else u[1]] + u[2:]
+                                      for u in data["units"]])
+        full = replay_cache.CachedReplay(unmorphed)
+
+        with_horizon = SAP.game_contexts_from_replay(horizon, minutes)
+        for minute in minutes:
+            expected = comparable(baseline_context(full, minute))
+            assert comparable(with_horizon[minute]) == expected, (seed, minute)
+            assert comparable(SAP.game_contexts_from_replay(full, [minute])[minute]) == expected, (seed, minute)
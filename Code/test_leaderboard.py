@@ -0,0 +1,66 @@
+import json
+import os
+import subprocess
+import sys
+
+import leaderboard
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def dwp_payload(correct):
+    # One prediction per checkpoint minute; the first `correct` of them are right.
+    return {"predictions": [{"time_min": m, "is_correct": i < correct} for i, m in enumerate(leaderboard.DWP_MINUTES)]}
+
+
+def test_results_are_written_once_per_flush(tmp_path, monkeypatch):
+    live = str(tmp_path / "leaderboard.json")
+    monkeypatch.setattr(leaderboard, "LIVE_PATH", live)
+    monkeypatch.setattr(leaderboard, "_pending", [])
+    writes = []
+    write = leaderboard.write
+    monkeypatch.setattr(leaderboard, "write", lambda aggregator, path: writes.append(path) or write(aggregator, path))
+
+    for i in range(20):
+        leaderboard.record("DWP", "m", f"r{i}.SC2Replay", dwp_payload(i % 6))
+    leaderboard.record("ICD", "m", "r0.SC2Replay", {})   # no leaderboard columns
+    assert writes == [] and not os.path.exists(live)
+
+    leaderboard.flush()
+    leaderboard.flush()   # nothing new
+    assert writes == [live]
+    with open(live, encoding="utf-8") as f:
+        board = json.load(f)
+    assert board["coverage"] == {"DWP": {"m": 20}}
+    assert board["models"]["m"]["DWP_Acc"] == round(100 * sum(i % 6 for i in range(20)) / 100, 3)
+
+
+def test_a_rerun_replaces_its_earlier_result(tmp_path, monkeypatch):
+    live = str(tmp_path / "leaderboard.json")
+    monkeypatch.setattr(leaderboard, "LIVE_PATH", live)
+    monkeypatch.setattr(leaderboard, "_pending", [])
+    leaderboard.record("DWP", "m", "r0", dwp_payload(5))
+    leaderboard.flush()
+    leaderboard.record("DWP", "m", "r0", dwp_payload(0))
+    leaderboard.flush()
+    with open(live, encoding="utf-8") as f:
+        board = json.load(f)
+    assert board["coverage"] == {"DWP": {"m": 1}} and board["models"]["m"]["DWP_Acc"] == 0.0
+
+
+RUN = """
+import sys, leaderboard
+for i in range(int(sys.argv[2])):
+    leaderboard.record("DWP", sys.argv[1], f"r{i}", {"predictions": [{"time_min": 2, "is_correct": True}]})
+"""
+
+
+def test_concurrent_runs_merge_their_results(tmp_path):
+    # Each process records its results and flushes at exit; none may overwrite another's.
+    env = dict(os.environ, SC2_LEADERBOARD=str(tmp_path / "leaderboard.json"), PYTHONPATH=HERE)
+    runs = [subprocess.Popen([sys.executable, "-c", RUN, f"model{i}", "30"], env=env) for i in range(6)]
+    assert [run.wait(timeout=120) for run in runs] == [0] * 6
+    with open(tmp_path / "leaderboard.json", encoding="utf-8") as f:
+        board = json.load(f)
+    assert board["coverage"]["DWP"] == {f"model{i}": 30 for i in range(6)}
+    assert not os.path.exists(str(tmp_path / "leaderboard.json.lock"))
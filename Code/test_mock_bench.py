@@ -0,0 +1,16 @@
+import json
+
+import mock_bench
+
+
+def test_every_task_writes_parseable_results(tmp_path):
+    report = mock_bench.run_bench(mock_bench.TASKS, tmp_path, count=2, task_args=["--workers", "1"])
+
+    for task in mock_bench.TASKS:
+        paths = mock_bench.result_files(task, str(tmp_path))
+        assert len(paths) == 2, task
+        assert report[task]["results"] == 2 and report[task]["requests"] > 0, task
+        for path in paths:
+            with open(path, encoding="utf-8") as f:
+                payload = json.load(f)
+            assert payload, path
@@ -0,0 +1,45 @@
+import pytest
+
+import replay_cache
+import synthetic_replay
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    # An empty cache, and a decoder that stands in for sc2reader and counts its calls.
+    monkeypatch.setattr(replay_cache, "CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(replay_cache, "CACHE_ENABLED", True)
+    decoded = []
+
+    def decode(replay_path, profile=replay_cache.DEFAULT_PROFILE, horizon_frame=None):
+        decoded.append(profile)
+        return f"live {profile}"
+
+    monkeypatch.setattr(replay_cache, "decode_replay", decode)
+    replay_path = tmp_path / "game.SC2Replay"
+    replay_path.write_bytes(b"not a real replay")
+    return str(replay_path), decoded
+
+
+def test_full_profile_is_always_decoded_live(cache):
+    replay_path, decoded = cache
+    assert replay_cache.load_replay(replay_path, profile="full") == "live full"
+    assert replay_cache.load_replay(replay_path, profile="full") == "live full"
+    assert decoded == ["full", "full"]
+    assert replay_cache.list_entries() == []
+
+
+def test_default_profile_is_cached():
+    assert replay_cache.DEFAULT_PROFILE in replay_cache.PROFILE_ORDER
+    assert "full" not in replay_cache.PROFILE_ORDER
+
+
+def test_richer_entry_serves_leaner_profiles_only(cache, tmp_path):
+    replay_path, decoded = cache
+    [synthetic] = synthetic_replay.write_corpus(str(tmp_path / "replays"), 1, minutes=3, units_per_player=40)
+
+    for profile in replay_cache.PROFILE_ORDER:
+        replay = replay_cache.load_replay(synthetic, profile=profile)
+        assert isinstance(replay, replay_cache.CachedReplay) and replay.profile == "units"
+    assert replay_cache.load_replay(synthetic, profile="full") == "live full"
+    assert decoded == ["full"]
@@ -0,0 +1,51 @@
+import json
+import os
+
+import SAP
+import leaderboard
+import results_store
+
+
+def result_log(gt, responses):
+    timepoint = {"time_min": 2.0, "status": "Success", "ground_truth": [SAP.normalize_action(a) for a in gt],
+                 "extracted_data": {"ground_truth": gt}, "prompt": "prompt", "samples": []}
+    hits, samples = SAP.finish_timepoint(timepoint, responses)
+    return {"experiment_meta": {"model_name": "m", "replay_file": "r.SC2Replay", "timestamp": "2026-01-01 00:00:00"},
+            "timepoints_results": [timepoint, {"time_min": 4.0, "status": "Skipped"}],
+            "global_summary": SAP.global_summary(hits, samples)}
+
+
+def test_stats_follow_ground_truth_order():
+    gt = ["starport", "None", "barracks", "armory", "factory", "barracks"]
+    preds = [["barracks", "barracks", "factory", "bunker"], ["barracks", "starport"], ["barracks"], []]
+    stats = SAP.calculate_advanced_stats(gt, preds)
+    assert list(stats["action_hit_details"].items()) == [("starport", 1), ("barracks", 3), ("armory", 0), ("factory", 1)]
+    assert stats["high_confidence_hits"] == ["barracks"]
+    assert stats["low_confidence_hits"] == ["starport", "factory"]
+    assert stats["missed_actions"] == ["armory"]
+    assert (stats["total_predictions_made"], stats["total_correct_predictions"]) == (6, 5)
+
+
+def test_rescore_rewrites_only_stale_files(tmp_path, monkeypatch):
+    recorded = []
+    monkeypatch.setattr(results_store, "record", lambda task, model, replay, payload, source=None: recorded.append(source))
+    monkeypatch.setattr(leaderboard, "LIVE_PATH", "")
+    responses = ['{"predictions": ["Barracks", "Factory"], "analysis": "a"}',
+                 'noise ```{"predictions": ["Armory"]}```', RuntimeError("timeout")]
+    current = result_log(["Barracks", "Armory", "Starport"], responses)
+
+    stale = json.loads(json.dumps(current))
+    stale["timepoints_results"][0]["samples"][0]["predictions"] = ["Barracks", "Factory"]   # before normalization
+    stale["timepoints_results"][0]["advanced_analysis"]["total_correct_predictions"] = 0
+    paths = {}
+    for name, payload in (("current", current), ("stale", stale)):
+        paths[name] = str(tmp_path / f"m_{name}.json")
+        with open(paths[name], "w", encoding="utf-8") as f:
+            json.dump(payload, f, indent=4, ensure_ascii=False)
+    untouched = os.stat(paths["current"]).st_mtime_ns
+
+    SAP.rescore_results(str(tmp_path))
+    assert recorded == [paths["stale"]]
+    assert os.stat(paths["current"]).st_mtime_ns == untouched
+    with open(paths["current"], encoding="utf-8") as a, open(paths["stale"], encoding="utf-8") as b:
+        assert a.read() == b.read()
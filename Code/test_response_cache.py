@@ -0,0 +1,92 @@
+from types import SimpleNamespace
+
+import pytest
+
+import response_cache
+
+
+class StubClient:
+    # Stands in for an OpenAI client: every request returns fresh, numbered answers.
+    def __init__(self):
+        self.requests = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, temperature, n=1, **kwargs):
+        self.requests.append({"model": model, "messages": messages, "temperature": temperature, "n": n, **kwargs})
+        choices = [SimpleNamespace(message=SimpleNamespace(content=f"answer {len(self.requests)}.{i}")) for i in range(n)]
+        return SimpleNamespace(choices=choices)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        self.now += 1
+        return self.now
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(response_cache, "CACHE_PATH", str(tmp_path / "responses.sqlite"))
+    monkeypatch.setattr(response_cache, "CACHE_MODE", "readwrite")
+    monkeypatch.setattr(response_cache, "_conn", None)
+    monkeypatch.setattr(response_cache, "_conn_pid", None)
+    monkeypatch.setattr(response_cache, "time", Clock())
+    yield StubClient()
+    if response_cache._conn is not None:
+        response_cache._conn.close()
+
+
+def test_key_depends_on_every_request_field():
+    base = dict(model_id="m", temperature=0.7, system_prompt="sys", user_prompt="user", sample=0)
+    key = response_cache.cache_key(**base)
+    assert response_cache.cache_key(**base) == key
+    for field, value in [("model_id", "m2"), ("temperature", 0.0), ("system_prompt", "sys2"),
+                         ("user_prompt", "user2"), ("sample", 1)]:
+        assert response_cache.cache_key(**dict(base, **{field: value})) != key, field
+    assert response_cache.cache_key(**base, max_tokens=10) != key
+    assert response_cache.cache_key(**base, max_tokens=10, top_p=1) == response_cache.cache_key(**base, top_p=1, max_tokens=10)
+
+
+def test_samples_of_one_prompt_do_not_collide(cache):
+    first = [response_cache.chat_completion(cache, "m", "sys", "user", 0.7, sample=i) for i in range(3)]
+    assert first == ["answer 1.0", "answer 2.0", "answer 3.0"]
+    again = [response_cache.chat_completion(cache, "m", "sys", "user", 0.7, sample=i) for i in range(3)]
+    assert again == first and len(cache.requests) == 3
+
+
+def test_n_requests_share_sample_slots(cache):
+    assert response_cache.chat_completion(cache, "m", "sys", "user", 0.7, sample=1) == "answer 1.0"
+    contents = response_cache.chat_completions(cache, "m", "sys", "user", 0.7, 3)
+    # Only samples 0 and 2 were missing, so one request for two choices fills them in order.
+    assert contents == ["answer 2.0", "answer 1.0", "answer 2.1"]
+    assert cache.requests[-1]["n"] == 2
+
+
+def test_eviction_keeps_the_most_recently_used(cache):
+    keys = [response_cache.cache_key("m", 0.7, "sys", f"prompt {i}") for i in range(5)]
+    for i, key in enumerate(keys):
+        response_cache.store(key, "m", 0.7, "x" * 100)
+    assert response_cache.lookup(keys[0]) == "x" * 100     # touched last, so newest
+    assert response_cache.evict(300) == 2
+    assert [response_cache.lookup(key) is not None for key in keys] == [True, False, False, True, True]
+    assert response_cache.cache_size() == (3, 300)
+
+
+def test_readonly_mode_serves_hits_and_never_calls_the_api(cache, monkeypatch):
+    cached = response_cache.chat_completion(cache, "m", "sys", "user", 0.7)
+    monkeypatch.setattr(response_cache, "CACHE_MODE", "readonly")
+    assert response_cache.chat_completion(cache, "m", "sys", "user", 0.7) == cached
+    with pytest.raises(response_cache.ResponseCacheMiss):
+        response_cache.chat_completion(cache, "m", "sys", "other", 0.7)
+    assert len(cache.requests) == 1
+
+
+def test_off_mode_bypasses_the_cache(cache, monkeypatch):
+    cached = response_cache.chat_completion(cache, "m", "sys", "user", 0.7)
+    monkeypatch.setattr(response_cache, "CACHE_MODE", "off")
+    assert response_cache.chat_completion(cache, "m", "sys", "user", 0.7) != cached
+    assert response_cache.chat_completion(cache, "m", "sys", "new", 0.7) == "answer 3.0"
+    monkeypatch.setattr(response_cache, "CACHE_MODE", "readwrite")
+    assert response_cache.cache_size()[0] == 1
@@ -0,0 +1,155 @@
+import glob
+import json
+import os
+import random
+
+import pytest
+
+import DWE
+import SAP
+import leaderboard
+import llm_clients
+import replay_cache
+import response_cache
+import result_log
+import results_store
+import synthetic_replay
+
+MODEL = {"name": "stub", "api_key": "stub", "base_url": "", "model_id": "stub", "temperature": 0.7}
+
+
+def test_torn_last_line_is_dropped_and_truncated(tmp_path):
+    output_path = str(tmp_path / "result.json")
+    with result_log.ResultLog(output_path) as log:
+        log.append([1, 0, "a"], "first")
+        log.append([1, 1, "a"], "second")
+    with open(result_log.wal_path(output_path), "a", encoding="utf-8") as f:
+        f.write('{"key": [1, 2, "a"], "val')
+
+    with result_log.ResultLog(output_path) as log:
+        assert len(log) == 2 and log.get([1, 1, "a"]) == "second" and log.get([1, 2, "a"]) is None
+        log.append([1, 2, "a"], "third")
+    # The next append starts on a clean line, so nothing logged before or after the tear is lost.
+    assert [r["value"] for r in result_log.read_records(result_log.wal_path(output_path))] == ["first", "second", "third"]
+
+
+def test_fill_logs_answers_but_not_errors(tmp_path):
+    output_path = str(tmp_path / "result.json")
+    keys = [[5, i, "p"] for i in range(4)]
+    with result_log.ResultLog(output_path) as log:
+        log.append(keys[0], "logged")
+        values, missing = log.split(keys)
+        assert values == ["logged", None, None, None] and missing == [1, 2, 3]
+        error = RuntimeError("timeout")
+        filled = log.fill(keys, values, missing, [None, "answer", error, "other"])
+        assert filled == ["logged", "answer", error, "other"]
+
+    with result_log.ResultLog(output_path) as log:
+        assert log.split(keys) == (["logged", "answer", None, "other"], [2])
+
+
+def test_finish_deletes_the_log(tmp_path):
+    output_path = str(tmp_path / "result.json")
+    log = result_log.ResultLog(output_path)
+    log.append([0], "value")
+    assert os.path.exists(log.path)
+    log.finish()
+    assert not os.path.exists(log.path)
+    log.finish()   # nothing left to delete
+
+
+class Crash(BaseException):
+    # Raised from inside a request to stop the run the way a kill would: nothing after it runs.
+    pass
+
+
+@pytest.fixture
+def stub_api(tmp_path, monkeypatch):
+    # Deterministic answers per (prompt, sample); every request is recorded, and the run can be
+    # made to crash at the n-th request.
+    state = {"sent": [], "crash_at": None}
+
+    def chat_completion(client, model_id, system_prompt, user_prompt, temperature, sample=0, **kwargs):
+        if state["crash_at"] is not None and len(state["sent"]) + 1 >= state["crash_at"]:
+            raise Crash()
+        state["sent"].append((user_prompt, sample))
+        rng = random.Random(f"{user_prompt}|{sample}")
+        if "[T=" in user_prompt:
+            return json.dumps([round(rng.random(), 3) for _ in range(user_prompt.count("[T="))])
+        return json.dumps({"predictions": rng.sample(["Marine", "Barracks", "Factory", "Stalker"], 2), "analysis": ""})
+
+    async def chat_completion_async(*args, **kwargs):
+        return chat_completion(*args, **kwargs)
+
+    monkeypatch.setattr(response_cache, "chat_completion", chat_completion)
+    monkeypatch.setattr(response_cache, "chat_completion_async", chat_completion_async)
+    monkeypatch.setattr(llm_clients, "get_client", lambda config: None)
+    monkeypatch.setattr(llm_clients, "get_async_client", lambda config: None)
+    monkeypatch.setattr(replay_cache, "load_replay",
+                        lambda replay_path, profile=None, horizon_frame=None: synthetic_replay.make_replay(seed=3))
+    monkeypatch.setattr(results_store, "STORE_PATH", "")
+    monkeypatch.setattr(leaderboard, "LIVE_PATH", "")
+    (tmp_path / "game.SC2Replay").write_bytes(b"stands in for a replay")
+    return state
+
+
+def run_until(state, crash_at, run):
+    state.update(sent=[], crash_at=crash_at)
+    try:
+        run()
+    except Crash:
+        pass
+    return state["sent"]
+
+
+def result_payload(folder):
+    [output_path] = glob.glob(os.path.join(folder, "*.json"))
+    with open(output_path, encoding="utf-8") as f:
+        payload = json.load(f)
+    if isinstance(payload, dict):
+        payload["experiment_meta"].pop("timestamp")
+    return payload
+
+
+def assert_resume_matches(tmp_path, state, run, crash_at):
+    run_until(state, None, lambda: run(str(tmp_path / "clean")))
+    clean = state["sent"]
+
+    resumed_folder = str(tmp_path / "resumed")
+    before = run_until(state, crash_at, lambda: run(resumed_folder))
+    assert len(before) == crash_at - 1 and glob.glob(os.path.join(resumed_folder, "*.json")) == []
+    [wal] = glob.glob(os.path.join(resumed_folder, "*" + result_log.WAL_SUFFIX))
+    logged = len(result_log.read_records(wal))
+    assert logged > 0
+    after = run_until(state, None, lambda: run(resumed_folder))
+
+    # Every logged request is answered from the log; only what was in flight at the kill is sent again.
+    assert len(after) == len(clean) - logged
+    assert sorted(after) == sorted(set(after)) and set(after) <= set(clean)
+    assert result_payload(resumed_folder) == result_payload(str(tmp_path / "clean"))
+    assert glob.glob(os.path.join(resumed_folder, "*" + result_log.WAL_SUFFIX)) == []
+
+
+@pytest.mark.parametrize("async_sampling", [False, True])
+def test_killed_sap_run_resumes_without_resending(tmp_path, stub_api, monkeypatch, async_sampling):
+    monkeypatch.setattr(SAP, "ASYNC_SAMPLING", async_sampling)
+    monkeypatch.setattr(SAP, "MODELS_CONFIG", [MODEL])
+
+    def run(folder):
+        os.makedirs(folder, exist_ok=True)
+        monkeypatch.setattr(SAP, "OUTPUT_FOLDER", folder)
+        SAP.run_single_experiment(str(tmp_path / "game.SC2Replay"), MODEL)
+
+    assert_resume_matches(tmp_path, stub_api, run, crash_at=12)
+
+
+def test_killed_dwe_run_resumes_without_resending(tmp_path, stub_api, monkeypatch):
+    monkeypatch.setattr(DWE, "MODELS_CONFIG", [MODEL])
+    replay_path = str(tmp_path / "game.SC2Replay")
+    parsed = DWE.extract_replay_data(replay_path)
+
+    def run(folder):
+        os.makedirs(folder, exist_ok=True)
+        DWE.run_replay_models(replay_path, parsed, folder)
+
+    assert_resume_matches(tmp_path, stub_api, run, crash_at=2)
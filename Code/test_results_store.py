@@ -0,0 +1,43 @@
+import sqlite3
+
+import results_store
+
+
+def dwe_payload(times, padded_every):
+    return [{"game_time_seconds": t, "player1_id": 1, "model_used": "m",
+             "p1_win_rate": 0.5 if i % padded_every == 0 else 0.8, "padded": i % padded_every == 0}
+            for i, t in enumerate(times)]
+
+
+def test_store_from_before_padded_is_migrated(tmp_path):
+    # dwe_predictions as first released, with a row recorded before padding existed.
+    path = str(tmp_path / "old.sqlite")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE dwe_predictions (task TEXT, model TEXT, replay TEXT, game_time_seconds INTEGER, "
+                 "player1_id INTEGER, p1_win_rate REAL, PRIMARY KEY (task, model, replay, game_time_seconds))")
+    conn.execute("INSERT INTO dwe_predictions VALUES ('DWE', 'old', 'r0', 10, 1, 0.9)")
+    conn.commit()
+    conn.close()
+
+    conn = results_store.connect(path)
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(dwe_predictions)")]
+    assert columns[-1] == "padded" and len(columns) == results_store.TABLE_COLUMNS["dwe_predictions"]
+    assert conn.execute("SELECT padded FROM dwe_predictions WHERE model = 'old'").fetchone() == (0,)
+
+    results_store.write_experiments(conn, [("DWE", "m", "r1", dwe_payload(range(0, 60, 10), 3), None)])
+    conn.close()
+    conn = results_store.connect(path)   # reconnecting must not add the column again
+    assert conn.execute("SELECT COUNT(*), SUM(padded) FROM dwe_predictions WHERE model = 'm'").fetchone() == (6, 2)
+
+    board = {row["model"]: row for row in results_store.leaderboard("DWE", conn)}
+    assert board["old"]["predictions"] == 1
+    assert board["m"]["predictions"] == 4 and board["m"]["mean_p1_win_rate"] == 0.8
+    conn.close()
+
+
+def test_fully_padded_model_has_no_dwe_leaderboard_row(tmp_path):
+    conn = results_store.connect(str(tmp_path / "new.sqlite"))
+    results_store.write_experiments(conn, [("DWE", "m", "r1", dwe_payload(range(3), 1), None)])
+    assert conn.execute("SELECT COUNT(*) FROM dwe_predictions").fetchone() == (3,)
+    assert results_store.leaderboard("DWE", conn) == []
+    conn.close()
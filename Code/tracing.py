@@ -0,0 +1,169 @@
+import argparse
+import atexit
+import contextvars
+import glob
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Set SC2COG_TRACE=run_trace.json to record pipeline spans (decode, extract, prompt, llm, parse,
+# write). Every process appends to its own "<path>.<pid>.part" file; the process that started the
+# run merges the parts into one Chrome trace-event file at exit, ready for Perfetto or chrome://tracing.
+TRACE_PATH = os.environ.get("SC2COG_TRACE", "")
+ENABLED = bool(TRACE_PATH)
+ROOT_ENV = "SC2COG_TRACE_ROOT_PID"
+
+_tags = contextvars.ContextVar("trace_tags", default={})
+_lock = threading.Lock()
+_part = None
+_part_pid = None
+_async_ids = itertools.count(1)
+
+
+def _part_paths(path):
+    return sorted(glob.glob(glob.escape(path) + ".*.part"))
+
+
+def _emit(event):
+    global _part, _part_pid
+    with _lock:
+        pid = os.getpid()
+        if _part is None or _part_pid != pid:
+            _part = open(f"{TRACE_PATH}.{pid}.part", "a", encoding="utf-8")
+            _part_pid = pid
+            role = "main" if str(pid) == os.environ.get(ROOT_ENV) else "worker"
+            _part.write(json.dumps({"name": "process_name", "ph": "M", "pid": pid, "args": {"name": f"{role} {pid}"}}) + "\n")
+        # Flushed per span because pool workers exit without running atexit handlers.
+        _part.write(json.dumps(event, default=str) + "\n")
+        _part.flush()
+
+
+@contextmanager
+def tags(**values):
+    # Tags (replay, model, timepoint, ...) set here are attached to every span opened inside,
+    # including spans in asyncio tasks created within the block.
+    token = _tags.set({**_tags.get(), **values})
+    try:
+        yield
+    finally:
+        _tags.reset(token)
+
+
+@contextmanager
+def span(name, cat="stage", **args):
+    # Yields the span's args dict so callers can add results (e.g. a cache hit) before it closes.
+    if not ENABLED:
+        yield {}
+        return
+    args = {**_tags.get(), **args}
+    start = time.time_ns() // 1000
+    t0 = time.perf_counter()
+    try:
+        yield args
+    except BaseException as e:
+        args["error"] = type(e).__name__
+        raise
+    finally:
+        _emit({"name": name, "cat": cat, "ph": "X", "ts": start, "dur": int((time.perf_counter() - t0) * 1e6),
+               "pid": os.getpid(), "tid": threading.get_ident(), "args": args})
+
+
+@contextmanager
+def async_span(name, cat="stage", **args):
+    # Overlapping coroutines on one thread cannot be drawn as nested "X" slices, so they are
+    # recorded as async begin/end pairs, one row per request in the trace viewer.
+    if not ENABLED:
+        yield {}
+        return
+    args = {**_tags.get(), **args}
+    span_id = next(_async_ids)
+    base = {"name": name, "cat": cat, "id": f"{os.getpid()}-{span_id}", "pid": os.getpid(), "tid": threading.get_ident()}
+    _emit({**base, "ph": "b", "ts": time.time_ns() // 1000, "args": args})
+    try:
+        yield args
+    except BaseException as e:
+        args["error"] = type(e).__name__
+        raise
+    finally:
+        _emit({**base, "ph": "e", "ts": time.time_ns() // 1000, "args": args})
+
+
+def merge(path=TRACE_PATH):
+    events = []
+    for part in _part_paths(path):
+        with open(part, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    events.append(json.loads(line))
+        os.remove(part)
+    if not events:
+        return []
+    events.sort(key=lambda e: e.get("ts", 0))
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    os.replace(tmp_path, path)
+    return events
+
+
+def stage_totals(events):
+    totals = {}
+    opened = {}
+    for event in events:
+        if event.get("ph") == "X":
+            totals[event["name"]] = totals.get(event["name"], 0) + event["dur"]
+        elif event.get("ph") == "b":
+            opened[event["id"]] = event["ts"]
+        elif event.get("ph") == "e" and event["id"] in opened:
+            totals[event["name"]] = totals.get(event["name"], 0) + event["ts"] - opened.pop(event["id"])
+    return totals
+
+
+def print_stage_totals(events):
+    for name, total in sorted(stage_totals(events).items(), key=lambda item: -item[1]):
+        print(f"[Trace] {name}: {total / 1e6:.2f}s")
+
+
+def _finish():
+    global _part
+    with _lock:
+        if _part is not None:
+            _part.close()
+            _part = None
+    events = merge(TRACE_PATH)
+    if events:
+        print(f"[Trace] {len(events)} events written to {TRACE_PATH}")
+        print_stage_totals(events)
+
+
+if ENABLED and ROOT_ENV not in os.environ:
+    # First process of the run: drop stale parts from an earlier run and merge everything at exit.
+    # Children inherit the variable and only write their parts.
+    os.environ[ROOT_ENV] = str(os.getpid())
+    for stale in _part_paths(TRACE_PATH):
+        os.remove(stale)
+    atexit.register(_finish)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge or summarize pipeline traces.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_merge = sub.add_parser("merge", help="Merge leftover per-process parts (e.g. after a crash)")
+    p_merge.add_argument("path")
+    p_summary = sub.add_parser("summary", help="Print total time per stage of a merged trace")
+    p_summary.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "merge":
+        events = merge(args.path)
+        print(f"Merged {len(events)} events into {args.path}")
+    elif args.command == "summary":
+        with open(args.path, encoding="utf-8") as f:
+            print_stage_totals(json.load(f)["traceEvents"])
+
+
+if __name__ == "__main__":
+    main()